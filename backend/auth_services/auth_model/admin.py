@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import User
+from .models import User, RevokedToken
 
 # Register your models here.
-admin.site.register(User)
\ No newline at end of file
+admin.site.register(User)
+admin.site.register(RevokedToken)
\ No newline at end of file
@@ -0,0 +1,245 @@
+"""
+Caches behind JWTAuthentication, so verifying a token does not query the
+database.
+
+Principals, the user a token belongs to, are cached per user_id in Redis
+for AUTH_PRINCIPAL_CACHE_TTL seconds and in each worker for
+AUTH_PRINCIPAL_LOCAL_TTL seconds. Saving or deleting a user drops both
+tiers once the transaction commits and bumps the user's version; other
+workers' local copies expire within the local TTL. A principal read from
+the database is only written back if the version is still the one seen
+before the read, so a request that loaded the user before a save cannot
+cache the old row after the invalidation.
+
+Revoked jtis are written to Redis until their token expires. The Redis
+copy is only trusted while REVOKED_LOADED_KEY exists. That marker is set
+when the copy is loaded from the database and expires after
+AUTH_REVOCATIONS_RELOAD_INTERVAL seconds. Without it (before the first
+load, after Redis lost its data, or once the interval is up) checks go
+to the database while the revocations are reloaded, so a revocation
+whose write to Redis failed is picked up by the next reload. Until then
+the process that revoked the token remembers it itself.
+
+Any Redis error falls back to the database, and Redis is left alone for
+a few seconds so an outage does not add a timeout to every request.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+import redis
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import RevokedToken, User
+from .redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_KEY_PREFIX = 'auth:principal:'
+PRINCIPAL_VERSION_KEY_PREFIX = 'auth:principal_version:'
+REVOKED_KEY_PREFIX = 'auth:revoked:'
+REVOKED_LOADED_KEY = 'auth:revoked:loaded'
+REVOKED_LOAD_LOCK_KEY = 'auth:revoked:loading'
+REDIS_RETRY_AFTER = 5
+
+# Everything authentication and the views read from request.user. Other
+# fields, the password hash included, are deferred on cached principals.
+PRINCIPAL_FIELDS = (
+    'unique_id', 'username', 'email', 'phone_number', 'first_name', 'last_name',
+    'is_active', 'is_staff', 'is_superuser',
+)
+_principal_attnames = [field.attname for field in User._meta.concrete_fields if field.attname in PRINCIPAL_FIELDS]
+
+# KEYS: version, principal; ARGV: version seen before the database read
+# ('' for none), TTL, principal. Returns 1 if the principal was cached.
+STORE_PRINCIPAL_SCRIPT = """
+if (redis.call('GET', KEYS[1]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('SETEX', KEYS[2], ARGV[2], ARGV[3])
+return 1
+"""
+
+
+class LocalTTLCache:
+    """Bounded, thread-safe in-process LRU cache with a per-entry expiry."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float) -> None:
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+local_principals = LocalTTLCache(settings.AUTH_PRINCIPAL_LOCAL_SIZE)
+# Revocations this process could not write to Redis: {jti: expiry timestamp}
+_unsynced_revocations = {}
+_unsynced_lock = threading.Lock()
+
+_redis_retry_at = 0.0
+
+
+def _redis_available() -> bool:
+    return time.monotonic() >= _redis_retry_at
+
+def _redis_failed(action: str, error: Exception) -> None:
+    global _redis_retry_at
+    _redis_retry_at = time.monotonic() + REDIS_RETRY_AFTER
+    logger.warning(f"Redis error while {action}, using the database: {error}")
+
+
+def _serialize_principal(user) -> dict:
+    data = {attname: getattr(user, attname) for attname in _principal_attnames}
+    data['unique_id'] = str(data['unique_id'])
+    return data
+
+def _build_principal(data: dict):
+    # from_db leaves the fields that are not cached deferred, so they load
+    # on access and saving the instance cannot overwrite them
+    return User.from_db(DEFAULT_DB_ALIAS, _principal_attnames, [data[attname] for attname in _principal_attnames])
+
+def get_principal(user_id) -> Optional[User]:
+    """
+    Return the user with `user_id` from the local cache, Redis or, on a
+    miss, the database. None if the user does not exist.
+    """
+    key = str(user_id)
+    data = local_principals.get(key)
+    if data is not None:
+        return _build_principal(data)
+
+    version = None
+    if _redis_available():
+        try:
+            cached, version = redis_client.mget(PRINCIPAL_KEY_PREFIX + key, PRINCIPAL_VERSION_KEY_PREFIX + key)
+            if cached:
+                data = json.loads(cached)
+                local_principals.set(key, data, settings.AUTH_PRINCIPAL_LOCAL_TTL)
+                return _build_principal(data)
+            version = version or ''
+        except redis.exceptions.RedisError as e:
+            _redis_failed("reading a principal", e)
+
+    user = User.objects.filter(unique_id=user_id).only(*PRINCIPAL_FIELDS).first()
+    if user is None:
+        return None
+    data = _serialize_principal(user)
+    if version is None:
+        # Without Redis the local tier alone bounds staleness
+        local_principals.set(key, data, settings.AUTH_PRINCIPAL_LOCAL_TTL)
+        return user
+    try:
+        stored = redis_client.eval(
+            STORE_PRINCIPAL_SCRIPT, 2, PRINCIPAL_VERSION_KEY_PREFIX + key, PRINCIPAL_KEY_PREFIX + key,
+            version, settings.AUTH_PRINCIPAL_CACHE_TTL, json.dumps(data)
+        )
+    except redis.exceptions.RedisError as e:
+        _redis_failed("caching a principal", e)
+        stored = False
+    # Not stored means the user changed since the read; keep no copy
+    if stored:
+        local_principals.set(key, data, settings.AUTH_PRINCIPAL_LOCAL_TTL)
+    return user
+
+def invalidate_principal(user_id) -> None:
+    key = str(user_id)
+    local_principals.delete(key)
+    try:
+        with redis_client.pipeline(transaction=False) as pipe:
+            # Bump the version first, so a read in flight cannot store the old row
+            pipe.incr(PRINCIPAL_VERSION_KEY_PREFIX + key)
+            # Outlives any principal cached under an older version
+            pipe.expire(PRINCIPAL_VERSION_KEY_PREFIX + key, settings.AUTH_PRINCIPAL_CACHE_TTL * 2)
+            pipe.delete(PRINCIPAL_KEY_PREFIX + key)
+            pipe.execute()
+    except redis.exceptions.RedisError as e:
+        # The Redis copy expires on its own within AUTH_PRINCIPAL_CACHE_TTL
+        logger.error(f"Could not drop the cached principal of {key}: {e}")
+
+
+def is_token_revoked(jti: str) -> bool:
+    if jti in _unsynced_revocations:
+        return True
+    if _redis_available():
+        try:
+            with redis_client.pipeline(transaction=False) as pipe:
+                pipe.exists(REVOKED_LOADED_KEY)
+                pipe.exists(REVOKED_KEY_PREFIX + jti)
+                loaded, revoked = pipe.execute()
+            if loaded:
+                return bool(revoked)
+            load_revoked_tokens()
+        except redis.exceptions.RedisError as e:
+            _redis_failed("checking a revocation", e)
+    return RevokedToken.objects.filter(jti=jti).exists()
+
+def mark_token_revoked(jti: str, expires_at: datetime) -> None:
+    ttl = int((expires_at - datetime.now(tz=timezone.utc)).total_seconds())
+    if ttl <= 0:
+        return
+    try:
+        redis_client.setex(REVOKED_KEY_PREFIX + jti, ttl, 1)
+    except redis.exceptions.RedisError as e:
+        logger.error(f"Could not cache the revocation of {jti}: {e}")
+        now = time.time()
+        with _unsynced_lock:
+            for expired in [key for key, expiry in _unsynced_revocations.items() if expiry <= now]:
+                del _unsynced_revocations[expired]
+            _unsynced_revocations[jti] = now + ttl
+        try:
+            # Send every process back to the database until the next load
+            redis_client.delete(REVOKED_LOADED_KEY)
+        except redis.exceptions.RedisError:
+            # The marker's expiry bounds how long other processes miss it
+            pass
+
+def load_revoked_tokens() -> int:
+    """
+    Copy every unexpired revocation to Redis and mark the copy complete.
+    Only one worker loads at a time; the others keep using the database.
+
+    Returns:
+        int: Number of revocations loaded, 0 if another worker is loading
+    """
+    if not redis_client.set(REVOKED_LOAD_LOCK_KEY, 1, nx=True, ex=30):
+        return 0
+    now = datetime.now(tz=timezone.utc)
+    loaded = 0
+    with redis_client.pipeline(transaction=False) as pipe:
+        for jti, expires_at in RevokedToken.objects.filter(expires_at__gt=now).values_list('jti', 'expires_at').iterator():
+            pipe.setex(REVOKED_KEY_PREFIX + jti, max(int((expires_at - now).total_seconds()), 1), 1)
+            loaded += 1
+        pipe.set(REVOKED_LOADED_KEY, int(now.timestamp()), ex=settings.AUTH_REVOCATIONS_RELOAD_INTERVAL)
+        pipe.delete(REVOKED_LOAD_LOCK_KEY)
+        pipe.execute()
+    return loaded
@@ -1,33 +1,30 @@
 import jwt
-from django.conf import settings
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
-from django.contrib.auth import get_user_model
 from uuid import UUID
-
-User = get_user_model()
+from .auth_cache import get_principal, is_token_revoked
+from .utlis import get_request_claims
 
 class JWTAuthentication(BaseAuthentication):
+    """
+    Authenticate a bearer JWT. The token is decoded by get_request_claims,
+    at most once per request, and revocations and the user are read
+    through auth_cache, so a warm request does not touch the database.
+    """
     def authenticate(self, request):
-        auth_header = request.headers.get('Authorization')
-
-        if not auth_header or not auth_header.startswith('Bearer '):
-            print('No token was provided')
-            raise AuthenticationFailed('Invalid token')
-         # No token provided
-
-        token = auth_header.split(' ')[1]
-
         try:
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+            payload = get_request_claims(request)
+            if payload is None:
+                raise AuthenticationFailed('Invalid token')
+            jti = payload.get("jti")
+            if jti and is_token_revoked(jti):
+                raise AuthenticationFailed('Token has been revoked')
             user_id = payload.get("user_id")
             try:
                 user_uuid = UUID(user_id)
-            except ValueError:
+            except (TypeError, ValueError):
                 raise AuthenticationFailed('Invalid user ID format')
-            # Retrieve user from the database
-            user = User.objects.filter(unique_id=user_uuid).first()
-            print(user)
+            user = get_principal(user_uuid)
             if not user:
                 raise AuthenticationFailed('User not found')
             return (user, None)  # Authenticated user
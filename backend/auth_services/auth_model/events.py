@@ -0,0 +1,28 @@
+"""
+User events published to a Redis stream for other services to consume.
+
+Publishing is best effort: a Redis outage is logged and never fails the
+request that changed the user. Consumers reconcile from the bulk user
+endpoints to recover from missed events.
+"""
+
+import logging
+
+import redis
+from django.conf import settings
+
+from .redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+
+def publish_user_event(event_type, user, **fields):
+    try:
+        redis_client.xadd(
+            settings.USER_EVENTS_STREAM,
+            {'type': event_type, 'user_id': str(user.unique_id), **fields},
+            maxlen=settings.USER_EVENTS_MAXLEN,
+            approximate=True
+        )
+    except redis.exceptions.RedisError as e:
+        logger.error(f"Could not publish {event_type} for {user.unique_id}: {e}")
@@ -0,0 +1,72 @@
+import time
+
+import jwt
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from auth_model.authentication import JWTAuthentication
+from auth_model.middleware import JWTAuthenticationMiddleware
+from auth_model.models import User
+from auth_model.utlis import _CLAIMS_ATTR, generate_jwt
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the per-request cost of authentication: one JWT decode, "
+        "JWTAuthentication as configured, and JWTAuthenticationMiddleware "
+        "in front of it, once sharing its decoded claims and once with the "
+        "claims dropped in between, so JWTAuthentication verifies the token "
+        "again as it did before they were shared. Runs in-process against a "
+        "token for an existing user, so caches are warm after the first "
+        "request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', help='User to authenticate as (default: any user)')
+        parser.add_argument('--iterations', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['user_id']:
+            users = users.filter(unique_id=options['user_id'])
+        user = users.first()
+        if user is None:
+            raise CommandError("No user to authenticate as; register one first")
+
+        token = generate_jwt(user.unique_id)
+        factory = RequestFactory()
+        middleware = JWTAuthenticationMiddleware(lambda request: request)
+        authentication = JWTAuthentication()
+
+        def decode():
+            jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+
+        def new_request():
+            return factory.get('/auth/verify/', HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        def authenticate():
+            authentication.authenticate(Request(new_request()))
+
+        def with_middleware():
+            authentication.authenticate(Request(middleware(new_request())))
+
+        def with_middleware_unshared():
+            request = middleware(new_request())
+            delattr(request, _CLAIMS_ATTR)
+            authentication.authenticate(Request(request))
+
+        self.stdout.write(f"{'path':<32}{'us/request':>12}")
+        for name, operation in (
+            ('jwt.decode', decode),
+            ('authentication', authenticate),
+            ('middleware + authentication', with_middleware),
+            ('same, claims not shared', with_middleware_unshared),
+        ):
+            operation()  # warm the caches
+            started = time.perf_counter()
+            for _ in range(options['iterations']):
+                operation()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{name:<32}{elapsed / options['iterations'] * 1e6:>12.1f}")
@@ -0,0 +1,59 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from auth_model.auth_cache import invalidate_principal
+from auth_model.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Lowercase stored emails. Run it before migrating to the unique "
+        "index on User.email. When several users share an email once "
+        "lowercased, the one already stored lowercased, or else the "
+        "earliest to register, keeps it; the others are "
+        "reported and left unchanged."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rows = list(User.objects.exclude(email__isnull=True).order_by('date_joined').values_list('unique_id', 'email'))
+
+        users_by_email = defaultdict(list)
+        for unique_id, email in rows:
+            users_by_email[User.normalize_email_address(email)].append((unique_id, email))
+
+        updates = {}
+        conflicts = 0
+        for normalized, users in users_by_email.items():
+            # A user already stored lowercased keeps the email, else the earliest
+            users.sort(key=lambda user: user[1] != normalized)
+            if len(users) > 1:
+                # Blank emails become NULL, which any number of users may share
+                if normalized is not None:
+                    owner = users[0][0]
+                    for unique_id, email in users[1:]:
+                        self.stderr.write(f"{unique_id}: {email!r} is already used by {owner}")
+                        conflicts += 1
+                    users = users[:1]
+            for unique_id, email in users:
+                if email != normalized:
+                    updates[unique_id] = normalized
+
+        if not options['dry_run']:
+            user_ids = list(updates)
+            for start in range(0, len(user_ids), options['batch_size']):
+                batch = [User(unique_id=unique_id, email=updates[unique_id])
+                         for unique_id in user_ids[start:start + options['batch_size']]]
+                User.objects.bulk_update(batch, ['email'])
+                # bulk_update skips save() and its signals
+                for user in batch:
+                    invalidate_principal(user.unique_id)
+
+        verb = 'Would normalize' if options['dry_run'] else 'Normalized'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {len(updates)} of {len(rows)} emails; {conflicts} conflicting"
+        ))
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+
+from auth_model.auth_cache import invalidate_principal
+from auth_model.models import User
+from auth_model.phone import InvalidPhoneNumber, normalize_phone_number
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrite stored phone numbers in E.164. Run it before migrating to "
+        "the unique index on User.phone_number. When several users share a "
+        "number once normalized, the one already stored in E.164, or else "
+        "the earliest to register, keeps it; the others are reported and "
+        "left unchanged, as are numbers that cannot be parsed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rows = list(
+            User.objects.exclude(phone_number__isnull=True)
+            .order_by('date_joined')
+            .values_list('unique_id', 'phone_number')
+        )
+
+        updates = {}
+        invalid = []
+        conflicts = []
+        owners = {}
+        # Numbers already in E.164 keep them, whoever registered first
+        for unique_id, phone_number in rows:
+            if phone_number.startswith('+'):
+                owners.setdefault(phone_number, unique_id)
+        for unique_id, phone_number in rows:
+            if phone_number == '':
+                updates[unique_id] = None
+                continue
+            try:
+                normalized = normalize_phone_number(phone_number)
+            except InvalidPhoneNumber:
+                invalid.append((unique_id, phone_number))
+                continue
+            owner = owners.setdefault(normalized, unique_id)
+            if owner != unique_id:
+                conflicts.append((unique_id, phone_number, owner))
+            elif normalized != phone_number:
+                updates[unique_id] = normalized
+
+        for unique_id, phone_number in invalid:
+            self.stderr.write(f"{unique_id}: cannot parse {phone_number!r}")
+        for unique_id, phone_number, owner in conflicts:
+            self.stderr.write(f"{unique_id}: {phone_number!r} is already used by {owner}")
+
+        if not options['dry_run']:
+            user_ids = list(updates)
+            for start in range(0, len(user_ids), options['batch_size']):
+                batch = [User(unique_id=unique_id, phone_number=updates[unique_id])
+                         for unique_id in user_ids[start:start + options['batch_size']]]
+                User.objects.bulk_update(batch, ['phone_number'])
+                # bulk_update skips save() and its signals
+                for user in batch:
+                    invalidate_principal(user.unique_id)
+
+        verb = 'Would normalize' if options['dry_run'] else 'Normalized'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {len(updates)} of {len(rows)} phone numbers; "
+            f"{len(invalid)} invalid, {len(conflicts)} conflicting"
+        ))
@@ -1,22 +1,25 @@
-from django.http import JsonResponse
-from rest_framework.authentication import get_authorization_header
-from .utlis import verify_jwt  # Import the verify_jwt function
-from rest_framework.authentication import BaseAuthentication
+import jwt
+
+from .utlis import get_request_claims
+
 
 class JWTAuthenticationMiddleware:
+    """
+    Decode the bearer token once, up front, and attach its user_id to the
+    request (None without a valid token). Requests are not rejected here:
+    views opt in through their permission classes, and JWTAuthentication
+    reuses the decoded claims instead of verifying the token again.
+
+    Not enabled in settings: it decodes for every request, AllowAny views
+    included, and no view reads request.user_id.
+    """
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        auth_header = get_authorization_header(request).split()
-        if len(auth_header) == 2:
-            token = auth_header[1].decode("utf-8")
-            user_id = verify_jwt(token)
-            if user_id:
-                request.user_id = user_id  # Attach user_id to request
-            else:
-                return JsonResponse({"error": "Unauthorized"}, status=401)
-        else:
-            return JsonResponse({"error": "Missing or invalid token"}, status=401)
-
+        try:
+            claims = get_request_claims(request)
+        except jwt.InvalidTokenError:
+            claims = None
+        request.user_id = claims.get('user_id') if claims else None
         return self.get_response(request)
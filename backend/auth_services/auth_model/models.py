@@ -3,13 +3,54 @@ import uuid
 from django.db import models
 from django.contrib.auth.hashers import make_password, check_password
 from django.contrib.auth.models import AbstractUser
+from .phone import InvalidPhoneNumber, normalize_phone_number
 # Create your models here.
 class User(AbstractUser):
     unique_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    phone_number = models.CharField(max_length=15, blank=True, null=True, help_text="Phone number for MPESA payments")
+    # E.164, see auth_model/phone.py; run normalize_phone_numbers before
+    # migrating existing data to the unique index
+    phone_number = models.CharField(max_length=16, unique=True, blank=True, null=True, help_text="Phone number for MPESA payments")
+    # Stored lowercased, so the unique index is case-insensitive and is the
+    # login lookup; run normalize_emails before migrating existing data
+    email = models.EmailField(unique=True, blank=True, null=True)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored username so saves can tell when it changed
+        instance._loaded_username = instance.__dict__.get('username')
+        return instance
+
+    @staticmethod
+    def normalize_email_address(email):
+        """The form emails are stored and looked up in."""
+        return email.strip().lower() if email else None
+
+    def save(self, *args, **kwargs):
+        self.email = self.normalize_email_address(self.email)
+        if self.phone_number:
+            try:
+                self.phone_number = normalize_phone_number(self.phone_number)
+            except InvalidPhoneNumber:
+                # Left as entered; views reject invalid numbers before saving
+                pass
+        else:
+            # NULL rather than '', which the unique index would allow only once
+            self.phone_number = None
+        super().save(*args, **kwargs)
+
     def set_password(self, raw_password):
         self.password = make_password(raw_password)
 
     def check_password(self, raw_password):
-        return check_password(raw_password, self.password)
\ No newline at end of file
+        return check_password(raw_password, self.password)
+
+class RevokedToken(models.Model):
+    """A JWT that was revoked before it expired, identified by its jti claim."""
+    jti = models.CharField(max_length=64, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='revoked_tokens')
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.jti} ({self.user_id})"
@@ -0,0 +1,13 @@
+import hmac
+
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+
+class IsInternalService(BasePermission):
+    """Allow requests carrying the shared INTERNAL_SERVICE_KEY in X-Service-Key."""
+
+    def has_permission(self, request, view):
+        expected = settings.INTERNAL_SERVICE_KEY
+        provided = request.headers.get('X-Service-Key', '')
+        return bool(expected) and hmac.compare_digest(provided.encode(), expected.encode())
@@ -0,0 +1,37 @@
+"""
+Phone numbers are stored in E.164 (+254712345678), whatever format they
+were entered in, so a number has exactly one spelling and lookups can use
+the unique index on User.phone_number. Numbers without a country code are
+read as PHONE_DEFAULT_REGION numbers.
+"""
+
+import phonenumbers
+from django.conf import settings
+
+
+class InvalidPhoneNumber(ValueError):
+    """Raised for input that is not a valid phone number."""
+
+
+def normalize_phone_number(raw, region=None) -> str:
+    """
+    Return `raw` in E.164, e.g. '0712 345 678', '254712345678' and
+    '+254712345678' all become '+254712345678'.
+
+    Raises:
+        InvalidPhoneNumber: If `raw` cannot be parsed or is not a valid number
+    """
+    raw = str(raw).strip()
+    # M-Pesa and most clients send the country code without the plus
+    if raw.isdigit() and not raw.startswith('0'):
+        candidates = ('+' + raw, raw)
+    else:
+        candidates = (raw,)
+    for candidate in candidates:
+        try:
+            number = phonenumbers.parse(candidate, region or settings.PHONE_DEFAULT_REGION)
+        except phonenumbers.NumberParseException:
+            continue
+        if phonenumbers.is_valid_number(number):
+            return phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
+    raise InvalidPhoneNumber(f"Invalid phone number: {raw}")
@@ -0,0 +1,12 @@
+import redis
+from django.conf import settings
+
+# Shared by user events and the authentication caches
+redis_client = redis.StrictRedis(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    db=settings.REDIS_DB,
+    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+    decode_responses=True
+)
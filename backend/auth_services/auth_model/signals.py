@@ -0,0 +1,33 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .auth_cache import invalidate_principal, mark_token_revoked
+from .events import publish_user_event
+from .models import RevokedToken, User
+
+
+@receiver(post_save, sender=User)
+def publish_username_change(sender, instance, created, **kwargs):
+    username = instance.username
+    if created or username == getattr(instance, '_loaded_username', None):
+        return
+    instance._loaded_username = username
+    # Only announce the change once it is committed
+    transaction.on_commit(
+        lambda: publish_user_event('username_changed', instance, username=username)
+    )
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_principal(sender, instance, **kwargs):
+    user_id = instance.unique_id
+    transaction.on_commit(lambda: invalidate_principal(user_id))
+
+
+@receiver(post_save, sender=RevokedToken)
+def cache_revocation(sender, instance, created, **kwargs):
+    if created:
+        jti, expires_at = instance.jti, instance.expires_at
+        transaction.on_commit(lambda: mark_token_revoked(jti, expires_at))
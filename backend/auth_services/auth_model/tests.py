@@ -1,3 +1,191 @@
-from django.test import TestCase
+import io
+from unittest import mock
 
-# Create your tests here.
+import jwt
+import redis
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from . import auth_cache, utlis
+from .models import User
+from .utlis import generate_jwt
+
+
+class JWTAuthenticationCacheTests(TestCase):
+    def setUp(self):
+        self.user = User(username='alice', email='alice@example.com')
+        self.user.set_password('secret')
+        self.user.save()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {generate_jwt(self.user.unique_id)}")
+
+        patcher = mock.patch.object(auth_cache, 'local_principals', auth_cache.LocalTTLCache(100))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(auth_cache, '_redis_retry_at', 0.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(auth_cache, 'redis_client')
+        self.redis = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.redis.mget.return_value = [None, None]
+        self.redis.eval.return_value = 1
+        pipe = self.redis.pipeline.return_value.__enter__.return_value
+        # Revocations loaded, token not revoked
+        pipe.execute.return_value = [1, 0]
+
+    def test_warm_verify_does_not_query_the_database(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse('verify')).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('verify'))
+        self.assertEqual(response.data['username'], 'alice')
+
+    def test_saving_the_user_drops_the_cached_principal(self):
+        self.client.get(reverse('verify'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.get(pk=self.user.pk).save()
+        pipe = self.redis.pipeline.return_value.__enter__.return_value
+        pipe.incr.assert_called_with(f"auth:principal_version:{self.user.unique_id}")
+        pipe.delete.assert_called_with(f"auth:principal:{self.user.unique_id}")
+        User.objects.filter(pk=self.user.pk).update(username='alice2')
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.get(pk=self.user.pk).save()
+
+        self.assertEqual(self.client.get(reverse('verify')).data['username'], 'alice2')
+
+    def test_principal_read_before_a_save_is_not_cached(self):
+        self.redis.mget.return_value = [None, '3']
+        # The version moved on while the user was being read
+        self.redis.eval.return_value = 0
+
+        with self.assertNumQueries(1):
+            self.client.get(reverse('verify'))
+        self.assertEqual(self.redis.eval.call_args.args[2:5], (
+            f"auth:principal_version:{self.user.unique_id}", f"auth:principal:{self.user.unique_id}", '3'
+        ))
+        with self.assertNumQueries(1):
+            self.client.get(reverse('verify'))
+
+    def test_revocation_is_checked_in_the_database_without_redis(self):
+        self.redis.pipeline.side_effect = redis.exceptions.ConnectionError
+
+        self.assertEqual(self.client.post(reverse('logout')).status_code, 200)
+
+        response = self.client.get(reverse('verify'))
+        self.assertEqual(str(response.data['detail']), 'Token has been revoked')
+
+    def test_failed_revocation_write_is_not_trusted_away(self):
+        self.redis.setex.side_effect = redis.exceptions.TimeoutError
+        self.redis.delete.side_effect = redis.exceptions.TimeoutError
+
+        with mock.patch.object(auth_cache, '_unsynced_revocations', {}):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.client.post(reverse('logout')).status_code, 200)
+
+            # Redis is back and says the revocations are loaded, without this one
+            response = self.client.get(reverse('verify'))
+        self.assertEqual(str(response.data['detail']), 'Token has been revoked')
+
+    def test_loaded_marker_expires(self):
+        self.redis.set.return_value = True
+        pipe = self.redis.pipeline.return_value.__enter__.return_value
+
+        auth_cache.load_revoked_tokens()
+
+        pipe.set.assert_called_once_with(auth_cache.REVOKED_LOADED_KEY, mock.ANY, ex=60)
+
+    def test_token_is_decoded_once_per_request(self):
+        with mock.patch.object(utlis.jwt, 'decode', wraps=jwt.decode) as decode:
+            response = self.client.get(reverse('verify'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(decode.call_count, 1)
+
+    def test_login_does_not_decode_the_token(self):
+        with mock.patch.object(utlis.jwt, 'decode', wraps=jwt.decode) as decode:
+            response = self.client.post(reverse('login'), {'email': 'alice@example.com', 'password': 'secret'})
+
+        self.assertEqual(response.status_code, 200)
+        decode.assert_not_called()
+
+
+@override_settings(INTERNAL_SERVICE_KEY='service-key')
+class PhoneNumberTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def register(self, email, phone_number):
+        return self.client.post(reverse('create-room'), {
+            'username': email.split('@')[0],
+            'email': email,
+            'password': 'secret',
+            'phone_number': phone_number
+        })
+
+    def test_registration_stores_e164(self):
+        self.assertEqual(self.register('alice@example.com', '0712 345 678').status_code, 201)
+        self.assertEqual(User.objects.get(email='alice@example.com').phone_number, '+254712345678')
+
+        response = self.register('bob@example.com', '254712345678')
+        self.assertEqual(response.data, {'error': 'Phone number already exists'})
+        self.assertEqual(self.register('carol@example.com', '12').data, {'error': 'Invalid phone number'})
+
+    def test_lookup_accepts_any_format(self):
+        self.register('alice@example.com', '+254712345678')
+
+        response = self.client.get(reverse('user-by-phone'), {'phone_number': '0712345678'})
+        self.assertEqual(response.data['username'], 'alice')
+
+        response = self.client.post(
+            reverse('internal-users-by-phone'),
+            {'phone_numbers': ['254712345678', '0712345678', '0799999999', 'nonsense']},
+            format='json',
+            HTTP_X_SERVICE_KEY='service-key'
+        )
+        self.assertEqual(set(response.data['users']), {'254712345678', '0712345678'})
+
+    def test_backfill_keeps_the_first_owner_of_a_number(self):
+        User.objects.bulk_create([
+            User(username='a', email='a@example.com', phone_number='0712345678'),
+            User(username='b', email='b@example.com', phone_number='254712345678'),
+            User(username='c', email='c@example.com', phone_number='0722000000'),
+        ])
+
+        with mock.patch('auth_model.management.commands.normalize_phone_numbers.invalidate_principal'):
+            call_command('normalize_phone_numbers', stdout=io.StringIO(), stderr=io.StringIO())
+
+        phones = dict(User.objects.values_list('username', 'phone_number'))
+        self.assertEqual(phones, {'a': '+254712345678', 'b': '254712345678', 'c': '+254722000000'})
+
+
+class EmailTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def register(self, email, username='alice'):
+        return self.client.post(reverse('create-room'), {'username': username, 'email': email, 'password': 'secret'})
+
+    def test_email_is_case_insensitive(self):
+        self.assertEqual(self.register('Alice@Example.com').status_code, 201)
+
+        response = self.client.post(reverse('login'), {'email': ' alice@EXAMPLE.com', 'password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.register('ALICE@example.com', 'alice2').data, {'error': 'Email already exists'})
+        self.assertEqual(self.register('bob@example.com').data, {'error': 'Username already exists'})
+
+    def test_backfill_lowercases_emails(self):
+        User.objects.bulk_create([
+            User(username='a', email='Alice@Example.com'),
+            User(username='b', email='alice@example.com'),
+            User(username='c', email='Carol@Example.com'),
+        ])
+
+        with mock.patch('auth_model.management.commands.normalize_emails.invalidate_principal'):
+            call_command('normalize_emails', stdout=io.StringIO(), stderr=io.StringIO())
+
+        emails = dict(User.objects.values_list('username', 'email'))
+        self.assertEqual(emails, {'a': 'Alice@Example.com', 'b': 'alice@example.com', 'c': 'carol@example.com'})
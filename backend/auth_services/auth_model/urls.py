@@ -1,11 +1,17 @@
 from django.urls import path
-from .views import RegisterView, LoginView, TestJWT, VerifyUser, UserInfo, UserByPhoneView
+from .views import RegisterView, LoginView, LogoutView, RevocationListView, TestJWT, VerifyUser, UserInfo, BulkUserInfo, InternalBulkUserInfo, InternalUserContacts, InternalUsersByPhone, UserByPhoneView
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='create-room'),
     path('login/', LoginView.as_view(), name='login'),
+    path('logout/', LogoutView.as_view(), name='logout'),
+    path('revoked/', RevocationListView.as_view(), name='revoked'),
     path('test/', TestJWT.as_view(), name='test'),
     path('verify/', VerifyUser.as_view(), name='verify'),
     path('info/', UserInfo.as_view(), name='info'),
+    path('info/bulk/', BulkUserInfo.as_view(), name='info-bulk'),
+    path('internal/users/bulk/', InternalBulkUserInfo.as_view(), name='internal-users-bulk'),
+    path('internal/users/contacts/', InternalUserContacts.as_view(), name='internal-users-contacts'),
+    path('internal/users/by-phone/', InternalUsersByPhone.as_view(), name='internal-users-by-phone'),
     path('user-by-phone/', UserByPhoneView.as_view(), name='user-by-phone')
 ]  
\ No newline at end of file
@@ -1,5 +1,6 @@
 import jwt
 import datetime
+import uuid
 from django.conf import settings
 
 SECRET_KEY = settings.SECRET_KEY
@@ -9,7 +10,8 @@ def generate_jwt(user_id):
     payload = {
         "user_id": str(user_id),
         "exp": datetime.datetime.utcnow() + datetime.timedelta(days=1),
-        "iat": datetime.datetime.utcnow()
+        "iat": datetime.datetime.utcnow(),
+        "jti": uuid.uuid4().hex
     }
     return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
 def verify_jwt(token):
@@ -20,3 +22,35 @@ def verify_jwt(token):
         return None
     except jwt.InvalidTokenError:
         return None
+
+
+_CLAIMS_ATTR = '_jwt_claims'
+
+def get_request_claims(request):
+    """
+    Decode the request's bearer token once and keep the result on the
+    request, so JWTAuthenticationMiddleware, JWTAuthentication and views
+    share a single signature check.
+
+    Returns:
+        dict: The token's claims, or None if there is no bearer token
+
+    Raises:
+        jwt.InvalidTokenError: If the token is invalid or expired, every time
+    """
+    # DRF's Request only proxies reads, so store on the HttpRequest itself
+    request = getattr(request, '_request', request)
+    if not hasattr(request, _CLAIMS_ATTR):
+        auth_header = request.headers.get('Authorization', '')
+        if not auth_header.startswith('Bearer '):
+            claims = None
+        else:
+            try:
+                claims = jwt.decode(auth_header.split(' ')[1], SECRET_KEY, algorithms=["HS256"])
+            except jwt.InvalidTokenError as e:
+                claims = e
+        setattr(request, _CLAIMS_ATTR, claims)
+    claims = getattr(request, _CLAIMS_ATTR)
+    if isinstance(claims, jwt.InvalidTokenError):
+        raise claims
+    return claims
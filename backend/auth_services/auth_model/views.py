@@ -1,10 +1,15 @@
 from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .models import User
-from .utlis import generate_jwt, verify_jwt
+from .models import User, RevokedToken
+from .utlis import generate_jwt, get_request_claims
+from .permissions import IsInternalService
+from .phone import InvalidPhoneNumber, normalize_phone_number
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework import status
+from django.db import IntegrityError, transaction
+from uuid import UUID
+from datetime import datetime, timezone
 
 class RegisterView(APIView):
     permission_classes = [AllowAny]
@@ -15,12 +20,29 @@ class RegisterView(APIView):
         password = request.data.get("password")
         phone_number = request.data.get("phone_number")
 
-        if User.objects.filter(email=email).exists():
-            return Response({"error": "Email already exists"}, status=400)
+        if phone_number:
+            try:
+                phone_number = normalize_phone_number(phone_number)
+            except InvalidPhoneNumber:
+                return Response({"error": "Invalid phone number"}, status=400)
+
+        email = User.normalize_email_address(email)
+        if not email:
+            return Response({"error": "Email is required"}, status=400)
 
         user = User(email=email, username=username, phone_number=phone_number)
         user.set_password(password)
-        user.save()
+        try:
+            with transaction.atomic():
+                user.save()
+        except IntegrityError:
+            # The unique indexes reject duplicates, concurrent sign-ups
+            # included; only a failed sign-up pays to find out which
+            if User.objects.filter(email=email).exists():
+                return Response({"error": "Email already exists"}, status=400)
+            if phone_number and User.objects.filter(phone_number=phone_number).exists():
+                return Response({"error": "Phone number already exists"}, status=400)
+            return Response({"error": "Username already exists"}, status=400)
 
         return Response({"message": "User registered successfully",
                          "user_id": user.unique_id}, status=201)
@@ -29,15 +51,49 @@ class LoginView(APIView):
     permission_classes = [AllowAny]
     authentication_classes = []
     def post(self, request):
-        email = request.data.get("email")
+        email = User.normalize_email_address(request.data.get("email"))
         password = request.data.get("password")
 
-        user = User.objects.filter(email=email).first()
+        user = User.objects.filter(email=email).first() if email else None
         if not user or not user.check_password(password):
             return Response({"error": "Invalid credentials"}, status=401)
         token = generate_jwt(user.unique_id)
         return Response({"token": token})
     
+class LogoutView(APIView):
+    """
+    Revoke the bearer token used for this request so it can no longer be
+    used, even by services that verify tokens locally.
+    """
+    permission_classes = [IsAuthenticated]
+    def post(self, request):
+        payload = get_request_claims(request)
+        jti = payload.get('jti')
+        if not jti:
+            return Response({'error': 'Token cannot be revoked'}, status=status.HTTP_400_BAD_REQUEST)
+        RevokedToken.objects.get_or_create(
+            jti=jti,
+            defaults={
+                'user': request.user,
+                'expires_at': datetime.fromtimestamp(payload['exp'], tz=timezone.utc)
+            }
+        )
+        return Response({'message': 'Logged out successfully'}, status=status.HTTP_200_OK)
+
+class RevocationListView(APIView):
+    """
+    Publish the jti of every revoked token that has not expired yet.
+    Services verifying JWTs locally poll this to honour revocations.
+    """
+    permission_classes = [AllowAny]  # For internal service communication
+    authentication_classes = []
+    def get(self, request):
+        now = datetime.now(tz=timezone.utc)
+        revoked = RevokedToken.objects.filter(expires_at__gt=now).values_list('jti', flat=True)
+        return Response({'revoked': list(revoked),
+                         'generated_at': int(now.timestamp())},
+                        status=status.HTTP_200_OK)
+
 class TestJWT(APIView):
     permission_classes = [IsAuthenticated]
     def get(self, request):
@@ -60,6 +116,57 @@ class UserInfo(APIView):
          else:
              return Response({'message': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
+class BulkUserInfo(APIView):
+    """
+    Resolve usernames for many users in a single query.
+    Expects {"user_ids": [...]} and returns {"users": {user_id: username}}.
+    Unknown ids are simply left out of the response.
+    """
+    permission_classes = [IsAuthenticated]
+    max_user_ids = 500
+
+    def post(self, request):
+        user_ids = request.data.get('user_ids')
+        if not isinstance(user_ids, list):
+            return Response({'error': 'user_ids must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(user_ids) > self.max_user_ids:
+            return Response({'error': f'At most {self.max_user_ids} user_ids are allowed'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        uuids = set()
+        for user_id in user_ids:
+            try:
+                uuids.add(UUID(str(user_id)))
+            except ValueError:
+                continue
+
+        users = User.objects.filter(unique_id__in=uuids)
+        return Response({'users': self.serialize_users(users)}, status=status.HTTP_200_OK)
+
+    def serialize_users(self, users):
+        return {str(unique_id): username for unique_id, username in users.values_list('unique_id', 'username')}
+
+class InternalBulkUserInfo(BulkUserInfo):
+    """
+    BulkUserInfo for other services' background jobs, which have no user
+    token and authenticate with the shared service key instead.
+    """
+    permission_classes = [IsInternalService]
+    authentication_classes = []
+
+class InternalUserContacts(BulkUserInfo):
+    """
+    Username and M-Pesa phone number of many users, for other services'
+    billing jobs. Same request as BulkUserInfo; returns
+    {"users": {user_id: {"username": ..., "phone_number": ...}}}.
+    """
+    permission_classes = [IsInternalService]
+    authentication_classes = []
+
+    def serialize_users(self, users):
+        return {str(unique_id): {'username': username, 'phone_number': phone_number}
+                for unique_id, username, phone_number in users.values_list('unique_id', 'username', 'phone_number')}
+
 class UserByPhoneView(APIView):
     permission_classes = [AllowAny]  # For internal service communication
     authentication_classes = []
@@ -68,8 +175,46 @@ class UserByPhoneView(APIView):
         if not phone_number:
             return Response({'error': 'Phone number is required'}, status=status.HTTP_400_BAD_REQUEST)
         
+        try:
+            phone_number = normalize_phone_number(phone_number)
+        except InvalidPhoneNumber:
+            return Response({'error': 'Invalid phone number'}, status=status.HTTP_400_BAD_REQUEST)
+
         user = User.objects.filter(phone_number=phone_number).first()
         if user:
             return Response({'user_id': str(user.unique_id), 'username': user.username}, status=status.HTTP_200_OK)
         else:
-            return Response({'message': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            return Response({'message': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+class InternalUsersByPhone(APIView):
+    """
+    Map many phone numbers to users in one indexed query, e.g. M-Pesa
+    payers during reconciliation. Expects {"phone_numbers": [...]} in any
+    format and returns {"users": {phone_number: {"user_id", "username"}}}
+    keyed by the numbers as sent. Invalid and unknown numbers are left out.
+    """
+    permission_classes = [IsInternalService]
+    authentication_classes = []
+    max_phone_numbers = 500
+
+    def post(self, request):
+        phone_numbers = request.data.get('phone_numbers')
+        if not isinstance(phone_numbers, list):
+            return Response({'error': 'phone_numbers must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(phone_numbers) > self.max_phone_numbers:
+            return Response({'error': f'At most {self.max_phone_numbers} phone_numbers are allowed'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        requested = {}
+        for phone_number in phone_numbers:
+            try:
+                requested.setdefault(normalize_phone_number(phone_number), []).append(phone_number)
+            except InvalidPhoneNumber:
+                continue
+
+        users = {}
+        found = User.objects.filter(phone_number__in=requested).values_list('phone_number', 'unique_id', 'username')
+        for normalized, unique_id, username in found:
+            for phone_number in requested[normalized]:
+                users[str(phone_number)] = {'user_id': str(unique_id), 'username': username}
+        return Response({'users': users}, status=status.HTTP_200_OK)
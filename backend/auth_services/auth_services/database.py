@@ -0,0 +1,104 @@
+"""
+Database configuration read from the environment.
+
+DB_ENGINE selects the backend:
+
+- 'sqlite' (default): BASE_DIR/db.sqlite3, or DB_NAME. DB_SQLITE_PROFILE=
+  performance opts in to WAL journaling, synchronous=NORMAL, a busy
+  timeout, memory-mapped I/O and a larger page cache, for single-node
+  installs with concurrent readers and writers (DB_SQLITE_BUSY_TIMEOUT,
+  DB_SQLITE_MMAP_SIZE and DB_SQLITE_CACHE_SIZE tune it).
+- 'postgres': DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT and DB_SSLMODE.
+  Connections persist for DB_CONN_MAX_AGE seconds and are health-checked
+  before reuse. Setting DB_POOL_MAX_SIZE switches to psycopg's connection
+  pool instead (DB_POOL_MIN_SIZE, DB_POOL_TIMEOUT).
+
+Tests run against whichever backend is configured, so
+`DB_ENGINE=postgres DB_NAME=... python manage.py test` runs the suite on a
+local Postgres. The test database is named DB_TEST_NAME when that is set.
+"""
+
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from django.core.exceptions import ImproperlyConfigured
+
+
+SQLITE_PROFILES = ('default', 'performance')
+
+
+def sqlite_settings(name: str, profile: Optional[str] = None) -> Dict[str, Any]:
+    """SQLite settings for the database file `name`, using DB_SQLITE_PROFILE unless `profile` is given."""
+    profile = profile or os.getenv('DB_SQLITE_PROFILE', 'default')
+    if profile not in SQLITE_PROFILES:
+        raise ImproperlyConfigured(f"Unsupported DB_SQLITE_PROFILE {profile!r}; use one of {SQLITE_PROFILES}")
+    config = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+    }
+    if profile == 'performance':
+        pragmas = [
+            # Readers no longer block the writer, and commits only fsync at checkpoints
+            'PRAGMA journal_mode=WAL',
+            'PRAGMA synchronous=NORMAL',
+            f"PRAGMA mmap_size={int(os.getenv('DB_SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))}",
+            # Negative values are in KiB
+            f"PRAGMA cache_size=-{int(os.getenv('DB_SQLITE_CACHE_SIZE', '65536'))}",
+            'PRAGMA temp_store=MEMORY',
+        ]
+        config['OPTIONS'] = {
+            'init_command': ';'.join(pragmas),
+            # Seconds to wait for a lock before raising "database is locked"
+            'timeout': float(os.getenv('DB_SQLITE_BUSY_TIMEOUT', '5')),
+            # Take the write lock at BEGIN so concurrent writers queue on the
+            # busy timeout instead of failing to upgrade a read lock
+            'transaction_mode': 'IMMEDIATE',
+        }
+    return config
+
+
+def _postgres_settings(prefix: str, default_name: str) -> Dict[str, Any]:
+    def env(key, default=None):
+        return os.getenv(f"{prefix}{key}", default)
+
+    config = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': env('NAME', default_name),
+        'USER': env('USER', 'postgres'),
+        'PASSWORD': env('PASSWORD', ''),
+        'HOST': env('HOST', 'localhost'),
+        'PORT': env('PORT', '5432'),
+        'OPTIONS': {},
+    }
+    sslmode = env('SSLMODE')
+    if sslmode:
+        config['OPTIONS']['sslmode'] = sslmode
+
+    pool_max_size = int(os.getenv('DB_POOL_MAX_SIZE', '0'))
+    if pool_max_size:
+        # Django's pool support requires non-persistent connections
+        config['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': pool_max_size,
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        }
+        config['CONN_MAX_AGE'] = 0
+    else:
+        config['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+        config['CONN_HEALTH_CHECKS'] = True
+    return config
+
+
+def database_settings(base_dir: Path, default_name: str) -> Dict[str, Dict[str, Any]]:
+    """Build DATABASES for the service whose Postgres database defaults to `default_name`."""
+    engine = os.getenv('DB_ENGINE', 'sqlite').lower()
+    if engine == 'sqlite':
+        return {'default': sqlite_settings(os.getenv('DB_NAME', str(base_dir / 'db.sqlite3')))}
+    if engine not in ('postgres', 'postgresql'):
+        raise ImproperlyConfigured(f"Unsupported DB_ENGINE {engine!r}; use 'sqlite' or 'postgres'")
+
+    default = _postgres_settings('DB_', default_name)
+    if os.getenv('DB_TEST_NAME'):
+        default['TEST'] = {'NAME': os.getenv('DB_TEST_NAME')}
+    return {'default': default}
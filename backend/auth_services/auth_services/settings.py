@@ -10,12 +10,14 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 from supertokens_python import init, InputAppInfo, SupertokensConfig
 from supertokens_python.recipe import emailpassword, session
 from supertokens_python import get_all_cors_headers
 from typing import List
 from auth_services.config import supertokens_config, app_info, recipe_list
+from auth_services.database import database_settings
 from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -50,6 +52,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Off: nothing reads request.user_id, and it would verify the token on
+    # every request, login and registration included. JWTAuthentication
+    # decodes only for views that authenticate.
     #'auth_model.middleware.JWTAuthenticationMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -87,12 +92,8 @@ AUTH_USER_MODEL = 'auth_model.User'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# Configured from DB_* environment variables, see auth_services/database.py
+DATABASES = database_settings(BASE_DIR, default_name='auth_services')
 
 
 # Password validation
@@ -167,3 +168,30 @@ CORS_ALLOWED_ORIGINS = [
 CORS_ALLOW_HEADERS: List[str] = list(default_headers) + [
     "Content-Type"
 ] + get_all_cors_headers()
+
+#REDIS SETTINGS
+# Used to publish user events (see auth_model/events.py) that other
+# services consume to keep their copies of user data current
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+REDIS_DB = int(os.getenv("REDIS_DB", "0"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5"))
+USER_EVENTS_STREAM = os.getenv("USER_EVENTS_STREAM", "auth:user_events")
+USER_EVENTS_MAXLEN = int(os.getenv("USER_EVENTS_MAXLEN", "100000"))
+
+# Authenticated principals are cached per user in Redis and, for a few
+# seconds, in each worker (see auth_model/auth_cache.py). Saving a user
+# drops both; other workers' local copies expire within the local TTL.
+AUTH_PRINCIPAL_CACHE_TTL = int(os.getenv("AUTH_PRINCIPAL_CACHE_TTL", "300"))
+AUTH_PRINCIPAL_LOCAL_TTL = float(os.getenv("AUTH_PRINCIPAL_LOCAL_TTL", "5"))
+AUTH_PRINCIPAL_LOCAL_SIZE = int(os.getenv("AUTH_PRINCIPAL_LOCAL_SIZE", "10000"))
+# Revoked jtis are mirrored to Redis and reloaded from the database at
+# least this often (seconds), which bounds how long a failed write goes unseen
+AUTH_REVOCATIONS_RELOAD_INTERVAL = int(os.getenv("AUTH_REVOCATIONS_RELOAD_INTERVAL", "60"))
+
+# Region assumed for phone numbers entered without a country code
+PHONE_DEFAULT_REGION = os.getenv("PHONE_DEFAULT_REGION", "KE")
+
+# Shared secret other services send in X-Service-Key to call internal
+# endpoints without a user token; internal endpoints are disabled when empty
+INTERNAL_SERVICE_KEY = os.getenv("INTERNAL_SERVICE_KEY", "")
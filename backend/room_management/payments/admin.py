@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Transaction, PaymentIntent
+from .models import Transaction, PaymentIntent, CallbackOutbox
 # Register your models here.
 admin.site.register(Transaction)
-admin.site.register(PaymentIntent)
\ No newline at end of file
+admin.site.register(PaymentIntent)
+admin.site.register(CallbackOutbox)
\ No newline at end of file
@@ -0,0 +1,179 @@
+"""
+Bulk billing: STK pushes to every member of a room who has not paid yet.
+
+Pushes go out concurrently from a bounded thread pool, paced by a shared
+rate limiter so a large billing run stays within Daraja's rate limits.
+Member phone numbers come from auth_services in bulk, and the resulting
+payment intents are saved with one bulk_create.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+import redis
+import requests
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from room.models import RoomMember
+from room.utils import fetch_user_contacts
+from room_management.redis_client import get_redis_client
+from .daraja import DarajaError, daraja
+from .models import PaymentIntent
+from .utils import set_payment_intents
+
+logger = logging.getLogger(__name__)
+
+redis_client = get_redis_client()
+
+CONTACTS_BATCH_SIZE = 500
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` acquisitions per second, shared by threads."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(self._next, now) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+@contextmanager
+def room_charge_lock(room_id):
+    """
+    Yield whether this process may charge the room, i.e. no other charge
+    of it is running. Without Redis the charge goes ahead; the payment
+    intent check in charge_rooms still stops repeated pushes.
+    """
+    key = f"billing:charging:{room_id}"
+    try:
+        acquired = redis_client.set(key, 1, nx=True, ex=settings.MPESA_CHARGE_COOLDOWN)
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"Charging room {room_id} without the lock: {e}")
+        yield True
+        return
+    if not acquired:
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        try:
+            redis_client.delete(key)
+        except redis.exceptions.RedisError:
+            # Expires on its own
+            pass
+
+def member_share(room, member_count) -> int:
+    """Each member's share of the room cost, rounded to whole shillings as the billing page does."""
+    share = Decimal(room.cost) / max(member_count, 1)
+    return int(share.quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+def charge_rooms(rooms):
+    """
+    Send an STK push to every pending or overdue member of `rooms`.
+    Members with a payment intent from the last MPESA_CHARGE_COOLDOWN
+    seconds already have a request on their phone and are skipped, so a
+    repeated charge does not push to them twice.
+
+    Returns:
+        list: One result per member: room_id, user_id, status ('sent',
+        'failed' or 'skipped') and either merchant_request_id or error
+    """
+    rooms = {room.room_id: room for room in rooms}
+    members = list(
+        RoomMember.objects.filter(room_id__in=list(rooms), payment_status__in=('pending', 'overdue'))
+        .exclude(role='owner')
+        .values_list('room_id', 'user_id')
+    )
+    if not members:
+        return []
+    # Counted rather than read from Room.member_count, which is only
+    # correct once reconcile_room_denormalization has run
+    member_counts = dict(
+        RoomMember.objects.filter(room_id__in=list(rooms)).values('room_id')
+        .annotate(count=Count('id')).values_list('room_id', 'count')
+    )
+    recently_charged = set(
+        PaymentIntent.objects.filter(
+            room_id__in=list(rooms),
+            created_at__gte=timezone.now() - timedelta(seconds=settings.MPESA_CHARGE_COOLDOWN)
+        ).values_list('room_id', 'user_id')
+    )
+
+    user_ids = sorted({str(user_id) for _, user_id in members})
+    contacts = {}
+    for start in range(0, len(user_ids), CONTACTS_BATCH_SIZE):
+        contacts.update(fetch_user_contacts(user_ids[start:start + CONTACTS_BATCH_SIZE]))
+
+    rate_limiter = RateLimiter(settings.MPESA_BULK_RATE)
+
+    def charge(member):
+        room_id, user_id = member
+        room = rooms[room_id]
+        result = {'room_id': str(room_id), 'user_id': str(user_id)}
+        if (room_id, user_id) in recently_charged:
+            return {**result, 'status': 'skipped', 'error': 'A payment request was sent recently'}
+        phone = (contacts.get(str(user_id)) or {}).get('phone_number')
+        if not phone:
+            return {**result, 'status': 'skipped', 'error': 'No phone number on file'}
+
+        rate_limiter.acquire()
+        try:
+            response = daraja.stk_push(
+                phone_number=phone,
+                amount=member_share(room, member_counts.get(room_id, 0)),
+                account_reference=str(room_id),
+                description=f"Payment of {room.name}"
+            )
+        except (DarajaError, requests.RequestException) as e:
+            return {**result, 'status': 'failed', 'error': str(e)}
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        if response.status_code != 200 or not data.get('MerchantRequestID'):
+            return {**result, 'status': 'failed', 'error': data.get('errorMessage') or f"HTTP {response.status_code}"}
+        return {**result, 'status': 'sent', 'merchant_request_id': data['MerchantRequestID'], 'phone_number': phone}
+
+    with ThreadPoolExecutor(max_workers=settings.MPESA_BULK_MAX_WORKERS) as executor:
+        results = list(executor.map(charge, members))
+
+    sent = [result for result in results if result['status'] == 'sent']
+    room_names = {str(room_id): room.name for room_id, room in rooms.items()}
+    PaymentIntent.objects.bulk_create([
+        PaymentIntent(
+            merchant_request_id=result['merchant_request_id'],
+            user_id=result['user_id'],
+            room_id=result['room_id'],
+            phone_number=result['phone_number']
+        )
+        for result in sent
+    ], ignore_conflicts=True)
+    set_payment_intents({
+        result['merchant_request_id']: {
+            "user_id": result['user_id'],
+            "room_id": result['room_id'],
+            "room_name": room_names[result['room_id']],
+            "phone_number": result['phone_number']
+        }
+        for result in sent
+    })
+    for result in sent:
+        # Phone numbers are only needed for the intents
+        del result['phone_number']
+    return results
@@ -0,0 +1,298 @@
+"""
+Queueing and batch processing of M-Pesa STK push callbacks.
+
+The webhook only validates a callback and appends it to the
+MPESA_CALLBACK_STREAM Redis stream, or to the CallbackOutbox table while
+Redis is unavailable, so its latency does not depend on how busy the
+database is. The process_mpesa_callbacks command drains both and applies
+each batch with a handful of queries, whatever its size.
+"""
+
+import json
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+import redis
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, transaction as db_transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from room.cache_utils import invalidate_room_cache_on_commit
+from room.models import RoomMember
+from room_management.redis_client import get_redis_client
+from .models import CallbackOutbox, Transaction
+from .utils import get_payment_intents
+
+logger = logging.getLogger(__name__)
+
+redis_client = get_redis_client()
+
+
+class InvalidCallback(ValueError):
+    """Raised for a request body that is not an STK push callback."""
+
+
+# Types accepted for the CallbackMetadata items process_callbacks reads;
+# bool is excluded explicitly since it is an int subclass
+METADATA_TYPES = {
+    'Amount': (int, float),
+    'MpesaReceiptNumber': (str,),
+    'PhoneNumber': (int, str),
+    'TransactionDate': (int, str),
+}
+# Transaction.amount holds up to 10 digits, 2 of them decimals
+MAX_AMOUNT = 10 ** 8
+
+
+def _is_instance(value, types):
+    return isinstance(value, types) and not isinstance(value, bool)
+
+def validate_callback(data):
+    """
+    Check that `data` is an STK push callback process_callbacks can apply.
+    Field types are checked strictly, since the webhook is public.
+
+    Returns:
+        dict: The stkCallback object
+
+    Raises:
+        InvalidCallback: If a field is missing or has the wrong type
+    """
+    stk_callback = data.get("Body", {}) if isinstance(data, dict) else None
+    stk_callback = stk_callback.get("stkCallback") if isinstance(stk_callback, dict) else None
+    if not isinstance(stk_callback, dict):
+        raise InvalidCallback("Missing Body.stkCallback")
+    merchant_request_id = stk_callback.get("MerchantRequestID")
+    if not isinstance(merchant_request_id, str) or not merchant_request_id:
+        raise InvalidCallback("MerchantRequestID must be a non-empty string")
+    if len(merchant_request_id) > Transaction._meta.get_field('merchant_request_id').max_length:
+        raise InvalidCallback("MerchantRequestID is too long")
+    if not _is_instance(stk_callback.get("ResultCode"), int):
+        raise InvalidCallback("ResultCode must be an integer")
+    if not isinstance(stk_callback.get("ResultDesc", ""), str):
+        raise InvalidCallback("ResultDesc must be a string")
+
+    if "CallbackMetadata" not in stk_callback:
+        return stk_callback
+    metadata = stk_callback["CallbackMetadata"]
+    if not isinstance(metadata, dict) or not isinstance(metadata.get("Item"), list):
+        raise InvalidCallback("CallbackMetadata.Item must be a list")
+    for item in metadata["Item"]:
+        if not isinstance(item, dict) or not isinstance(item.get("Name"), str):
+            raise InvalidCallback("CallbackMetadata items must be objects with a Name")
+        types = METADATA_TYPES.get(item["Name"])
+        if types and "Value" in item and not _is_instance(item["Value"], types):
+            raise InvalidCallback(f"Invalid {item['Name']}")
+    payment = parse_payment(stk_callback)
+    if payment['receipt'] and len(payment['receipt']) > Transaction._meta.get_field('MpesaReceiptNumber').max_length:
+        raise InvalidCallback("MpesaReceiptNumber is too long")
+    if payment['phone_number'] and len(str(payment['phone_number'])) > Transaction._meta.get_field('phone_number').max_length:
+        raise InvalidCallback("PhoneNumber is too long")
+    if payment['amount'] is not None and not 0 <= payment['amount'] < MAX_AMOUNT:
+        raise InvalidCallback("Amount is out of range")
+    return stk_callback
+
+def enqueue_callback(data):
+    """
+    Queue a validated callback for process_mpesa_callbacks.
+
+    Returns:
+        str: 'stream' or 'outbox', whichever queue took the callback
+    """
+    try:
+        redis_client.xadd(settings.MPESA_CALLBACK_STREAM, {'payload': json.dumps(data)})
+        return 'stream'
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"Queueing M-Pesa callback in the outbox, Redis is unavailable: {e}")
+        CallbackOutbox.objects.create(payload=data)
+        return 'outbox'
+
+def parse_payment(stk_callback):
+    """Pull the payment details out of a successful callback's metadata."""
+    values = {item.get("Name"): item.get("Value") for item in stk_callback.get("CallbackMetadata", {}).get("Item", [])}
+    return {
+        'merchant_request_id': stk_callback["MerchantRequestID"],
+        'amount': values.get("Amount"),
+        'receipt': values.get("MpesaReceiptNumber"),
+        'phone_number': values.get("PhoneNumber"),
+        'transaction_date': values.get("TransactionDate"),
+        'description': stk_callback.get("ResultDesc"),
+    }
+
+def apply_callbacks(callbacks):
+    """
+    Apply queued callbacks without letting one bad callback hold up the
+    rest. Invalid callbacks are rejected up front, and if the batch still
+    fails, each callback is applied on its own so only those that fail
+    again are rejected. Connection errors are raised: the database being
+    down says nothing about the callbacks.
+
+    Returns:
+        tuple: The process_callbacks stats, the indexes of callbacks to
+        retry because their payment intent is not stored yet, and
+        {index: error} for the rejected callbacks
+    """
+    stats = {'recorded': 0, 'duplicate': 0, 'failed': 0, 'unknown': 0}
+    rejected = {}
+    unknown = []
+    valid = []
+    for index, data in enumerate(callbacks):
+        try:
+            validate_callback(data)
+            valid.append(index)
+        except InvalidCallback as e:
+            rejected[index] = str(e)
+
+    try:
+        # A savepoint when the caller holds a transaction, so it survives a failed batch
+        with db_transaction.atomic():
+            results = [process_callbacks([callbacks[index] for index in valid], unknown)]
+    except (OperationalError, InterfaceError):
+        raise
+    except Exception:
+        logger.exception("Callback batch failed, applying its callbacks one at a time")
+        results = []
+        unknown = []
+        for index in valid:
+            try:
+                with db_transaction.atomic():
+                    results.append(process_callbacks([callbacks[index]], unknown))
+            except (OperationalError, InterfaceError):
+                raise
+            except Exception as e:
+                rejected[index] = f"{type(e).__name__}: {e}"
+
+    for result in results:
+        for key, value in result.items():
+            stats[key] += value
+    unknown = set(unknown)
+    retry = [
+        index for index in valid
+        if index not in rejected and callbacks[index]["Body"]["stkCallback"]["MerchantRequestID"] in unknown
+    ]
+    return stats, retry, rejected
+
+def dead_letter(callbacks):
+    """Keep callbacks that cannot be applied, as (payload, error) pairs, in the outbox."""
+    now = timezone.now()
+    CallbackOutbox.objects.bulk_create(
+        CallbackOutbox(payload=payload, error=error, dead_lettered_at=now)
+        for payload, error in callbacks
+    )
+
+def schedule_retry(row):
+    """
+    Give an outbox row another attempt after a delay growing with each
+    attempt, or dead-letter it once MPESA_CALLBACK_MAX_ATTEMPTS are used.
+    The caller saves the row.
+    """
+    row.attempts += 1
+    now = timezone.now()
+    if row.attempts >= settings.MPESA_CALLBACK_MAX_ATTEMPTS:
+        row.error = "No payment intent for this MerchantRequestID"
+        row.dead_lettered_at = now
+    else:
+        row.next_attempt_at = now + timedelta(seconds=settings.MPESA_CALLBACK_RETRY_DELAY * row.attempts)
+    return row
+
+def process_callbacks(callbacks, unknown=None):
+    """
+    Record the payments in a batch of callbacks and mark their members paid.
+
+    Callbacks M-Pesa retried, within the batch or across batches, are only
+    recorded once: they are matched on MerchantRequestID and receipt number
+    against each other and against existing transactions. Callbacks whose
+    MerchantRequestID has no payment intent (yet) are skipped, and their
+    IDs appended to `unknown` when it is given.
+
+    Returns:
+        dict: Counts of recorded, duplicate, failed and unknown callbacks
+    """
+    stats = {'recorded': 0, 'duplicate': 0, 'failed': 0, 'unknown': 0}
+    payments = {}
+    for data in callbacks:
+        stk_callback = data["Body"]["stkCallback"]
+        if stk_callback.get("ResultCode") != 0:
+            stats['failed'] += 1
+            continue
+        payment = parse_payment(stk_callback)
+        if payment['merchant_request_id'] in payments:
+            stats['duplicate'] += 1
+            continue
+        payments[payment['merchant_request_id']] = payment
+    if not payments:
+        return stats
+
+    receipts = [payment['receipt'] for payment in payments.values() if payment['receipt']]
+    recorded = Transaction.objects.filter(
+        Q(merchant_request_id__in=list(payments)) | Q(MpesaReceiptNumber__in=receipts)
+    ).values_list('merchant_request_id', 'MpesaReceiptNumber')
+    recorded_ids = set()
+    recorded_receipts = set()
+    for merchant_request_id, receipt in recorded:
+        recorded_ids.add(merchant_request_id)
+        recorded_receipts.add(receipt)
+
+    new_payments = [
+        payment for payment in payments.values()
+        if payment['merchant_request_id'] not in recorded_ids
+        and not (payment['receipt'] and payment['receipt'] in recorded_receipts)
+    ]
+    stats['duplicate'] += len(payments) - len(new_payments)
+    intents = get_payment_intents(payment['merchant_request_id'] for payment in new_payments)
+
+    transactions = []
+    members = set()
+    for payment in new_payments:
+        intent = intents.get(payment['merchant_request_id'])
+        if not intent:
+            logger.warning(f"No payment intent for MerchantRequestID {payment['merchant_request_id']}")
+            stats['unknown'] += 1
+            if unknown is not None:
+                unknown.append(payment['merchant_request_id'])
+            continue
+        transactions.append(Transaction(
+            phone_number=payment['phone_number'] or 'Unknown',
+            amount=payment['amount'] or 0,
+            MpesaReceiptNumber=payment['receipt'],
+            status='successful',
+            description=payment['description'],
+            room_name=intent.get("room_name", "Unknown Room"),
+            timestamp=payment['transaction_date'],
+            room_id=intent["room_id"],
+            merchant_request_id=payment['merchant_request_id']
+        ))
+        if intent["room_id"] and intent["phone_number"]:
+            members.add((intent["room_id"], intent["user_id"]))
+
+    with db_transaction.atomic():
+        # The unique indexes settle races with a concurrent worker
+        Transaction.objects.bulk_create(transactions, ignore_conflicts=True)
+        mark_members_paid(members)
+    stats['recorded'] = len(transactions)
+    return stats
+
+def mark_members_paid(members):
+    """
+    Mark (room_id, user_id) pairs as paid with a single conditional UPDATE,
+    which is a no-op for members already paid or no longer in the room.
+    """
+    if not members:
+        return 0
+    updated = RoomMember.objects.filter(
+        reduce(or_, (Q(room_id=room_id, user_id=user_id) for room_id, user_id in members))
+    ).exclude(payment_status='paid').update(
+        payment_status='paid',
+        last_payment_date=timezone.now()
+    )
+
+    user_ids_by_room = defaultdict(list)
+    for room_id, user_id in members:
+        user_ids_by_room[room_id].append(user_id)
+    for room_id, user_ids in user_ids_by_room.items():
+        invalidate_room_cache_on_commit(room_id, user_ids=user_ids)
+    return updated
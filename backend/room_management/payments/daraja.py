@@ -0,0 +1,177 @@
+"""
+Client for Safaricom's Daraja (M-Pesa) API.
+
+The OAuth access token is cached in Redis, shared by every worker, until
+MPESA_TOKEN_REFRESH_MARGIN seconds before it expires. Each process also
+keeps its own copy, so most STK pushes do not touch Redis at all. When the
+token has to be renewed, one worker refreshes it under a Redis lock while
+the others wait for its result, so an expiry does not send every worker to
+/oauth/v1/generate at once. If Redis is unavailable, each process fetches
+and caches its own token.
+
+MPESA_BASE_URL selects the Daraja host, so tests can point it at a stub.
+"""
+
+import base64
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+import redis
+from django.conf import settings
+
+from room_management.redis_client import get_redis_client
+from room_management.service_client import ServiceClient
+
+logger = logging.getLogger(__name__)
+
+
+class DarajaError(Exception):
+    """Raised when an access token cannot be obtained."""
+
+
+class DarajaClient:
+    TOKEN_KEY = 'mpesa:access_token'
+    TOKEN_LOCK_KEY = 'mpesa:access_token:lock'
+
+    def __init__(self, base_url: str, consumer_key: str, consumer_secret: str,
+                 refresh_margin: float, redis_client=None):
+        self.http = ServiceClient(
+            name='daraja',
+            base_url=base_url,
+            connect_timeout=settings.MPESA_CONNECT_TIMEOUT,
+            read_timeout=settings.MPESA_READ_TIMEOUT,
+            max_retries=2,
+            backoff=0.2,
+            pool_size=settings.MPESA_POOL_SIZE,
+            failure_threshold=5,
+            reset_timeout=30
+        )
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.refresh_margin = refresh_margin
+        self.redis = redis_client
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get_access_token(self) -> str:
+        """Return a valid access token, refreshing it if it is about to expire."""
+        if self._token and time.time() < self._token_expires_at:
+            return self._token
+        with self._lock:
+            if self._token and time.time() < self._token_expires_at:
+                return self._token
+            token, expires_at = self._get_shared_token()
+            self._token, self._token_expires_at = token, expires_at
+            return token
+
+    def invalidate_access_token(self, token: str) -> None:
+        """Drop `token`, e.g. after Daraja rejected it, unless it was already replaced."""
+        with self._lock:
+            if self._token == token:
+                self._token, self._token_expires_at = None, 0.0
+        if self.redis is None:
+            return
+        try:
+            cached = self.redis.get(self.TOKEN_KEY)
+            if cached and json.loads(cached)['token'] == token:
+                self.redis.delete(self.TOKEN_KEY)
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Could not drop the cached M-Pesa token: {e}")
+
+    def stk_push(self, phone_number, amount, account_reference, description):
+        """
+        Send an STK push (Lipa na M-Pesa Online) to `phone_number`, in
+        E.164 as the auth service stores it or already without the plus.
+
+        Returns:
+            requests.Response: Daraja's response
+        """
+        # Daraja expects the MSISDN as digits only: 2547XXXXXXXX
+        phone_number = str(phone_number).lstrip('+')
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        password_str = f"{settings.MPESA_SHORTCODE}{settings.MPESA_PASSKEY}{timestamp}"
+        payload = {
+            "BusinessShortCode": settings.MPESA_SHORTCODE,
+            "Password": base64.b64encode(password_str.encode()).decode(),
+            "Timestamp": timestamp,
+            "TransactionType": "CustomerPayBillOnline",
+            "Amount": amount,
+            "PartyA": phone_number,
+            "PartyB": settings.MPESA_SHORTCODE,
+            "PhoneNumber": phone_number,
+            "CallBackURL": settings.MPESA_CALLBACK_URL,
+            "AccountReference": account_reference,
+            "TransactionDesc": description
+        }
+        for attempt in range(2):
+            token = self.get_access_token()
+            response = self.http.post(
+                '/mpesa/stkpush/v1/processrequest',
+                headers={"Authorization": f"Bearer {token}"},
+                json=payload
+            )
+            if response.status_code != 401 or attempt:
+                return response
+            # Token revoked before its advertised expiry; renew it once
+            self.invalidate_access_token(token)
+        return response
+
+    def _get_shared_token(self):
+        if self.redis is None:
+            return self._fetch_token()
+        try:
+            token = self._read_cached_token()
+            if token:
+                return token
+            with self.redis.lock(self.TOKEN_LOCK_KEY, timeout=15, blocking_timeout=10):
+                # Another worker may have refreshed it while we waited
+                token = self._read_cached_token()
+                if token:
+                    return token
+                token, expires_at = self._fetch_token()
+                ttl = int(expires_at - time.time())
+                if ttl > 0:
+                    self.redis.setex(self.TOKEN_KEY, ttl, json.dumps({'token': token, 'expires_at': expires_at}))
+                return token, expires_at
+        except redis.exceptions.LockError as e:
+            logger.warning(f"Fetching an M-Pesa token without the lock: {e}")
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Fetching an M-Pesa token without Redis: {e}")
+        return self._fetch_token()
+
+    def _read_cached_token(self):
+        cached = self.redis.get(self.TOKEN_KEY)
+        if not cached:
+            return None
+        data = json.loads(cached)
+        return data['token'], data['expires_at']
+
+    def _fetch_token(self):
+        credentials = base64.b64encode(f"{self.consumer_key}:{self.consumer_secret}".encode()).decode()
+        response = self.http.get(
+            '/oauth/v1/generate',
+            params={'grant_type': 'client_credentials'},
+            headers={'Authorization': f'Basic {credentials}'}
+        )
+        if response.status_code != 200:
+            raise DarajaError(f"Token request failed with status {response.status_code}")
+        data = response.json()
+        token = data.get('access_token')
+        if not token:
+            raise DarajaError("Token response has no access_token")
+        expires_in = float(data.get('expires_in', 3599))
+        return token, time.time() + max(expires_in - self.refresh_margin, 0)
+
+
+daraja = DarajaClient(
+    base_url=settings.MPESA_BASE_URL,
+    consumer_key=settings.MPESA_CONSUMER_KEY,
+    consumer_secret=settings.MPESA_CONSUMER_SECRET,
+    refresh_margin=settings.MPESA_TOKEN_REFRESH_MARGIN,
+    redis_client=get_redis_client()
+)
@@ -0,0 +1,37 @@
+import datetime
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from payments.billing import charge_rooms
+from room.models import Room
+
+
+class Command(BaseCommand):
+    help = "Send STK pushes to every unpaid member of the rooms due on a date (default: today)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Due date as YYYY-MM-DD')
+        parser.add_argument('--verbose-results', action='store_true', help='Print the result for every member')
+
+    def handle(self, *args, **options):
+        try:
+            due_date = datetime.date.fromisoformat(options['date']) if options['date'] else timezone.localdate()
+        except ValueError:
+            raise CommandError("--date must be YYYY-MM-DD")
+
+        rooms = list(Room.objects.filter(due_date=due_date))
+        started = timezone.now()
+        results = charge_rooms(rooms)
+        elapsed = (timezone.now() - started).total_seconds()
+
+        if options['verbose_results']:
+            for result in results:
+                detail = result.get('merchant_request_id') or result.get('error', '')
+                self.stdout.write(f"{result['room_id']} {result['user_id']} {result['status']} {detail}")
+        counts = Counter(result['status'] for result in results)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(rooms)} rooms due {due_date}: {counts['sent']} sent, {counts['failed']} failed, "
+            f"{counts['skipped']} skipped in {elapsed:.1f}s"
+        ))
@@ -0,0 +1,147 @@
+import json
+import os
+import socket
+import time
+
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import InterfaceError, OperationalError, close_old_connections, transaction
+from django.utils import timezone
+
+from payments.callbacks import apply_callbacks, dead_letter, schedule_retry
+from payments.models import CallbackOutbox
+from room_management.redis_client import create_blocking_client
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply queued M-Pesa callbacks in batches: first any that fell back "
+        "to the CallbackOutbox table, then the MPESA_CALLBACK_STREAM Redis "
+        "stream. Runs until interrupted unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumer', default=f"{socket.gethostname()}-{os.getpid()}")
+        parser.add_argument('--batch-size', type=int, default=settings.MPESA_CALLBACK_BATCH_SIZE)
+        parser.add_argument('--block', type=int, default=2000, help='Milliseconds to wait for callbacks')
+        parser.add_argument('--once', action='store_true', help='Exit once both queues are empty')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.consumer = options['consumer']
+        self.stream = settings.MPESA_CALLBACK_STREAM
+        self.group = settings.MPESA_CALLBACK_GROUP
+        self.stream_ready = False
+        self.redis = create_blocking_client(options['block'] / 1000)
+        # Re-read our own unacknowledged callbacks first, so a batch that
+        # failed or was interrupted is applied again
+        self.last_id = '0'
+
+        while True:
+            try:
+                processed = self.drain_outbox()
+                processed += self.drain_stream(None if options['once'] else options['block'])
+            except (OperationalError, InterfaceError) as e:
+                if options['once']:
+                    raise
+                # Unacknowledged entries and outbox rows are applied once it is back
+                self.stderr.write(f"Database unavailable, retrying: {e}")
+                close_old_connections()
+                time.sleep(1)
+                continue
+            if options['once'] and not processed:
+                return
+
+    def drain_outbox(self):
+        processed = 0
+        while True:
+            with transaction.atomic():
+                rows = list(
+                    CallbackOutbox.objects.select_for_update(skip_locked=True)
+                    .filter(dead_lettered_at__isnull=True, next_attempt_at__lte=timezone.now())
+                    .order_by('id')[:self.batch_size]
+                )
+                if not rows:
+                    return processed
+                stats, retry, rejected = apply_callbacks([row.payload for row in rows])
+                now = timezone.now()
+                for index, error in rejected.items():
+                    rows[index].error = error
+                    rows[index].dead_lettered_at = now
+                for index in retry:
+                    schedule_retry(rows[index])
+                kept = set(retry) | set(rejected)
+                CallbackOutbox.objects.bulk_update(
+                    [rows[index] for index in kept],
+                    ['attempts', 'next_attempt_at', 'error', 'dead_lettered_at']
+                )
+                CallbackOutbox.objects.filter(
+                    id__in=[row.id for index, row in enumerate(rows) if index not in kept]
+                ).delete()
+                self.report('outbox', stats, len(rows), rejected=len(rejected))
+            processed += len(rows)
+
+    def drain_stream(self, block):
+        try:
+            if not self.stream_ready:
+                self.create_group()
+            response = self.redis.xreadgroup(
+                self.group,
+                self.consumer,
+                {self.stream: self.last_id},
+                count=self.batch_size,
+                block=block
+            )
+            entries = response[0][1] if response else []
+            if not entries:
+                if self.last_id == '0':
+                    self.last_id = '>'
+                    return self.drain_stream(block)
+                return 0
+
+            started = time.monotonic()
+            payloads = []
+            for _, fields in entries:
+                try:
+                    payloads.append(json.loads(fields['payload']))
+                except (KeyError, ValueError):
+                    payloads.append({'raw': fields.get('payload')})
+            try:
+                stats, retry, rejected = apply_callbacks(payloads)
+                # Moved to the outbox before the ack, so a failure here re-reads them
+                dead_letter([(payloads[index], error) for index, error in rejected.items()])
+                CallbackOutbox.objects.bulk_create(
+                    schedule_retry(CallbackOutbox(payload=payloads[index])) for index in retry
+                )
+            except Exception:
+                self.last_id = '0'
+                raise
+            ids = [entry_id for entry_id, _ in entries]
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.xack(self.stream, self.group, *ids)
+            pipe.xdel(self.stream, *ids)
+            pipe.execute()
+            self.report('stream', stats, len(entries), time.monotonic() - started, rejected=len(rejected))
+            return len(entries)
+        except redis.exceptions.RedisError as e:
+            self.stderr.write(f"Redis unavailable, retrying: {e}")
+            self.stream_ready = False
+            self.last_id = '0'
+            time.sleep(1)
+            return 0
+
+    def create_group(self):
+        try:
+            self.redis.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self.stream_ready = True
+
+    def report(self, source, stats, count, elapsed=None, rejected=0):
+        timing = f" in {elapsed * 1000:.0f}ms" if elapsed is not None else ''
+        self.stdout.write(
+            f"{source}: {count} callbacks{timing} "
+            + ', '.join(f"{key} {value}" for key, value in {**stats, 'dead-lettered': rejected}.items())
+        )
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 
@@ -18,6 +19,8 @@ class Transaction(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=PAYMENT_STATUS, default="pending")  # e.g., PENDING, SUCCESSFUL, FAILED
     room_id = models.CharField(max_length=50, blank=True, null=True, help_text="Room ID for the payment")
+    merchant_request_id = models.CharField(max_length=100, unique=True, null=True, blank=True,
+                                           help_text="STK push request this payment settles; makes callbacks idempotent")
 
     def __str__(self):
         return f"{self.phone_number} - {self.amount} KES"
@@ -29,3 +32,18 @@ class PaymentIntent(models.Model):
     phone_number = models.CharField(max_length=15)
     created_at = models.DateTimeField(auto_now_add=True)
 
+
+
+class CallbackOutbox(models.Model):
+    """
+    M-Pesa callbacks queued while the Redis stream was unavailable,
+    callbacks waiting for their payment intent to be stored, and
+    dead-lettered callbacks the worker could not apply, kept with their
+    error for inspection.
+    """
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    error = models.TextField(blank=True)
+    dead_lettered_at = models.DateTimeField(null=True, blank=True, db_index=True)
@@ -5,3 +5,11 @@ class TransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
         fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        # Optional projection, e.g. TransactionSerializer(..., fields=['id', 'amount'])
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
@@ -1,3 +1,362 @@
-from django.test import TestCase
+import base64
+import datetime
+import io
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import redis
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from room.authentication import SimpleUser
+
+from room.models import Room, RoomMember
+from .billing import charge_rooms
+from .callbacks import InvalidCallback, apply_callbacks, process_callbacks, validate_callback
+from .daraja import DarajaClient
+from .models import CallbackOutbox, PaymentIntent, Transaction
+
+
+class CallbackProcessingTests(TestCase):
+    def setUp(self):
+        self.user_id = uuid.uuid4()
+        self.room = Room.objects.create(
+            owner_id=str(uuid.uuid4()),
+            cost='10.00',
+            service_type='netflix',
+            name='Family plan',
+            description='Shared plan',
+            due_date=datetime.date(2030, 1, 1)
+        )
+        RoomMember.objects.create(room=self.room, user_id=self.user_id)
+        patcher = mock.patch('payments.callbacks.get_payment_intents', side_effect=lambda ids: {
+            merchant_request_id: {
+                'user_id': str(self.user_id),
+                'room_id': str(self.room.room_id),
+                'room_name': self.room.name,
+                'phone_number': '254700000000'
+            }
+            for merchant_request_id in ids
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def callback(merchant_request_id='29115-34620561-1', receipt='NLJ7RT61SV', result_code=0):
+        return {
+            'Body': {
+                'stkCallback': {
+                    'MerchantRequestID': merchant_request_id,
+                    'ResultCode': result_code,
+                    'ResultDesc': 'The service request is processed successfully.',
+                    'CallbackMetadata': {
+                        'Item': [
+                            {'Name': 'Amount', 'Value': 10},
+                            {'Name': 'MpesaReceiptNumber', 'Value': receipt},
+                            {'Name': 'PhoneNumber', 'Value': 254700000000},
+                        ]
+                    }
+                }
+            }
+        }
+
+    @staticmethod
+    def run_worker():
+        """Run the worker once with Redis down, so it only drains the outbox."""
+        with mock.patch('payments.management.commands.process_mpesa_callbacks.create_blocking_client') as client:
+            client.return_value.xgroup_create.side_effect = redis.exceptions.ConnectionError
+            with mock.patch('time.sleep'):
+                call_command('process_mpesa_callbacks', '--once', stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_view_queues_in_outbox_without_redis(self):
+        with mock.patch('payments.callbacks.redis_client.xadd', side_effect=redis.exceptions.ConnectionError):
+            response = self.client.post(
+                reverse('callback'), json.dumps(self.callback()), content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(CallbackOutbox.objects.count(), 1)
+        self.assertEqual(Transaction.objects.count(), 0)
+
+        response = self.client.post(reverse('callback'), '{"Body": {}}', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_retried_callbacks_are_recorded_once(self):
+        stats = process_callbacks([self.callback(), self.callback()])
+        self.assertEqual(stats['recorded'], 1)
+        self.assertEqual(stats['duplicate'], 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            stats = process_callbacks([self.callback()])
+        # A replayed batch is a single SELECT (savepoints only appear inside the test's transaction)
+        statements = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(stats['duplicate'], 1)
+
+        self.assertEqual(Transaction.objects.count(), 1)
+        member = RoomMember.objects.get(room=self.room, user_id=self.user_id)
+        self.assertEqual(member.payment_status, 'paid')
+        self.assertIsNotNone(member.last_payment_date)
+
+    def test_batch_query_count_is_constant(self):
+        callbacks = [self.callback(f"mr-{i}", f"RCPT{i}") for i in range(20)]
+        callbacks.append(self.callback('mr-failed', result_code=1032))
+
+        with CaptureQueriesContext(connection) as queries:
+            stats = process_callbacks(callbacks)
+        statements = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+        # Duplicate check, bulk insert and member update
+        self.assertEqual(len(statements), 3)
+        self.assertEqual(stats, {'recorded': 20, 'duplicate': 0, 'failed': 1, 'unknown': 0})
+
+    def test_receipt_recorded_without_merchant_request_id(self):
+        Transaction.objects.create(phone_number='254700000000', amount=10, MpesaReceiptNumber='NLJ7RT61SV')
+
+        stats = process_callbacks([self.callback()])
+
+        self.assertEqual(stats['duplicate'], 1)
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(RoomMember.objects.get(room=self.room, user_id=self.user_id).payment_status, 'pending')
+
+    def test_worker_drains_outbox(self):
+        CallbackOutbox.objects.create(payload=self.callback())
+
+        self.run_worker()
+
+        self.assertEqual(CallbackOutbox.objects.count(), 0)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def malformed_callbacks(self):
+        no_metadata = self.callback('mr-none')
+        no_metadata['Body']['stkCallback']['CallbackMetadata'] = None
+        bad_items = self.callback('mr-items')
+        bad_items['Body']['stkCallback']['CallbackMetadata'] = {'Item': ['oops']}
+        list_id = self.callback()
+        list_id['Body']['stkCallback']['MerchantRequestID'] = ['mr-list']
+        bad_amount = self.callback('mr-amount')
+        bad_amount['Body']['stkCallback']['CallbackMetadata']['Item'][0]['Value'] = {'nested': 1}
+        return [no_metadata, bad_items, list_id, bad_amount]
+
+    def test_webhook_rejects_malformed_callbacks(self):
+        for callback in self.malformed_callbacks():
+            with self.assertRaises(InvalidCallback):
+                validate_callback(callback)
+            response = self.client.post(reverse('callback'), json.dumps(callback), content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_worker_dead_letters_what_it_cannot_apply(self):
+        CallbackOutbox.objects.bulk_create(
+            CallbackOutbox(payload=payload) for payload in self.malformed_callbacks() + [self.callback()]
+        )
+
+        self.run_worker()
+
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(CallbackOutbox.objects.count(), 4)
+        self.assertFalse(CallbackOutbox.objects.filter(dead_lettered_at__isnull=True).exists())
+
+    def test_callback_before_its_intent_is_retried(self):
+        CallbackOutbox.objects.create(payload=self.callback())
+
+        with mock.patch('payments.callbacks.get_payment_intents', return_value={}):
+            self.run_worker()
+
+        row = CallbackOutbox.objects.get()
+        self.assertEqual(row.attempts, 1)
+        self.assertIsNone(row.dead_lettered_at)
+        self.assertGreater(row.next_attempt_at, timezone.now())
+        self.assertEqual(Transaction.objects.count(), 0)
+
+        CallbackOutbox.objects.update(next_attempt_at=timezone.now())
+        self.run_worker()
+        self.assertEqual(CallbackOutbox.objects.count(), 0)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_failing_callback_does_not_fail_its_batch(self):
+        callbacks = [self.callback('mr-1', 'RCPT1'), self.callback('mr-2', 'RCPT2')]
+        original = Transaction.objects.bulk_create
+
+        def bulk_create(transactions, **kwargs):
+            if any(transaction.merchant_request_id == 'mr-2' for transaction in transactions):
+                raise ValueError('boom')
+            return original(transactions, **kwargs)
+
+        with mock.patch.object(Transaction.objects, 'bulk_create', side_effect=bulk_create):
+            stats, retry, rejected = apply_callbacks(callbacks)
+
+        self.assertEqual(stats['recorded'], 1)
+        self.assertEqual(list(rejected), [1])
+        self.assertEqual(list(Transaction.objects.values_list('merchant_request_id', flat=True)), ['mr-1'])
+
+
+class StubDarajaHandler(BaseHTTPRequestHandler):
+    """Minimal Daraja: hands out numbered tokens and rejects revoked ones."""
+
+    def do_GET(self):
+        server = self.server
+        server.token_requests += 1
+        self.reply(200, {'access_token': f"token-{server.token_requests}", 'expires_in': '3599'})
+
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers['Content-Length']))
+        server.pushes.append(self.headers['Authorization'])
+        if self.headers['Authorization'] in server.revoked:
+            self.reply(401, {'errorMessage': 'Invalid Access Token'})
+        else:
+            self.reply(200, {'MerchantRequestID': f"mr-{len(server.pushes)}", 'ResponseCode': '0'})
+
+    def reply(self, status_code, body):
+        data = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class DarajaClientTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubDarajaHandler)
+        self.server.token_requests = 0
+        self.server.pushes = []
+        self.server.revoked = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = DarajaClient(
+            base_url=f"http://127.0.0.1:{self.server.server_port}",
+            consumer_key='key',
+            consumer_secret='secret',
+            refresh_margin=60
+        )
+
+    def push(self):
+        return self.client.stk_push('254700000000', 10, 'room', 'Payment of room')
+
+    def test_token_is_reused(self):
+        self.assertEqual(self.push().status_code, 200)
+        self.assertEqual(self.push().status_code, 200)
+
+        self.assertEqual(self.server.token_requests, 1)
+        self.assertEqual(self.server.pushes, ['Bearer token-1', 'Bearer token-1'])
+
+    def test_rejected_token_is_refreshed_once(self):
+        self.push()
+        self.server.revoked.add('Bearer token-1')
+
+        response = self.push()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.token_requests, 2)
+        self.assertEqual(self.server.pushes[-2:], ['Bearer token-1', 'Bearer token-2'])
+
+
+class MpesaSTKPushViewTests(TestCase):
+    def test_redis_failure_still_saves_the_intent(self):
+        user_id = str(uuid.uuid4())
+        client = APIClient()
+        client.force_authenticate(user=SimpleUser(user_id))
+        push_response = mock.Mock(status_code=200)
+        push_response.json.return_value = {'MerchantRequestID': 'mr-1', 'ResponseCode': '0'}
+        with mock.patch('payments.views.daraja.stk_push', return_value=push_response), \
+                mock.patch('payments.utils.redis_client.setex', side_effect=redis.exceptions.ConnectionError('down')):
+            response = client.post(reverse('stk-push'), {
+                'phone_number': '254700000000', 'amount': 100, 'room_id': str(uuid.uuid4()),
+            }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'MerchantRequestID': 'mr-1', 'ResponseCode': '0'})
+        self.assertTrue(PaymentIntent.objects.filter(merchant_request_id='mr-1', user_id=user_id).exists())
+
+
+class ChargeRoomsTests(TestCase):
+    def test_pushes_to_unpaid_members_and_saves_intents(self):
+        owner_id, pending_id, overdue_id, paid_id, no_phone_id = (uuid.uuid4() for _ in range(5))
+        room = Room.objects.create(
+            owner_id=str(owner_id),
+            cost='1000.00',
+            service_type='netflix',
+            name='Family plan',
+            description='Shared plan',
+            due_date=datetime.date(2030, 1, 1),
+            # Not reconciled yet; the share comes from the actual members
+            member_count=0
+        )
+        RoomMember.objects.create(room=room, user_id=owner_id, role='owner', payment_status='paid')
+        RoomMember.objects.create(room=room, user_id=pending_id)
+        RoomMember.objects.create(room=room, user_id=overdue_id, payment_status='overdue')
+        RoomMember.objects.create(room=room, user_id=paid_id, payment_status='paid')
+        RoomMember.objects.create(room=room, user_id=no_phone_id)
+
+        contacts = {
+            str(pending_id): {'username': 'a', 'phone_number': '254700000001'},
+            str(overdue_id): {'username': 'b', 'phone_number': '254700000002'},
+            str(no_phone_id): {'username': 'c', 'phone_number': None},
+        }
+
+        def stk_push(phone_number, amount, account_reference, description):
+            self.assertEqual(amount, 200)
+            response = mock.Mock(status_code=200)
+            response.json.return_value = {'MerchantRequestID': f"mr-{phone_number}"}
+            return response
+
+        with mock.patch('payments.billing.fetch_user_contacts', return_value=contacts), \
+                mock.patch('payments.billing.daraja.stk_push', side_effect=stk_push), \
+                mock.patch('payments.billing.set_payment_intents'):
+            results = charge_rooms([room])
+
+        statuses = {result['user_id']: result['status'] for result in results}
+        self.assertEqual(statuses, {
+            str(pending_id): 'sent',
+            str(overdue_id): 'sent',
+            str(no_phone_id): 'skipped',
+        })
+        self.assertCountEqual(
+            PaymentIntent.objects.values_list('merchant_request_id', flat=True),
+            ['mr-254700000001', 'mr-254700000002']
+        )
+
+        # A second charge straight away does not push to them again
+        with mock.patch('payments.billing.fetch_user_contacts', return_value=contacts), \
+                mock.patch('payments.billing.daraja.stk_push') as stk_push:
+            results = charge_rooms([room])
+        stk_push.assert_not_called()
+        self.assertEqual({result['status'] for result in results}, {'skipped'})
+
+
+class TransactionListTests(TestCase):
+    def test_pages_newest_first(self):
+        now = timezone.now()
+        ids = [Transaction.objects.create(phone_number='254700000000', amount=10).id for _ in range(5)]
+        # Two share a timestamp, so the id breaks the tie
+        for id, minutes in zip(ids, (4, 3, 3, 1, 0)):
+            Transaction.objects.filter(id=id).update(timestamp=now - datetime.timedelta(minutes=minutes))
+
+        seen = []
+        params = {'limit': 2}
+        while True:
+            response = self.client.get(reverse('transactions'), params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(transaction['id'] for transaction in response.data['results'])
+            if not response.data['next_cursor']:
+                break
+            params['cursor'] = response.data['next_cursor']
+
+        self.assertEqual(seen, [ids[4], ids[3], ids[2], ids[1], ids[0]])
+
+    def test_tampered_cursor_is_rejected(self):
+        for key in (['garbage', 1], [{'a': 1}, 1], [None, 1], ['2030-01-01T00:00:00', 'x'], 'not a list'):
+            cursor = base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+            response = self.client.get(reverse('transactions'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, key)
+        self.assertEqual(self.client.get(reverse('transactions'), {'cursor': '%%%'}).status_code, 400)
@@ -1,8 +1,9 @@
 from django.urls import path
-from .views import MpesaSTKPushView, MpesaCallbackView, TransactionListView
+from .views import MpesaSTKPushView, ChargeRoomView, MpesaCallbackView, TransactionListView
 
 urlpatterns = [
     path('stk-push/', MpesaSTKPushView.as_view(), name='stk-push'),
+    path('rooms/<uuid:room_id>/charge/', ChargeRoomView.as_view(), name='charge-room'),
     path('callback/',  MpesaCallbackView.as_view(), name='callback'),
     path('transactions/', TransactionListView.as_view(), name='transactions')
 ]
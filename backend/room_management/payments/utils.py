@@ -1,19 +1,29 @@
+import logging
+
 import redis
-from django.conf import settings
 import json
+from room_management.redis_client import get_redis_client, pipelined
 from .models import PaymentIntent
 
-redis_client = redis.StrictRedis(
-    host=settings.REDIS_HOST,
-    port=settings.REDIS_PORT,
-    db=settings.REDIS_DB,
-    decode_responses=True,
-    encoding='utf-8'
-)
+logger = logging.getLogger(__name__)
+
+redis_client = get_redis_client()
 
 def set_payment_intent(merchant_request_id, data, ttl=3600):
-    "Store data as JSON with expiration"
-    redis_client.setex(f"payment_intent:{merchant_request_id}", ttl, json.dumps(data))
+    "Store data as JSON with expiration; the PaymentIntent row covers a Redis failure"
+    try:
+        redis_client.setex(f"payment_intent:{merchant_request_id}", ttl, json.dumps(data))
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"Redis error while caching a payment intent, the database copy stands in: {e}")
+
+def set_payment_intents(intents, ttl=3600):
+    "Store many intents in one round trip; the PaymentIntent rows cover a Redis failure"
+    try:
+        with pipelined() as pipe:
+            for merchant_request_id, data in intents.items():
+                pipe.setex(f"payment_intent:{merchant_request_id}", ttl, json.dumps(data))
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"Redis error while caching payment intents, the database copies stand in: {e}")
 
 def get_payment_intent(merchant_request_id):
     "Retrieve JSON and convert back to dict"
@@ -22,7 +32,7 @@ def get_payment_intent(merchant_request_id):
         if value:
             return json.loads(value)
     except redis.exceptions.RedisError as e:
-        print(f"Redis error: {e}")
+        logger.warning(f"Redis error while reading a payment intent, using the database: {e}")
 
     # 🔁 Fallback to DB
     try:
@@ -33,4 +43,26 @@ def get_payment_intent(merchant_request_id):
             "phone_number": intent.phone_number
         }
     except PaymentIntent.DoesNotExist:
-        return None
\ No newline at end of file
+        return None
+
+def get_payment_intents(merchant_request_ids):
+    "Retrieve many intents with one MGET, falling back to one DB query for the misses"
+    merchant_request_ids = list(dict.fromkeys(merchant_request_ids))
+    intents = {}
+    try:
+        values = redis_client.mget([f"payment_intent:{mrid}" for mrid in merchant_request_ids])
+        for mrid, value in zip(merchant_request_ids, values):
+            if value:
+                intents[mrid] = json.loads(value)
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"Redis error while reading payment intents, using the database: {e}")
+
+    missing = [mrid for mrid in merchant_request_ids if mrid not in intents]
+    if missing:
+        for intent in PaymentIntent.objects.filter(merchant_request_id__in=missing):
+            intents[intent.merchant_request_id] = {
+                "user_id": str(intent.user_id),
+                "room_id": str(intent.room_id),
+                "phone_number": intent.phone_number
+            }
+    return intents
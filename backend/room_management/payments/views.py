@@ -1,9 +1,5 @@
 import requests
-import base64
 import json
-from django.utils import timezone
-from datetime import datetime
-from django.conf import settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
@@ -13,9 +9,14 @@ from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.generics import ListAPIView
 from .serializers import TransactionSerializer
-from room.models import Room, RoomMember    
+from room.models import Room
+from room.pagination import KeysetPagination, get_requested_fields
 import uuid
-from .utils import set_payment_intent, get_payment_intent
+from .utils import set_payment_intent
+from .daraja import DarajaError, daraja
+from .billing import charge_rooms, room_charge_lock
+from django.shortcuts import get_object_or_404
+from .callbacks import InvalidCallback, enqueue_callback, validate_callback
 import logging
 
 logger = logging.getLogger(__name__)
@@ -38,58 +39,63 @@ class MpesaSTKPushView(APIView):
         except Room.DoesNotExist:
             logger.warning(f"Room not found for ID: {room_id}")
 
-        # Step 1: Generate Access Token
-        data_to_encode = f"{settings.MPESA_CONSUMER_KEY}:{settings.MPESA_CONSUMER_SECRET}"
-        encoded_data = base64.b64encode(data_to_encode.encode()).decode()
-        token_response = requests.request("GET", 'https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials', 
-                                          headers = { 'Authorization': f'Basic {encoded_data}' })
-        access_token = token_response.json().get("access_token")
-      
-         # Step 2: Prepare STK Push Payload
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        password_str = f"{settings.MPESA_SHORTCODE}{settings.MPESA_PASSKEY}{timestamp}"
-        password = base64.b64encode(password_str.encode()).decode()
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-
-        payload = {
-            "BusinessShortCode": settings.MPESA_SHORTCODE,
-            "Password": password,
-            "Timestamp": timestamp,
-            "TransactionType": "CustomerPayBillOnline",
-            "Amount": amount,
-            "PartyA": phone,
-            "PartyB": settings.MPESA_SHORTCODE,
-            "PhoneNumber": phone,
-            "CallBackURL": settings.MPESA_CALLBACK_URL,
-            "AccountReference": room_id,
-            "TransactionDesc": f"Payment of {room_name}"  # Updated transaction description
-        }
-        print(settings.MPESA_CALLBACK_URL)
-        stk_url = "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
-        response = requests.post(stk_url, headers = headers, json = payload)
+        try:
+            response = daraja.stk_push(
+                phone_number=phone,
+                amount=amount,
+                account_reference=room_id,
+                description=f"Payment of {room_name}"  # Updated transaction description
+            )
+        except (DarajaError, requests.RequestException) as e:
+            logger.error(f"STK push failed: {e}")
+            return Response({"error": "M-Pesa is unavailable, try again later"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         if response.status_code == 200:
             merchant_request_id = response.json().get('MerchantRequestID')
 
-            #Store the details in redis with room_name
-            set_payment_intent(merchant_request_id,{
-                               "user_id":user_id,
-                                "room_id":room_id,
-                                "room_name":room_name,  # Added room_name to cache
-                                "phone_number":phone})
-            
-            #Store the details in the DB
+            #Store the details in the DB first: callbacks fall back to the row
             PaymentIntent.objects.create(
                 merchant_request_id=merchant_request_id,
                 user_id=user_id,
                 room_id=room_id,
                 phone_number=phone
             )
+
+            #Store the details in redis with room_name
+            set_payment_intent(merchant_request_id,{
+                               "user_id":user_id,
+                                "room_id":room_id,
+                                "room_name":room_name,  # Added room_name to cache
+                                "phone_number":phone})
         return Response(response.json(), status=response.status_code)
+class ChargeRoomView(APIView):
+    """
+    Let a room owner send an STK push to every member who has not paid,
+    and report the outcome for each member.
+    """
+    def post(self, request, room_id):
+        room = get_object_or_404(Room, room_id=room_id)
+        if str(room.owner_id) != str(request.user.id):
+            return Response({'error': 'Only the room owner can charge members'}, status=status.HTTP_403_FORBIDDEN)
+        with room_charge_lock(room.room_id) as acquired:
+            if not acquired:
+                return Response({'error': 'This room is already being charged'}, status=status.HTTP_409_CONFLICT)
+            try:
+                results = charge_rooms([room])
+            except requests.RequestException as e:
+                logger.error(f"Could not load member contacts: {e}")
+                return Response({"error": "Member details are unavailable, try again later"},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({
+            'results': results,
+            **{outcome: sum(result['status'] == outcome for result in results) for outcome in ('sent', 'failed', 'skipped')}
+        }, status=status.HTTP_200_OK)
+
 @method_decorator(csrf_exempt, name='dispatch')
 class MpesaCallbackView(APIView):
+    """
+    Accept an STK push callback and queue it for process_mpesa_callbacks,
+    so M-Pesa gets its 200 without waiting on the database.
+    """
     authentication_classes = [] 
     permission_classes=[AllowAny]
     def post(self, request):
@@ -97,84 +103,37 @@ class MpesaCallbackView(APIView):
             return Response({"error":"Only POST allowed"}, status=405)
         try:
             data = json.loads(request.body)
-            stk_callback = data.get("Body", {}).get("stkCallback", {})
-            result_code = stk_callback.get("ResultCode")
-            result_desc = stk_callback.get("ResultDesc")
-            merchant_request_id = stk_callback.get("MerchantRequestID")
-            metadata = stk_callback.get("CallbackMetadata", {}).get("Item", []) if result_code == 0 else []
-
-            amount = MpesaReceiptNumber = phone_number = transaction_date = None
-            if result_code == 0:
-                for item in metadata:
-                    if item["Name"] == "Amount":
-                        amount = item['Value']
-                    elif item["Name"] == "MpesaReceiptNumber":
-                        MpesaReceiptNumber = item['Value']
-                    elif item['Name'] == 'PhoneNumber':
-                        phone_number = item['Value']
-                    elif item['Name'] == 'TransactionDate':
-                        transaction_date = item['Value']
-    
-                intent = get_payment_intent(merchant_request_id)
-
-                if not intent:
-                    return Response({"error": "Unknown MerchantRequestID"}, status=404)
-
-                user_id = intent["user_id"]
-                room_id = intent["room_id"]
-                room_name = intent.get("room_name", "Unknown Room")  # Get room_name from cache
-                phone = intent["phone_number"]
-                
-                # Create transaction record
-                transaction = Transaction.objects.create(
-                    phone_number=phone_number or 'Unknown',
-                    amount=amount or 0,
-                    MpesaReceiptNumber=MpesaReceiptNumber,
-                    status='successful',  # Changed back to 'successful'
-                    description=result_desc,
-                    room_name=room_name,  # Store room_name in transaction
-                    timestamp=transaction_date,
-                    room_id=room_id
-                )
-                
-                # Update room member payment status if payment was successful
-                if result_code == 0 and room_id and phone:
-                    self.update_room_payment_status(room_id, user_id)
-                
-                return Response({'message': 'Callback processed'}, status=status.HTTP_200_OK)
-            return Response({'message': 'Payment failed or Cancellled by user'}, status=status.HTTP_200_OK)
+            validate_callback(data)
+        except (ValueError, InvalidCallback) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        except Exception as e:
-            print(e)
-            return Response({"error":str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    
-    def update_room_payment_status(self, room_id, user_id):
-        """Update the payment status for the room member based on phone number"""
         try:
-            try:
-                room = Room.objects.get(room_id=room_id)
-            except Room.DoesNotExist:
-                print(f"Room not found: {room_id}")
-                return
-            
-            # Update room member payment status
-            try:
-                room_member = RoomMember.objects.get(room=room, user_id=user_id)
-                room_member.payment_status = 'paid'
-                room_member.last_payment_date = timezone.now()
-                room_member.save()
-                print(f"Updated payment status for user {user_id} in room {room_id}")
-            except RoomMember.DoesNotExist:
-                print(f"Room member not found: user {user_id} in room {room_id}")
-                
+            enqueue_callback(data)
         except Exception as e:
-            print(f"Error updating room payment status: {e}")
-        
+            # Neither queue took it; a non-200 makes M-Pesa retry
+            logger.error(f"Could not queue M-Pesa callback: {e}")
+            return Response({"error": "Callback could not be queued"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({'message': 'Callback accepted'}, status=status.HTTP_200_OK)
+
+
+class TransactionPagination(KeysetPagination):
+    ordering = ('-timestamp', '-id')
 
 
 class TransactionListView(ListAPIView):
+    """
+    List transactions a page at a time, newest first, keyed on (timestamp, id).
+    Supports `cursor`, `limit` and a `fields` projection.
+    """
     permission_classes = []
     authentication_classes = []
-    queryset = Transaction.objects.all().order_by('timestamp')
+    queryset = Transaction.objects.all().order_by('-timestamp', '-id')
     serializer_class = TransactionSerializer
+    pagination_class = TransactionPagination
+
+    def get_serializer(self, *args, **kwargs):
+        fields = get_requested_fields(self.request, self.serializer_class().fields)
+        if fields:
+            kwargs['fields'] = fields
+        return super().get_serializer(*args, **kwargs)
     
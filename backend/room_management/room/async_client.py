@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import weakref
+from typing import Dict, Iterable, Optional
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+
+from room_management.service_client import auth_service
+
+from .authentication import JWTAuthentication
+from .cache_utils import get_user_cache, set_user_cache
+from .user_directory import lookup_usernames, store_usernames
+
+logger = logging.getLogger(__name__)
+
+# One pooled client per event loop: an AsyncClient cannot be shared across
+# loops, and sync servers running async views create a loop per request.
+# Each client is closed when its loop shuts down.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, tuple]" = weakref.WeakKeyDictionary()
+
+
+async def _close_with_loop(client: httpx.AsyncClient):
+    """
+    Parked for the life of the loop. asyncio.run, which also runs each
+    request's loop under a sync server, finalizes the async generators still
+    open before closing the loop, and that closes the client.
+    """
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+async def get_async_client() -> httpx.AsyncClient:
+    """Return the keep-alive HTTP client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(loop)
+    if entry is None:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.ASYNC_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.ASYNC_HTTP_MAX_CONNECTIONS
+            ),
+            base_url=settings.AUTH_SERVICE_URL,
+            timeout=httpx.Timeout(
+                settings.AUTH_SERVICE_READ_TIMEOUT,
+                connect=settings.AUTH_SERVICE_CONNECT_TIMEOUT
+            )
+        )
+        closer = _close_with_loop(client)
+        entry = _clients[loop] = (client, closer)
+        await closer.asend(None)
+    return entry[0]
+
+async def call_auth_service(method: str, path: str, **kwargs) -> httpx.Response:
+    """
+    Send a request to auth_services, sharing the sync client's circuit breaker
+    so both paths fail fast together while the service is down.
+    """
+    breaker = auth_service.breaker
+    if not breaker.allow():
+        raise httpx.ConnectError(f"Circuit for {auth_service.name} is open")
+    try:
+        client = await get_async_client()
+        response = await client.request(method, path, **kwargs)
+    except Exception:
+        breaker.record_failure()
+        raise
+    except BaseException:
+        # Cancelled: says nothing about the service, but ends a half-open trial
+        breaker.record_abandoned()
+        raise
+    if response.status_code in auth_service.RETRY_STATUSES:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+async def authenticate_token(token: str) -> str:
+    """
+    Async counterpart of JWTAuthentication.authenticate.
+
+    Returns:
+        str: The verified user id
+
+    Raises:
+        AuthenticationFailed: If the token is invalid or cannot be verified
+    """
+    if settings.JWT_VERIFICATION_MODE == 'local':
+        user, _ = await sync_to_async(JWTAuthentication().authenticate_locally, thread_sensitive=False)(token)
+        return user.id
+
+    cached_user_data = await sync_to_async(get_user_cache, thread_sensitive=False)(token)
+    if cached_user_data and cached_user_data.get('user_id'):
+        return cached_user_data['user_id']
+
+    try:
+        response = await call_auth_service(
+            'GET',
+            '/auth/verify/',
+            headers={'Authorization': f'Bearer {token}'}
+        )
+    except httpx.HTTPError as e:
+        logger.error(f"Request to auth service failed: {e}")
+        raise AuthenticationFailed('Authentication service unavailable')
+
+    if response.status_code != 200:
+        raise AuthenticationFailed('Invalid User')
+    user_id = response.json().get('user_id')
+    if not user_id:
+        raise AuthenticationFailed('User ID not found in response')
+
+    await sync_to_async(set_user_cache, thread_sensitive=False)(
+        token,
+        {'user_id': user_id, 'verified': True},
+        ttl=1800
+    )
+    return user_id
+
+async def get_usernames(user_ids: Iterable, token: str) -> Dict[str, Optional[str]]:
+    """Async counterpart of room.utils.get_usernames."""
+    ids = {str(user_id) for user_id in user_ids if user_id}
+    usernames = dict.fromkeys(ids)
+    found, missing = await sync_to_async(lookup_usernames, thread_sensitive=False)(ids)
+    usernames.update(found)
+    if not missing:
+        return usernames
+    try:
+        response = await call_auth_service(
+            'POST',
+            '/auth/info/bulk/',
+            headers={'Authorization': f'Bearer {token}'},
+            json={'user_ids': sorted(missing)}
+        )
+        if response.status_code == 200:
+            fetched = {
+                user_id: username
+                for user_id, username in response.json().get('users', {}).items()
+                if user_id in missing
+            }
+            usernames.update(fetched)
+            await sync_to_async(store_usernames, thread_sensitive=False)(fetched)
+    except httpx.HTTPError:
+        pass
+    return usernames
@@ -0,0 +1,196 @@
+"""
+Async versions of the room read endpoints, for deployment under ASGI.
+
+Token verification and the room data loading (DB queries plus the username
+lookup) run concurrently. Loading starts from the user id claimed by the
+unverified token, and nothing is returned unless verification confirms that
+same user id. The ETag check runs inside the load, so a 304 still skips the
+payload queries and the username lookup; the room detail checks membership
+first, so only members ever get one.
+"""
+
+import asyncio
+
+import jwt
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+from room_management.db_routers import is_pinned_to_primary, use_replica
+
+from .async_client import authenticate_token, get_usernames
+from .cache_utils import get_room_detail_cache, set_room_detail_cache, get_room_version_and_etag, get_user_rooms_etag
+from .models import RoomMember
+from .pagination import get_requested_fields
+from .utils import etag_matches
+from .views import ListUserRoomsView, RoomDetailView
+
+
+class NotModified(Exception):
+    def __init__(self, etag):
+        self.etag = etag
+
+
+class AsyncRoomView(View):
+    http_method_names = ['get']
+
+    @staticmethod
+    def get_token(request):
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            raise AuthenticationFailed('Invalid token')
+        return auth_header.split(' ')[1]
+
+    @staticmethod
+    def get_claimed_user_id(token):
+        """User id the token claims to belong to, before it is verified."""
+        try:
+            return str(jwt.decode(token, options={"verify_signature": False})['user_id'])
+        except (jwt.InvalidTokenError, KeyError):
+            raise AuthenticationFailed('Invalid token')
+
+    async def authenticate_and_load(self, request, load, room_id=None):
+        """
+        Run token verification concurrently with `load(user_id, token)`.
+        `room_id` is the room the load reads, if any, for the primary pin check.
+
+        Returns:
+            The result of `load`, or an HttpResponse for 401/304 outcomes.
+        """
+        try:
+            token = self.get_token(request)
+            claimed_user_id = self.get_claimed_user_id(token)
+            user_id, result = await asyncio.gather(
+                authenticate_token(token),
+                self.load_from_replica(load, claimed_user_id, token, room_id),
+                return_exceptions=True
+            )
+            # Verification decides first, so nothing about the load leaks
+            if isinstance(user_id, BaseException):
+                raise user_id
+            if str(user_id) != claimed_user_id:
+                raise AuthenticationFailed('Invalid User')
+            if isinstance(result, BaseException):
+                raise result
+            return result
+        except AuthenticationFailed as e:
+            return self.json({'detail': str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+        except NotModified as e:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = e.etag
+            return response
+
+    @staticmethod
+    async def load_from_replica(load, user_id, token, room_id=None):
+        pinned = await sync_to_async(is_pinned_to_primary, thread_sensitive=False)(room_id=room_id, user_id=user_id)
+        if pinned:
+            return await load(user_id, token)
+        with use_replica():
+            return await load(user_id, token)
+
+    @staticmethod
+    def json(data, status=status.HTTP_200_OK, etag=None):
+        response = JsonResponse(
+            data,
+            encoder=JSONEncoder,
+            status=status,
+            safe=False,
+            json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False}
+        )
+        if etag:
+            response['ETag'] = etag
+        return response
+
+
+class AsyncListUserRoomsView(AsyncRoomView):
+    """Async version of ListUserRoomsView with the same parameters and payload."""
+
+    async def get(self, request):
+        drf_request = Request(request)
+        fields = get_requested_fields(drf_request, ListUserRoomsView.room_fields) or ListUserRoomsView.room_fields
+
+        async def load(user_id, token):
+            etag = await sync_to_async(get_user_rooms_etag, thread_sensitive=False)(
+                user_id,
+                drf_request.query_params.urlencode()
+            )
+            if etag_matches(request, etag):
+                raise NotModified(etag)
+
+            user_room_members, paginator = await sync_to_async(ListUserRoomsView.get_page)(
+                drf_request, user_id, fields
+            )
+            usernames = {}
+            missing_ids = ListUserRoomsView.missing_owner_ids(user_room_members)
+            if 'owner_username' in fields and missing_ids:
+                usernames = await get_usernames(missing_ids, token)
+            rooms_data = ListUserRoomsView.serialize_rooms(user_room_members, fields, usernames)
+            total_rooms = await sync_to_async(ListUserRoomsView.count_rooms)(
+                drf_request, user_id, rooms_data, paginator
+            )
+            return self.json({
+                'rooms': rooms_data,
+                'total_rooms': total_rooms,
+                'next': paginator.get_next_link(),
+                'next_cursor': paginator.get_next_cursor()
+            }, etag=etag)
+
+        try:
+            return await self.authenticate_and_load(request, load)
+        except ValidationError as e:
+            return self.json(e.detail, status=status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncRoomDetailView(AsyncRoomView):
+    """
+    Async version of RoomDetailView. As there, membership and the user's role
+    and payment status are read fresh, before any conditional answer; only
+    the room-level payload comes from the cache.
+    """
+
+    async def get(self, request, room_id):
+        async def load(user_id, token):
+            room_member = await RoomMember.objects.filter(room_id=room_id, user_id=user_id).select_related('room').afirst()
+            if room_member is None:
+                return None, None, None
+
+            room_version, etag = await sync_to_async(get_room_version_and_etag, thread_sensitive=False)(
+                room_id, user_id
+            )
+            if etag_matches(request, etag):
+                raise NotModified(etag)
+
+            room_data = await sync_to_async(get_room_detail_cache, thread_sensitive=False)(room_id, room_version)
+            if room_data is None:
+                room = room_member.room
+                room_members = [member async for member in RoomMember.objects.filter(room_id=room_id)]
+                usernames = {}
+                missing_ids = RoomDetailView.missing_user_ids(room, room_members)
+                if missing_ids:
+                    usernames = await get_usernames(missing_ids, token)
+                room_data = RoomDetailView.serialize_room_data(room, room_members, usernames)
+                if RoomDetailView.names_resolved(missing_ids, usernames):
+                    await sync_to_async(set_room_detail_cache, thread_sensitive=False)(room_id, room_version, room_data)
+                else:
+                    etag = None
+            return room_member, room_data, etag
+
+        result = await self.authenticate_and_load(request, load, room_id=room_id)
+        if isinstance(result, HttpResponse):
+            return result
+
+        room_member, room_data, etag = result
+        if room_member is None:
+            return self.json(
+                {"error": "You are not a member of this room"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        room_data.update({
+            'user_role': room_member.role,
+            'user_payment_status': room_member.payment_status
+        })
+        return self.json(room_data, etag=etag)
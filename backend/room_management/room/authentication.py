@@ -6,7 +6,9 @@ from django.contrib.auth import get_user_model
 from uuid import UUID
 import requests
 import logging
-from .cache_utils import get_user_cache, set_user_cache, is_redis_available
+from .cache_utils import get_user_cache, set_user_cache
+from .revocation import RevocationListUnavailable, revocation_list
+from room_management.service_client import auth_service
 
 logger = logging.getLogger(__name__)
 
@@ -25,22 +27,21 @@ class JWTAuthentication(BaseAuthentication):
 
         token = auth_header.split(' ')[1]
 
+        if settings.JWT_VERIFICATION_MODE == 'local':
+            return self.authenticate_locally(token)
+
         try:
-            # First, try to get user data from Redis cache
-            if is_redis_available():
-                cached_user_data = get_user_cache(token)
-                if cached_user_data:
-                    user_id = cached_user_data.get('user_id')
-                    if user_id:
-                        user = SimpleUser(user_id)
-                        logger.info(f"User authenticated from cache: {user_id}")
-                        return (user, token)
+            # First, try the in-process cache tier, then Redis
+            cached_user_data = get_user_cache(token)
+            if cached_user_data:
+                user_id = cached_user_data.get('user_id')
+                if user_id:
+                    return (SimpleUser(user_id), token)
             
             # If not in cache or Redis is unavailable, fetch from auth service
-            response = requests.get(
-                'http://localhost:8000/auth/verify/',
-                headers={'Authorization': f'Bearer {token}'},
-                timeout=10  # Add timeout for security
+            response = auth_service.get(
+                '/auth/verify/',
+                headers={'Authorization': f'Bearer {token}'}
             )
             
             if response.status_code == 200:
@@ -50,13 +51,12 @@ class JWTAuthentication(BaseAuthentication):
                     raise AuthenticationFailed('User ID not found in response')
                 
                 # Cache the user data for future requests
-                if is_redis_available():
-                    user_cache_data = {
-                        'user_id': user_id,
-                        'verified': True
-                    }
-                    # Cache for 30 minutes to balance between performance and security
-                    set_user_cache(token, user_cache_data, ttl=1800)
+                user_cache_data = {
+                    'user_id': user_id,
+                    'verified': True
+                }
+                # Cache for 30 minutes to balance between performance and security
+                set_user_cache(token, user_cache_data, ttl=1800)
                 
                 user = SimpleUser(user_id)
                 logger.info(f"User authenticated from auth service: {user_id}")
@@ -74,3 +74,37 @@ class JWTAuthentication(BaseAuthentication):
         except Exception as e:
             logger.error(f"Unexpected authentication error: {e}")
             raise AuthenticationFailed('Authentication failed')
+
+    def authenticate_locally(self, token):
+        """
+        Verify the token's signature and expiry in-process with the key shared
+        with the auth service. The auth service is only involved through the
+        background-refreshed revocation list.
+        """
+        try:
+            payload = jwt.decode(
+                token,
+                settings.JWT_SIGNING_KEY,
+                algorithms=["HS256"],
+                options={"require": ["exp", "user_id"]}
+            )
+        except jwt.ExpiredSignatureError:
+            raise AuthenticationFailed('Token has expired')
+        except jwt.InvalidTokenError:
+            raise AuthenticationFailed('Invalid token')
+
+        try:
+            revoked = revocation_list.is_revoked(payload.get('jti'))
+        except RevocationListUnavailable as e:
+            # Same answer as remote verification with the auth service down
+            logger.error(f"Cannot check token revocation: {e}")
+            raise AuthenticationFailed('Authentication service unavailable')
+        if revoked:
+            raise AuthenticationFailed('Token has been revoked')
+
+        user_id = payload['user_id']
+        try:
+            UUID(user_id)
+        except (TypeError, ValueError):
+            raise AuthenticationFailed('Invalid user ID format')
+        return (SimpleUser(user_id), token)
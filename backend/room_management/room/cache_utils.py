@@ -1,48 +1,236 @@
 import redis
 import json
+import time
+import hashlib
+import threading
+import jwt
+from collections import OrderedDict
 from django.conf import settings
-from typing import Optional, Dict, Any
+from django.db import transaction
+from rest_framework.utils.encoders import JSONEncoder
+from room_management.db_routers import pin_to_primary
+from room_management.redis_client import get_redis_client, pipelined
+from .models import RoomMember
+from typing import Optional, Dict, Any, Iterable, List, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Redis client for user authentication caching
-redis_client = redis.StrictRedis(
-    host=settings.REDIS_HOST,
-    port=settings.REDIS_PORT,
-    db=settings.REDIS_DB,
-    decode_responses=True,
-    encoding='utf-8'
+# Shared Redis client for user authentication caching
+redis_client = get_redis_client()
+
+# Channels used to tell every worker process to drop a key from a local tier
+INVALIDATION_CHANNEL_PREFIX = 'invalidate:'
+USER_AUTH_INVALIDATION_CHANNEL = f'{INVALIDATION_CHANNEL_PREFIX}user_auth'
+
+
+class LocalTTLCache:
+    """
+    Bounded, thread-safe in-process LRU cache whose entries carry their own
+    expiry time. Used as the first tier in front of Redis.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class RedisHealth:
+    """
+    Circuit breaker tracking Redis health from the outcome of real commands.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    callers skip Redis entirely. A daemon thread then probes with PING,
+    backing off exponentially up to `max_backoff` seconds, and closes the
+    circuit once Redis answers again.
+    """
+
+    def __init__(self, failure_threshold: int, initial_backoff: float, max_backoff: float):
+        self.failure_threshold = failure_threshold
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self._failures = 0
+        self._open = False
+        self._lock = threading.Lock()
+        self._probe: Optional[threading.Thread] = None
+
+    def available(self) -> bool:
+        return not self._open
+
+    def record_success(self) -> None:
+        if self._failures or self._open:
+            with self._lock:
+                self._failures = 0
+                self._open = False
+
+    def record_failure(self, error: Exception) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._open or self._failures < self.failure_threshold:
+                return
+            self._open = True
+            logger.warning(f"Redis marked unavailable after {self._failures} failures: {error}")
+            if self._probe is None or not self._probe.is_alive():
+                self._probe = threading.Thread(target=self._run_probe, name='redis-health-probe', daemon=True)
+                self._probe.start()
+
+    def _run_probe(self) -> None:
+        backoff = self.initial_backoff
+        while self._open:
+            time.sleep(backoff)
+            try:
+                redis_client.ping()
+            except redis.exceptions.RedisError:
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            logger.info("Redis is available again")
+            self.record_success()
+
+
+redis_health = RedisHealth(
+    failure_threshold=settings.REDIS_FAILURE_THRESHOLD,
+    initial_backoff=settings.REDIS_PROBE_INITIAL_BACKOFF,
+    max_backoff=settings.REDIS_PROBE_MAX_BACKOFF
 )
 
+local_user_cache = LocalTTLCache(settings.AUTH_LOCAL_CACHE_SIZE)
+
+_local_caches: Dict[str, LocalTTLCache] = {USER_AUTH_INVALIDATION_CHANNEL: local_user_cache}
+_invalidation_listener: Optional[threading.Thread] = None
+_invalidation_listener_lock = threading.Lock()
+
+
+def _token_digest(token: str) -> str:
+    """Hash the token so raw JWTs never appear in cache keys."""
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+def _token_expiry(token: str) -> Optional[float]:
+    """Read the exp claim of a JWT without verifying it."""
+    try:
+        exp = jwt.decode(token, options={"verify_signature": False}).get('exp')
+        return float(exp) if exp is not None else None
+    except (jwt.InvalidTokenError, TypeError, ValueError):
+        return None
+
+def register_local_cache(channel: str, cache: LocalTTLCache) -> None:
+    """
+    Have the invalidation listener evict keys published on `channel` from
+    `cache`. Channels must start with INVALIDATION_CHANNEL_PREFIX.
+    """
+    _local_caches[channel] = cache
+
+def publish_invalidation(channel: str, key: str) -> None:
+    """Tell every worker process to drop `key` from the cache registered for `channel`."""
+    redis_client.publish(channel, key)
+
+def _listen_for_invalidations() -> None:
+    """Drop keys from the local tiers when any process invalidates them."""
+    while True:
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe(f"{INVALIDATION_CHANNEL_PREFIX}*")
+            while True:
+                # Poll rather than listen() so the pool's socket timeout
+                # does not turn an idle channel into a disconnect
+                message = pubsub.get_message(timeout=1.0)
+                if message and message.get('type') == 'pmessage':
+                    cache = _local_caches.get(message['channel'])
+                    if cache is not None:
+                        cache.delete(message['data'])
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Cache invalidation listener disconnected: {e}")
+            # Anything published while we were away is lost, so start clean
+            for cache in _local_caches.values():
+                cache.clear()
+            time.sleep(5)
+
+def start_invalidation_listener() -> None:
+    """Start this process's invalidation listener thread if it is not running."""
+    global _invalidation_listener
+    if _invalidation_listener is not None and _invalidation_listener.is_alive():
+        return
+    with _invalidation_listener_lock:
+        if _invalidation_listener is not None and _invalidation_listener.is_alive():
+            return
+        _invalidation_listener = threading.Thread(
+            target=_listen_for_invalidations,
+            name='cache-invalidation',
+            daemon=True
+        )
+        _invalidation_listener.start()
+
 def set_user_cache(token: str, user_data: Dict[str, Any], ttl: int = 3600) -> bool:
     """
-    Store user authentication data in Redis cache.
-    
+    Store user authentication data in both cache tiers.
+
     Args:
         token: JWT token to use as cache key
         user_data: User data to cache (must be JSON serializable)
-        ttl: Time to live in seconds (default: 1 hour)
-    
+        ttl: Time to live in seconds (default: 1 hour), capped at the token's expiry
+
     Returns:
         bool: True if successful, False otherwise
     """
     try:
         # Create a secure cache key by hashing the token
-        import hashlib
-        cache_key = f"user_auth:{hashlib.sha256(token.encode()).hexdigest()[:32]}"
-        
-        # Add timestamp to track cache creation
+        digest = _token_digest(token)
+        cache_key = f"user_auth:{digest}"
+
+        now = time.time()
+        expires_at = now + ttl
+        token_exp = _token_expiry(token)
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        if expires_at <= now:
+            return False
+
+        # Track cache creation and expiry so the local tier never outlives Redis
         cache_data = {
             **user_data,
-            '_cached_at': int(redis_client.time()[0])  # Redis server timestamp
+            '_cached_at': int(now),
+            '_expires_at': expires_at
         }
-        
-        redis_client.setex(cache_key, ttl, json.dumps(cache_data))
-        logger.info(f"User data cached successfully for user_id: {user_data.get('user_id')}")
+
+        local_user_cache.set(digest, cache_data, min(settings.AUTH_LOCAL_CACHE_TTL, expires_at - now))
+        if not redis_health.available():
+            return False
+        redis_client.setex(cache_key, max(1, int(expires_at - now)), json.dumps(cache_data))
+        redis_health.record_success()
+        logger.debug(f"User data cached successfully for user_id: {user_data.get('user_id')}")
         return True
-        
+
     except redis.exceptions.RedisError as e:
+        redis_health.record_failure(e)
         logger.error(f"Redis error while caching user data: {e}")
         return False
     except Exception as e:
@@ -51,27 +239,42 @@ def set_user_cache(token: str, user_data: Dict[str, Any], ttl: int = 3600) -> bo
 
 def get_user_cache(token: str) -> Optional[Dict[str, Any]]:
     """
-    Retrieve user authentication data from Redis cache.
-    
+    Retrieve user authentication data, trying the in-process tier before Redis.
+
     Args:
         token: JWT token to use as cache key
-    
+
     Returns:
         Dict containing user data if found, None otherwise
     """
     try:
-        import hashlib
-        cache_key = f"user_auth:{hashlib.sha256(token.encode()).hexdigest()[:32]}"
-        
-        cached_data = redis_client.get(cache_key)
+        start_invalidation_listener()
+        digest = _token_digest(token)
+
+        user_data = local_user_cache.get(digest)
+        if user_data is not None:
+            return user_data
+
+        if not redis_health.available():
+            return None
+        cached_data = redis_client.get(f"user_auth:{digest}")
+        redis_health.record_success()
         if cached_data:
             user_data = json.loads(cached_data)
-            logger.info(f"User data retrieved from cache for user_id: {user_data.get('user_id')}")
+            expires_at = user_data.get('_expires_at')
+            if expires_at is not None:
+                local_user_cache.set(
+                    digest,
+                    user_data,
+                    min(settings.AUTH_LOCAL_CACHE_TTL, expires_at - time.time())
+                )
+            logger.debug(f"User data retrieved from cache for user_id: {user_data.get('user_id')}")
             return user_data
-        
+
         return None
-        
+
     except redis.exceptions.RedisError as e:
+        redis_health.record_failure(e)
         logger.error(f"Redis error while retrieving user data: {e}")
         return None
     except json.JSONDecodeError as e:
@@ -83,43 +286,240 @@ def get_user_cache(token: str) -> Optional[Dict[str, Any]]:
 
 def invalidate_user_cache(token: str) -> bool:
     """
-    Remove user authentication data from Redis cache.
-    
+    Remove user authentication data from both tiers in every worker process.
+
     Args:
         token: JWT token to use as cache key
-    
+
     Returns:
         bool: True if successful, False otherwise
     """
+    digest = _token_digest(token)
+    local_user_cache.delete(digest)
     try:
-        import hashlib
-        cache_key = f"user_auth:{hashlib.sha256(token.encode()).hexdigest()[:32]}"
-        
-        result = redis_client.delete(cache_key)
+        result = redis_client.delete(f"user_auth:{digest}")
+        publish_invalidation(USER_AUTH_INVALIDATION_CHANNEL, digest)
+        redis_health.record_success()
         if result:
             logger.info("User cache invalidated successfully")
         else:
             logger.info("No cache found to invalidate")
         return True
-        
+
     except redis.exceptions.RedisError as e:
+        redis_health.record_failure(e)
         logger.error(f"Redis error while invalidating user cache: {e}")
         return False
     except Exception as e:
         logger.error(f"Unexpected error while invalidating user cache: {e}")
         return False
 
-def is_redis_available() -> bool:
+# Bump when the shape of the cached room detail payload changes
+ROOM_DETAIL_CACHE_VERSION = 1
+
+def _room_detail_key(room_id, room_version) -> str:
+    return f"room_detail:v{ROOM_DETAIL_CACHE_VERSION}:{room_id}:{room_version}"
+
+def get_room_detail_cache(room_id, room_version) -> Optional[Dict[str, Any]]:
     """
-    Check if Redis is available and responding.
-    
+    Retrieve the cached room-level part of a room detail payload.
+
+    Payloads are keyed on the room's version counter as read before they
+    were built. A payload built from the database before a write commits
+    is stored under the old version, which no reader asks for once the
+    write's invalidation has bumped the counter.
+
+    Args:
+        room_id: Room whose payload to fetch
+        room_version: The room's current version, None if Redis is unavailable
+
     Returns:
-        bool: True if Redis is available, False otherwise
+        Dict containing the room fields and member list if cached, None otherwise
+    """
+    if room_version is None or not redis_health.available():
+        return None
+    try:
+        cached_data = redis_client.get(_room_detail_key(room_id, room_version))
+        redis_health.record_success()
+        return json.loads(cached_data) if cached_data else None
+    except redis.exceptions.RedisError as e:
+        redis_health.record_failure(e)
+        logger.error(f"Redis error while retrieving room detail: {e}")
+        return None
+    except json.JSONDecodeError as e:
+        logger.error(f"JSON decode error while retrieving room detail: {e}")
+        return None
+
+def set_room_detail_cache(room_id, room_version, room_data: Dict[str, Any], ttl: Optional[int] = None) -> bool:
     """
+    Store the room-level part of a room detail payload.
+
+    Args:
+        room_id: Room the payload belongs to
+        room_version: The room's version read before the payload was built
+        room_data: Room fields and member list, without per-user fields
+        ttl: Time to live in seconds (default: ROOM_DETAIL_CACHE_TTL)
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    if room_version is None or not redis_health.available():
+        return False
     try:
-        redis_client.ping()
+        redis_client.setex(
+            _room_detail_key(room_id, room_version),
+            ttl or settings.ROOM_DETAIL_CACHE_TTL,
+            json.dumps(room_data, cls=JSONEncoder)
+        )
+        redis_health.record_success()
         return True
-    except redis.exceptions.RedisError:
+    except redis.exceptions.RedisError as e:
+        redis_health.record_failure(e)
+        logger.error(f"Redis error while caching room detail: {e}")
         return False
-    except Exception:
-        return False
\ No newline at end of file
+
+def _room_version_key(room_id) -> str:
+    return f"room_version:{room_id}"
+
+def _user_rooms_version_key(user_id) -> str:
+    return f"user_rooms_version:{user_id}"
+
+def invalidate_room_cache(room_id, user_ids: Iterable = ()) -> bool:
+    """
+    Bump the version counters the room and user-room-list ETags and the room
+    detail cache key are computed from, which retires the cached payload;
+    it expires on its own. With a read replica the
+    room and users are also pinned to the primary for a few seconds, so their
+    next reads cannot come from a replica that lags the write. If Redis is unreachable
+    the cached payload stays current until its TTL, which bounds how stale it
+    can get.
+
+    Args:
+        room_id: Room whose payload changed
+        user_ids: Users whose room list changed as a result
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    return invalidate_room_caches({room_id: user_ids})
+
+def invalidate_room_caches(user_ids_by_room: Dict[Any, Iterable]) -> bool:
+    """
+    invalidate_room_cache for many rooms in a single round trip.
+
+    Args:
+        user_ids_by_room: Users whose room list changed, keyed by room id
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        with pipelined() as pipe:
+            user_ids = set()
+            for room_id, room_user_ids in user_ids_by_room.items():
+                pipe.incr(_room_version_key(room_id))
+                user_ids.update(map(str, room_user_ids))
+            for user_id in user_ids:
+                pipe.incr(_user_rooms_version_key(user_id))
+            pin_to_primary(pipe, user_ids_by_room, user_ids)
+        redis_health.record_success()
+        return True
+    except redis.exceptions.RedisError as e:
+        redis_health.record_failure(e)
+        logger.error(f"Redis error while invalidating room detail: {e}")
+        return False
+
+def invalidate_room_cache_on_commit(room_id, user_ids: Optional[Iterable] = None,
+                                    members_after_commit: bool = False) -> None:
+    """
+    Invalidate the room detail cache once the current transaction commits.
+    A concurrent reader that built the payload from the pre-commit state
+    stores it under the version it read first, which this retires.
+
+    When `user_ids` is omitted every current member's room list is treated
+    as changed; call it before deleting members so they are included. With
+    `members_after_commit` the members are read after the commit instead,
+    which keeps the read out of the transaction and includes members it
+    added.
+    """
+    if user_ids is None:
+        members = RoomMember.objects.filter(room_id=room_id).values_list('user_id', flat=True)
+        if members_after_commit:
+            transaction.on_commit(lambda: invalidate_room_cache(room_id, list(members)))
+            return
+        user_ids = members
+    user_ids = list(user_ids)
+    transaction.on_commit(lambda: invalidate_room_cache(room_id, user_ids))
+
+def _get_versions(keys: List[str]) -> Optional[List[str]]:
+    """
+    Read version counters, seeding missing ones.
+
+    A missing counter is seeded with the current time in milliseconds rather
+    than zero, so counters lost in a Redis flush never repeat old values and
+    stale ETags cannot match again.
+    """
+    if not redis_health.available():
+        return None
+    try:
+        versions = redis_client.mget(keys)
+        missing = [key for key, version in zip(keys, versions) if version is None]
+        if missing:
+            seed = int(time.time() * 1000)
+            with pipelined() as pipe:
+                for key in missing:
+                    pipe.set(key, seed, nx=True)
+                    pipe.get(key)
+            seeded = dict(zip(missing, pipe.results[1::2]))
+            versions = [seeded.get(key, version) for key, version in zip(keys, versions)]
+        redis_health.record_success()
+        return versions
+    except redis.exceptions.RedisError as e:
+        redis_health.record_failure(e)
+        logger.error(f"Redis error while reading version counters: {e}")
+        return None
+
+def _make_etag(*parts) -> str:
+    digest = hashlib.sha1(":".join(map(str, parts)).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+def get_room_version_and_etag(room_id, user_id) -> Tuple[Optional[str], Optional[str]]:
+    """
+    The room's version counter and a weak ETag for a user's view of the
+    room, computed from version counters only. The user's room-list version
+    is included so leaving or joining the room changes the tag as well.
+
+    Returns:
+        tuple: (room version, ETag), both None if Redis is unavailable
+    """
+    versions = _get_versions([_room_version_key(room_id), _user_rooms_version_key(user_id)])
+    if versions is None:
+        return None, None
+    return versions[0], _make_etag(ROOM_DETAIL_CACHE_VERSION, room_id, user_id, *versions)
+
+def get_user_rooms_etag(user_id, variant: str = '') -> Optional[str]:
+    """
+    Weak ETag for a user's room list. Every change to a room bumps the list
+    version of all its members, so this single counter covers the whole list.
+
+    Args:
+        user_id: User whose room list is requested
+        variant: Anything else the response depends on, e.g. the query string
+
+    Returns:
+        str: The ETag, or None if Redis is unavailable
+    """
+    versions = _get_versions([_user_rooms_version_key(user_id)])
+    if versions is None:
+        return None
+    return _make_etag(user_id, variant, *versions)
+
+def is_redis_available() -> bool:
+    """
+    Check if Redis is considered available by the health tracker.
+    This does not touch the network; health is derived from real commands.
+
+    Returns:
+        bool: True if Redis is available, False otherwise
+    """
+    return redis_health.available()
@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+import httpx
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare latency of the sync and async room read endpoints under "
+        "concurrent load. Run it against a server started under ASGI, e.g. "
+        "`uvicorn room_management.asgi:application --port 8080`, so the async "
+        "views run on an event loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8080')
+        parser.add_argument('--token', required=True, help='JWT of a user who is a member of --room-id')
+        parser.add_argument('--room-id', help='Also benchmark the room detail endpoints')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=50)
+
+    def handle(self, *args, **options):
+        endpoints = [
+            ('sync list', '/room/list/'),
+            ('async list', '/room/async/list/'),
+        ]
+        if options['room_id']:
+            endpoints += [
+                ('sync detail', f"/room/{options['room_id']}/"),
+                ('async detail', f"/room/async/{options['room_id']}/"),
+            ]
+
+        self.stdout.write(
+            f"{'endpoint':<14}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}{'errors':>8}"
+        )
+        for name, path in endpoints:
+            latencies, errors, elapsed = asyncio.run(self.run_load(options, path))
+            self.stdout.write(
+                f"{name:<14}{self.percentile(latencies, 50):>10.1f}{self.percentile(latencies, 99):>10.1f}"
+                f"{len(latencies) / elapsed:>10.1f}{errors:>8}"
+            )
+
+    async def run_load(self, options, path):
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        latencies = []
+        errors = 0
+        headers = {'Authorization': f"Bearer {options['token']}"}
+
+        async with httpx.AsyncClient(
+            base_url=options['base_url'],
+            headers=headers,
+            limits=httpx.Limits(max_connections=options['concurrency']),
+            timeout=30
+        ) as client:
+            async def one_request():
+                nonlocal errors
+                async with semaphore:
+                    start = time.perf_counter()
+                    try:
+                        response = await client.get(path)
+                    except httpx.HTTPError:
+                        errors += 1
+                        return
+                    if response.status_code != 200:
+                        errors += 1
+                        return
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+            # Warm up connections and caches before measuring
+            await asyncio.gather(*(one_request() for _ in range(options['concurrency'])))
+            latencies.clear()
+            errors = 0
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one_request() for _ in range(options['requests'])))
+            return latencies, errors, time.perf_counter() - start
+
+    @staticmethod
+    def percentile(values, pct):
+        if not values:
+            return float('nan')
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+        return ordered[index]
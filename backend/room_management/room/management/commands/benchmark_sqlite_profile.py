@@ -0,0 +1,161 @@
+import datetime
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from payments.models import Transaction
+from room.models import Room, RoomMember
+from room_management.database import SQLITE_PROFILES, sqlite_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare SQLite profiles (DB_SQLITE_PROFILE) under concurrent load. "
+        "For each profile a scratch database is created and worker threads "
+        "run the database work of the room join and M-Pesa callback paths, "
+        "while readers run the room list query."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', choices=SQLITE_PROFILES + ('both',), default='both')
+        parser.add_argument('--rooms', type=int, default=50)
+        parser.add_argument('--writers', type=int, default=8, help='Threads per write path')
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--operations', type=int, default=200, help='Operations per thread')
+
+    def handle(self, *args, **options):
+        profiles = SQLITE_PROFILES if options['profile'] == 'both' else (options['profile'],)
+        self.stdout.write(
+            f"{'profile':<13}{'path':<10}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}"
+        )
+        for profile in profiles:
+            workdir = Path(tempfile.mkdtemp(prefix='sqlite-bench-'))
+            alias = f"bench_{profile}"
+            try:
+                self.add_database(alias, sqlite_settings(str(workdir / 'bench.sqlite3'), profile))
+                room_ids = self.setup(alias, options['rooms'])
+                for path, result in self.run_load(alias, room_ids, options).items():
+                    latencies, errors, elapsed = result
+                    self.stdout.write(
+                        f"{profile:<13}{path:<10}{len(latencies) / elapsed:>10.1f}"
+                        f"{self.percentile(latencies, 50):>10.1f}{self.percentile(latencies, 99):>10.1f}{errors:>8}"
+                    )
+            finally:
+                connections[alias].close()
+                del connections.settings[alias]
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    @staticmethod
+    def add_database(alias, config):
+        # Fill in the defaults Django applies to configured databases
+        connections.settings[alias] = connections.configure_settings({'default': config})['default']
+
+    @staticmethod
+    def setup(alias, room_count):
+        call_command('migrate', database=alias, run_syncdb=True, verbosity=0)
+        rooms = [
+            Room(
+                owner_id=str(uuid.uuid4()),
+                cost='10.00',
+                service_type='netflix',
+                name=f"Bench room {i}",
+                description='Benchmark',
+                due_date=datetime.date.today(),
+                member_count=1
+            )
+            for i in range(room_count)
+        ]
+        Room.objects.using(alias).bulk_create(rooms)
+        RoomMember.objects.using(alias).bulk_create(
+            RoomMember(room=room, user_id=room.owner_id, role='owner', payment_status='paid')
+            for room in rooms
+        )
+        return [room.room_id for room in rooms]
+
+    def run_load(self, alias, room_ids, options):
+        operations = options['operations']
+        paths = {
+            'join': (options['writers'], self.join),
+            'callback': (options['writers'], self.callback),
+            'list': (options['readers'], self.list_rooms),
+        }
+        results = {path: ([], [0]) for path in paths}
+        lock = threading.Lock()
+
+        def worker(path, operation, seed):
+            latencies, errors = results[path]
+            try:
+                for i in range(operations):
+                    room_id = room_ids[(seed + i) % len(room_ids)]
+                    started = time.perf_counter()
+                    try:
+                        operation(alias, room_id)
+                    except OperationalError:
+                        # "database is locked" once the busy timeout expires
+                        with lock:
+                            errors[0] += 1
+                        continue
+                    with lock:
+                        latencies.append((time.perf_counter() - started) * 1000)
+            finally:
+                connections[alias].close()
+
+        threads = [
+            threading.Thread(target=worker, args=(path, operation, seed))
+            for path, (count, operation) in paths.items()
+            for seed in range(count)
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        return {path: (latencies, errors[0], elapsed) for path, (latencies, errors) in results.items()}
+
+    @staticmethod
+    def join(alias, room_id):
+        """The writes of JoinRoomView: claim a place in the room and add the member."""
+        with transaction.atomic(using=alias):
+            Room.objects.using(alias).filter(room_id=room_id).update(member_count=F('member_count') + 1)
+            RoomMember.objects.using(alias).create(room_id=room_id, user_id=uuid.uuid4())
+
+    @staticmethod
+    def callback(alias, room_id):
+        """The writes of MpesaCallbackView: record the payment and mark the member paid."""
+        with transaction.atomic(using=alias):
+            Transaction.objects.using(alias).create(
+                phone_number='254700000000',
+                amount='10.00',
+                MpesaReceiptNumber=uuid.uuid4().hex[:20],
+                status='successful',
+                room_id=str(room_id)
+            )
+            RoomMember.objects.using(alias).filter(room_id=room_id, role='owner').update(
+                payment_status='paid',
+                last_payment_date=timezone.now()
+            )
+
+    @staticmethod
+    def list_rooms(alias, room_id):
+        """The query of ListUserRoomsView."""
+        owner_id = Room.objects.using(alias).values_list('owner_id', flat=True).get(room_id=room_id)
+        list(RoomMember.objects.using(alias).filter(user_id=owner_id).select_related('room')[:50])
+
+    @staticmethod
+    def percentile(values, pct):
+        if not values:
+            return 0.0
+        if len(values) == 1:
+            return values[0]
+        return statistics.quantiles(values, n=100)[min(pct, 99) - 1]
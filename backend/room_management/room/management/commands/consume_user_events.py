@@ -0,0 +1,94 @@
+import os
+import socket
+import time
+from collections import defaultdict
+
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from room.cache_utils import invalidate_room_cache
+from room.models import Room, RoomMember
+from room.user_directory import update_username
+from room_management.redis_client import create_blocking_client
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply user events published by auth_services (USER_EVENTS_STREAM) "
+        "to the user directory, the denormalized usernames on rooms and room "
+        "members, and the room caches that show them. "
+        "Runs until interrupted; start one or more alongside the web workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumer', default=f"{socket.gethostname()}-{os.getpid()}")
+        parser.add_argument('--count', type=int, default=100, help='Events read per batch')
+        parser.add_argument('--block', type=int, default=5000, help='Milliseconds to wait for events')
+
+    def handle(self, *args, **options):
+        stream = settings.USER_EVENTS_STREAM
+        group = settings.USER_EVENTS_GROUP
+        # The shared client's socket timeout is shorter than the block
+        self.redis = create_blocking_client(options['block'] / 1000)
+        group_ready = False
+        backoff = 1
+        # Re-read our own pending events first, so events read before a
+        # crash but not acknowledged are applied again
+        last_id = '0'
+        while True:
+            try:
+                if not group_ready:
+                    self.create_group(stream, group)
+                    group_ready = True
+                response = self.redis.xreadgroup(
+                    group,
+                    options['consumer'],
+                    {stream: last_id},
+                    count=options['count'],
+                    block=options['block']
+                )
+                events = response[0][1] if response else []
+                if last_id == '0' and not events:
+                    last_id = '>'
+                    continue
+
+                for event_id, fields in events:
+                    self.apply(fields)
+                    self.redis.xack(stream, group, event_id)
+                backoff = 1
+            except redis.exceptions.RedisError as e:
+                self.stderr.write(f"Redis unavailable, retrying in {backoff}s: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                group_ready = False
+                last_id = '0'
+
+    def create_group(self, stream, group):
+        try:
+            self.redis.xgroup_create(stream, group, id='0', mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def apply(self, event):
+        if event.get('type') != 'username_changed':
+            return
+        user_id = event['user_id']
+        username = event['username']
+        update_username(user_id, username)
+        with transaction.atomic():
+            RoomMember.objects.filter(user_id=user_id).update(username=username)
+            Room.objects.filter(owner_id=user_id).update(owner_username=username)
+
+        # Room payloads and room lists embed usernames, so invalidate every
+        # room the user is in or owns, and its members' room lists
+        room_ids = set(RoomMember.objects.filter(user_id=user_id).values_list('room_id', flat=True))
+        room_ids.update(Room.objects.filter(owner_id=user_id).values_list('room_id', flat=True))
+        members = defaultdict(list)
+        for room_id, member_id in RoomMember.objects.filter(room_id__in=room_ids).values_list('room_id', 'user_id'):
+            members[room_id].append(member_id)
+        for room_id in room_ids:
+            invalidate_room_cache(room_id, members[room_id])
+        self.stdout.write(f"Applied username change for {user_id} ({len(room_ids)} rooms)")
@@ -0,0 +1,117 @@
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from room.cache_utils import invalidate_room_cache_on_commit
+from room.models import Room, RoomMember
+from room.user_directory import store_usernames
+from room.utils import fetch_usernames_internal
+
+
+class Command(BaseCommand):
+    help = (
+        "Detect and repair drift in the denormalized Room.member_count, "
+        "Room.owner_username and RoomMember.username columns. Member counts "
+        "are recomputed from room_members; usernames are compared with "
+        "auth_services."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without repairing it')
+        parser.add_argument('--skip-usernames', action='store_true',
+                            help='Only reconcile member counts, without calling auth_services')
+
+    def handle(self, *args, **options):
+        self.batch_size = max(1, min(options['batch_size'], 500))
+        self.dry_run = options['dry_run']
+        self.changed_rooms = set()
+        started = time.monotonic()
+
+        counts_fixed = self.reconcile_member_counts()
+        self.stdout.write(f"Rooms with a wrong member_count: {counts_fixed}")
+        if not options['skip_usernames']:
+            members_fixed, rooms_fixed = self.reconcile_usernames()
+            self.stdout.write(f"Members with a stale username: {members_fixed}")
+            self.stdout.write(f"Rooms with a stale owner_username: {rooms_fixed}")
+
+        if not self.dry_run:
+            for room_id in self.changed_rooms:
+                invalidate_room_cache_on_commit(room_id)
+        verb = 'Found' if self.dry_run else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} drift in {len(self.changed_rooms)} rooms in {time.monotonic() - started:.1f}s"
+        ))
+
+    def reconcile_member_counts(self):
+        fixed = 0
+        last_room_id = None
+        while True:
+            rooms = Room.objects.order_by('room_id').annotate(actual_count=Count('members'))
+            if last_room_id is not None:
+                rooms = rooms.filter(room_id__gt=last_room_id)
+            batch = list(rooms.only('room_id', 'member_count')[:self.batch_size])
+            if not batch:
+                return fixed
+            last_room_id = batch[-1].room_id
+
+            drifted = [room for room in batch if room.member_count != room.actual_count]
+            for room in drifted:
+                room.member_count = room.actual_count
+                self.changed_rooms.add(room.room_id)
+            if drifted and not self.dry_run:
+                Room.objects.bulk_update(drifted, ['member_count'])
+            fixed += len(drifted)
+
+    def reconcile_usernames(self):
+        members_fixed = rooms_fixed = 0
+        user_ids = (
+            RoomMember.objects.order_by('user_id')
+            .values_list('user_id', flat=True)
+            .distinct()
+            .iterator(chunk_size=self.batch_size)
+        )
+        batch = []
+        for user_id in user_ids:
+            batch.append(user_id)
+            if len(batch) == self.batch_size:
+                fixed = self.reconcile_username_batch(batch)
+                members_fixed, rooms_fixed = members_fixed + fixed[0], rooms_fixed + fixed[1]
+                batch = []
+        if batch:
+            fixed = self.reconcile_username_batch(batch)
+            members_fixed, rooms_fixed = members_fixed + fixed[0], rooms_fixed + fixed[1]
+        return members_fixed, rooms_fixed
+
+    def reconcile_username_batch(self, user_ids):
+        try:
+            usernames = fetch_usernames_internal(user_ids)
+        except requests.RequestException as e:
+            raise CommandError(f"Auth service lookup failed: {e}")
+        if not self.dry_run:
+            store_usernames(usernames)
+
+        stale_members = [
+            (room_id, str(user_id))
+            for room_id, user_id, username in RoomMember.objects.filter(user_id__in=user_ids)
+            .values_list('room_id', 'user_id', 'username')
+            if str(user_id) in usernames and username != usernames[str(user_id)]
+        ]
+        stale_rooms = [
+            (room_id, owner_id)
+            for room_id, owner_id, owner_username in Room.objects.filter(owner_id__in=list(usernames))
+            .values_list('room_id', 'owner_id', 'owner_username')
+            if owner_username != usernames[owner_id]
+        ]
+        self.changed_rooms.update(room_id for room_id, _ in stale_members + stale_rooms)
+
+        if not self.dry_run:
+            with transaction.atomic():
+                for user_id in {user_id for _, user_id in stale_members}:
+                    RoomMember.objects.filter(user_id=user_id).update(username=usernames[user_id])
+                for owner_id in {owner_id for _, owner_id in stale_rooms}:
+                    Room.objects.filter(owner_id=owner_id).update(owner_username=usernames[owner_id])
+        return len(stale_members), len(stale_rooms)
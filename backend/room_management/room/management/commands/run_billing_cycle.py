@@ -0,0 +1,118 @@
+import calendar
+import datetime
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from room.cache_utils import invalidate_room_caches
+from room.models import Room, RoomMember
+
+
+def add_months(date, months, day=None):
+    """
+    `day` (default the date's own day) `months` later, clamped to the end
+    of shorter months.
+    """
+    month_index = date.month - 1 + months
+    year, month = date.year + month_index // 12, month_index % 12 + 1
+    return date.replace(year=year, month=month, day=min(day or date.day, calendar.monthrange(year, month)[1]))
+
+def next_due_date(due_date, as_of, billing_day=None):
+    """
+    First monthly due date on or after `as_of`. Falls on `billing_day`
+    where the month has it, so a clamped date (Jan 31 -> Feb 28) does not
+    pull later cycles back to the 28th.
+    """
+    months = 1
+    while add_months(due_date, months, billing_day) < as_of:
+        months += 1
+    return add_months(due_date, months, billing_day)
+
+
+class Command(BaseCommand):
+    help = (
+        "Close the billing cycle of every room whose due date has passed: "
+        "members who did not pay become overdue, members who paid go back "
+        "to pending (owners stay paid), and the due date moves to the next "
+        "monthly cycle. Rooms are processed in chunks, each in one "
+        "transaction of set-based UPDATEs; a rolled room no longer matches, "
+        "so an interrupted run can simply be started again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Close cycles due before this date (YYYY-MM-DD, default today)')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rooms that would roll')
+
+    def handle(self, *args, **options):
+        try:
+            as_of = datetime.date.fromisoformat(options['date']) if options['date'] else timezone.localdate()
+        except ValueError:
+            raise CommandError("--date must be YYYY-MM-DD")
+
+        due_rooms = Room.objects.filter(due_date__lt=as_of).order_by('due_date', 'room_id')
+        if options['dry_run']:
+            self.stdout.write(f"{due_rooms.count()} rooms are due before {as_of}")
+            return
+
+        started = time.monotonic()
+        rooms = overdue = reset = chunks = 0
+        while True:
+            # Rolled rooms drop out of the filter, so the first chunk is always the next one
+            chunk = list(due_rooms.values_list('room_id', 'due_date', 'billing_day')[:options['chunk_size']])
+            if not chunk:
+                break
+            chunk_rooms, chunk_overdue, chunk_reset = self.close_cycle(chunk, as_of)
+            rooms += chunk_rooms
+            overdue += chunk_overdue
+            reset += chunk_reset
+            chunks += 1
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled {rooms} rooms in {chunks} chunks ({rooms / elapsed if elapsed else 0:.0f} rooms/s): "
+            f"{overdue} members overdue, {reset} members back to pending in {elapsed:.1f}s"
+        ))
+
+    def close_cycle(self, chunk, as_of):
+        """
+        Roll the chunk's rooms, then update the members of the rooms that
+        rolled. A room whose due date changed since the chunk was read is
+        left alone, so its members are not billed for a cycle it did not
+        close.
+        """
+        room_ids = [room_id for room_id, _, _ in chunk]
+        rooms_by_due_date = defaultdict(list)
+        for room_id, due_date, billing_day in chunk:
+            # Rooms created before billing_day existed keep their current day
+            rooms_by_due_date[due_date, billing_day or due_date.day].append(room_id)
+
+        with transaction.atomic():
+            # Locked, so the due dates read here are the ones the UPDATEs match
+            current_due_dates = dict(
+                Room.objects.select_for_update().filter(room_id__in=room_ids).values_list('room_id', 'due_date')
+            )
+            rolled_ids = []
+            for (due_date, billing_day), due_room_ids in rooms_by_due_date.items():
+                matched_ids = [room_id for room_id in due_room_ids if current_due_dates.get(room_id) == due_date]
+                if not matched_ids:
+                    continue
+                Room.objects.filter(room_id__in=matched_ids).update(
+                    due_date=next_due_date(due_date, as_of, billing_day),
+                    billing_day=billing_day
+                )
+                rolled_ids.extend(matched_ids)
+
+            members = RoomMember.objects.filter(room_id__in=rolled_ids).exclude(role='owner')
+            # Non-payers first, so members reset to pending below are not caught
+            overdue = members.filter(payment_status='pending').update(payment_status='overdue')
+            reset = members.filter(payment_status='paid').update(payment_status='pending')
+
+            user_ids_by_room = {room_id: [] for room_id in rolled_ids}
+            for room_id, user_id in RoomMember.objects.filter(room_id__in=rolled_ids).values_list('room_id', 'user_id'):
+                user_ids_by_room[room_id].append(user_id)
+            transaction.on_commit(lambda: invalidate_room_caches(user_ids_by_room))
+        return len(rolled_ids), overdue, reset
@@ -0,0 +1,54 @@
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from room.models import RoomMember
+from room.user_directory import store_usernames
+from room.utils import fetch_usernames_internal
+
+
+class Command(BaseCommand):
+    help = (
+        "Preload the user directory with the username of every user in "
+        "room_members, fetched from auth_services in bulk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='User ids per auth service call (at most 500)')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, min(options['batch_size'], 500))
+        user_ids = (
+            RoomMember.objects.order_by('user_id')
+            .values_list('user_id', flat=True)
+            .distinct()
+            .iterator(chunk_size=batch_size)
+        )
+
+        started = time.monotonic()
+        requested = stored = 0
+        batch = []
+        for user_id in user_ids:
+            batch.append(user_id)
+            if len(batch) == batch_size:
+                stored += self.warm(batch)
+                requested += len(batch)
+                batch = []
+        if batch:
+            stored += self.warm(batch)
+            requested += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Cached {stored} of {requested} usernames in {time.monotonic() - started:.1f}s"
+        ))
+
+    def warm(self, user_ids):
+        try:
+            usernames = fetch_usernames_internal(user_ids)
+        except requests.RequestException as e:
+            raise CommandError(f"Auth service lookup failed: {e}")
+        if not store_usernames(usernames):
+            raise CommandError("Could not write to the user directory; is Redis available?")
+        return len(usernames)
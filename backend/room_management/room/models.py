@@ -1,6 +1,7 @@
 # Create your models here.
 # rooms/models.py
 import uuid
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 
 class Room(models.Model):
@@ -21,6 +22,29 @@ class Room(models.Model):
     description = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     due_date = models.DateField()  # Next billing date
+    # Day of the month the room bills on, taken from the first due date;
+    # due_date is clamped in shorter months and goes back to this day after
+    billing_day = models.PositiveSmallIntegerField(
+        null=True, blank=True, validators=[MinValueValidator(1), MaxValueValidator(31)]
+    )
+    # Denormalized so room reads need neither a COUNT nor the auth service;
+    # maintained by the join/leave/remove views and reconcile_room_denormalization.
+    # 0 only on rooms from before the column; joins count their members
+    owner_username = models.CharField(max_length=150, blank=True, default='')
+    member_count = models.PositiveIntegerField(default=0)
+    # Maximum number of members, owner included; unlimited when empty
+    capacity = models.PositiveIntegerField(null=True, blank=True, validators=[MinValueValidator(1)])
+
+    class Meta:
+        indexes = [
+            # Billing runs walk overdue rooms in (due_date, room_id) order
+            models.Index(fields=['due_date', 'room_id']),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.billing_day is None and self.due_date:
+            self.billing_day = self.due_date.day
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return str(self.room_id)
@@ -39,6 +63,7 @@ class RoomMember(models.Model):
 
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='members', db_index=True)
     user_id = models.UUIDField(db_index=True)  # Changed to UUIDField since we're using UUIDs
+    username = models.CharField(max_length=150, blank=True, default='')  # Denormalized from auth_services
     join_date = models.DateTimeField(auto_now_add=True)
     role = models.CharField(max_length=20, choices=MEMBER_ROLES, default='member')
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS, default='pending')
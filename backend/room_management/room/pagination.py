@@ -0,0 +1,149 @@
+import base64
+import json
+from datetime import date, datetime
+from uuid import UUID
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a composite, unique key.
+
+    Unlike offset pagination the cost of a page does not grow with its
+    position: each page is a single indexed range query starting after the
+    last key of the previous page, e.g. WHERE (a > x) OR (a = x AND b > y).
+    The last field of `ordering` must be unique to break ties. A field
+    prefixed with '-' is walked in descending order.
+    """
+    ordering = ()
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+
+    def __init__(self, ordering=None, page_size=None):
+        if ordering is not None:
+            self.ordering = ordering
+        if page_size is not None:
+            self.page_size = page_size
+        self.request = None
+        self.next_key = None
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, key):
+        raw = json.dumps([self._serialize(value) for value in key]).encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    def decode_cursor(self, cursor, model):
+        """
+        Decode a cursor into its key, each value converted by the model field
+        it is compared with, so a tampered cursor is a 400 rather than an
+        error while the query is built.
+        """
+        try:
+            key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if not isinstance(key, list) or len(key) != len(self.ordering):
+                raise ValueError(cursor)
+            key = [
+                self._get_field(model, field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, key)
+            ]
+            # Keys are never null; a range lookup against None cannot be built
+            if None in key:
+                raise ValueError(cursor)
+            return key
+        except (DjangoValidationError, TypeError, ValueError):
+            raise ValidationError({self.cursor_query_param: 'Invalid cursor'})
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.next_key = None
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self._after(self.decode_cursor(cursor, queryset.model)))
+
+        page = list(queryset[:page_size + 1])
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_key = [self._get_value(page[-1], field.lstrip('-')) for field in self.ordering]
+        return page
+
+    def get_next_cursor(self):
+        if self.next_key is None:
+            return None
+        return self.encode_cursor(self.next_key)
+
+    def get_next_link(self):
+        cursor = self.get_next_cursor()
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'next_cursor': self.get_next_cursor(),
+            'results': data
+        })
+
+    def _after(self, key):
+        """Build the filter selecting rows strictly after `key`."""
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            lookup = f'{field[1:]}__lt' if field.startswith('-') else f'{field}__gt'
+            clause = Q(**{lookup: key[index]})
+            for previous_field, previous_value in zip(self.ordering[:index], key):
+                clause &= Q(**{previous_field.lstrip('-'): previous_value})
+            condition |= clause
+        return condition
+
+    @staticmethod
+    def _get_field(model, field):
+        """Model field at the end of a lookup path such as 'room__created_at'."""
+        *relations, name = field.split('__')
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+        return model._meta.get_field(name)
+
+    @staticmethod
+    def _get_value(obj, field):
+        for attribute in field.split('__'):
+            obj = getattr(obj, attribute)
+        return obj
+
+    @staticmethod
+    def _serialize(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, UUID):
+            return str(value)
+        return value
+
+
+def get_requested_fields(request, allowed_fields):
+    """
+    Parse the optional `fields=a,b,c` projection parameter.
+
+    Returns the requested fields that exist in `allowed_fields`, in the
+    order they were requested, or None when no projection was asked for.
+    """
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(',')]
+    return [field for field in requested if field in allowed_fields]
@@ -0,0 +1,110 @@
+import threading
+import time
+import logging
+import requests
+from django.conf import settings
+from room_management.service_client import auth_service
+from typing import Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Delay before retrying a failed refresh, when shorter than the interval
+RETRY_INTERVAL = 5
+
+
+class RevocationListUnavailable(Exception):
+    """The revocation list has not been loaded, or is too old to trust."""
+
+
+class RevocationList:
+    """
+    In-process copy of the auth service's list of revoked token ids (jti).
+
+    The list is refreshed by a daemon thread every
+    JWT_REVOCATION_REFRESH_INTERVAL seconds, so checking a token never
+    calls the auth service. The thread is started lazily on first use,
+    which keeps it out of the parent process of a pre-forking server; that
+    first check waits up to `wait` seconds for the thread's first load.
+
+    The check fails closed: without a list, or with one older than
+    `max_age` because refreshes keep failing, it raises
+    RevocationListUnavailable instead of letting revoked tokens through.
+    """
+
+    def __init__(self, path: str, interval: int, max_age: float, wait: float):
+        self.path = path
+        self.interval = interval
+        self.max_age = max_age
+        self.wait = wait
+        self._revoked: Set[str] = set()
+        self._loaded_at: Optional[float] = None
+        self._loaded = threading.Event()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> bool:
+        """
+        Fetch the current revocation list from the auth service.
+
+        Returns:
+            bool: True if the list was refreshed, False otherwise
+        """
+        try:
+            response = auth_service.get(self.path)
+            if response.status_code != 200:
+                logger.warning(f"Revocation list refresh returned {response.status_code}")
+                return False
+            revoked = set(response.json().get('revoked', []))
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"Revocation list refresh failed: {e}")
+            return False
+
+        self._revoked = revoked
+        self._loaded_at = time.monotonic()
+        self._loaded.set()
+        return True
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        """
+        Raises:
+            RevocationListUnavailable: If the list is missing or stale
+        """
+        self.ensure_started()
+        if not self._loaded.wait(self.wait):
+            raise RevocationListUnavailable("Revocation list has not been loaded")
+        if time.monotonic() - self._loaded_at > self.max_age:
+            raise RevocationListUnavailable("Revocation list is out of date")
+        return bool(jti) and jti in self._revoked
+
+    def ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            # The thread loads the list; requests only wait for it, unlocked
+            self._thread = threading.Thread(
+                target=self._run,
+                name='jwt-revocation-refresh',
+                daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the refresh thread after its current refresh."""
+        self._stopped.set()
+
+    def _run(self) -> None:
+        while True:
+            refreshed = self.refresh()
+            if self._stopped.wait(self.interval if refreshed else min(self.interval, RETRY_INTERVAL)):
+                return
+
+
+revocation_list = RevocationList(
+    path='/auth/revoked/',
+    interval=settings.JWT_REVOCATION_REFRESH_INTERVAL,
+    max_age=settings.JWT_REVOCATION_MAX_AGE,
+    wait=settings.JWT_REVOCATION_WAIT
+)
@@ -1,3 +1,6 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, When
+from django.db.models.functions import Coalesce
 from rest_framework import serializers
 from .models import Room, RoomMember
 
@@ -5,26 +8,45 @@ class RoomCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Room
         # Fields provided by the client; room_id and created_at will be auto-generated.
-        fields = ['service_type', 'cost', 'name', 'due_date','description']
+        fields = ['service_type', 'cost', 'name', 'due_date','description', 'capacity']
 
 class RoomJoinSerializer(serializers.ModelSerializer):
-    room_id = serializers.CharField(write_only=True)
+    room_id = serializers.UUIDField(write_only=True)
     class Meta:
         model = RoomMember
         fields = ['room_id']
 
-    def validate_room_id(self, value):
-        if not Room.objects.filter(room_id=value).exists():
-            raise serializers.ValidationError("Room does not exist")
-        user_id = self.context['request'].user.id
-        if RoomMember.objects.filter(room_id=value, user_id=user_id).exists():
-            raise serializers.ValidationError("User is already a member of this room")
-        return value
-    
     def create(self, validated_data):
+        """
+        Join in two statements: claim a place by incrementing the room's
+        member count while it is under capacity, then insert the member.
+        A duplicate join violates the (room, user_id) unique constraint,
+        which rolls the increment back with it.
+
+        Every room has its owner as a member, so a count of 0 means the room
+        predates member_count and was never reconciled. Such a room's
+        members are counted in the same UPDATE, which backfills the count.
+        """
         room_id = validated_data.pop('room_id')
-        room = Room.objects.get(room_id=room_id)
-        return RoomMember.objects.create(
-            room=room,
-            **validated_data
-        )
\ No newline at end of file
+        actual_count = RoomMember.objects.filter(room_id=OuterRef('room_id')).order_by().values('room_id').annotate(
+            count=Count('pk')
+        ).values('count')
+        current_count = Case(
+            When(member_count=0, then=Coalesce(Subquery(actual_count), 0)),
+            default=F('member_count'),
+            output_field=IntegerField()
+        )
+        try:
+            with transaction.atomic():
+                claimed = Room.objects.annotate(current_count=current_count).filter(
+                    Q(capacity__isnull=True) | Q(current_count__lt=F('capacity')),
+                    room_id=room_id
+                ).update(member_count=current_count + 1)
+                if not claimed:
+                    # Only failed joins pay for finding out why
+                    if Room.objects.filter(room_id=room_id).exists():
+                        raise serializers.ValidationError({'room_id': ["Room is full"]})
+                    raise serializers.ValidationError({'room_id': ["Room does not exist"]})
+                return RoomMember.objects.create(room_id=room_id, **validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError({'room_id': ["User is already a member of this room"]})
@@ -1,3 +1,622 @@
-from django.test import TestCase
+import asyncio
+import base64
+import datetime
+import io
+import uuid
+from unittest import mock
 
-# Create your tests here.
+import jwt
+import redis
+import requests
+from django.core.management import call_command
+from django.conf import settings
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+from room_management import db_routers
+from room_management.database import sqlite_settings
+from room_management.service_client import ServiceClient
+from room_management.db_routers import (
+    REPLICA_ALIAS, ReadReplicaRouter, is_pinned_to_primary, pin_to_primary, use_replica
+)
+
+from .async_client import call_auth_service, get_async_client
+from .authentication import JWTAuthentication, SimpleUser
+from .cache_utils import LocalTTLCache
+from .management.commands.run_billing_cycle import Command as RunBillingCycleCommand
+from .models import Room, RoomMember
+from .revocation import RevocationList
+from .user_directory import store_usernames
+from .views import ListUserRoomsView, RoomDetailView
+from .utils import get_usernames
+
+
+class ListUserRoomsViewTests(TestCase):
+    def setUp(self):
+        self.user_id = str(uuid.uuid4())
+        self.client = APIClient()
+        self.client.force_authenticate(user=SimpleUser(self.user_id))
+        patcher = mock.patch('room.views.get_usernames', side_effect=self.fake_usernames)
+        self.get_usernames = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def fake_usernames(user_ids, token):
+        return {str(user_id): 'owner' for user_id in user_ids}
+
+    def create_room(self, other_members=2):
+        owner_id = uuid.uuid4()
+        room = Room.objects.create(
+            owner_id=str(owner_id),
+            cost='10.00',
+            service_type='netflix',
+            name='Family plan',
+            description='Shared plan',
+            due_date=datetime.date(2030, 1, 1),
+            member_count=other_members + 2
+        )
+        RoomMember.objects.create(room=room, user_id=owner_id, role='owner', payment_status='paid')
+        RoomMember.objects.create(room=room, user_id=self.user_id)
+        for _ in range(other_members):
+            RoomMember.objects.create(room=room, user_id=uuid.uuid4())
+        return room
+
+    def test_member_counts(self):
+        room = self.create_room(other_members=3)
+        response = self.client.get(reverse('list'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_rooms'], 1)
+        room_data = response.data['rooms'][0]
+        self.assertEqual(room_data['id'], str(room.room_id))
+        self.assertEqual(room_data['member_count'], 5)
+        self.assertEqual(room_data['owner_username'], 'owner')
+
+    def test_reads_right_after_a_write_use_the_primary(self):
+        self.create_room()
+        on_replica = []
+        get_page = ListUserRoomsView.get_page
+
+        def record_routing(*args):
+            on_replica.append(db_routers._use_replica.get())
+            return get_page(*args)
+
+        with mock.patch.dict(settings.DATABASES, {REPLICA_ALIAS: {'ATOMIC_REQUESTS': False}}), \
+                mock.patch.object(ListUserRoomsView, 'get_page', side_effect=record_routing), \
+                mock.patch('room_management.db_routers.redis_client') as redis_client:
+            redis_client.exists.return_value = 1
+            self.client.get(reverse('list'))
+            redis_client.exists.return_value = 0
+            self.client.get(reverse('list'))
+        self.assertEqual(on_replica, [False, True])
+        redis_client.exists.assert_called_with(f'primary_pin:user:{self.user_id}')
+
+    def test_query_count_is_constant(self):
+        self.create_room()
+        with self.assertNumQueries(1):
+            self.client.get(reverse('list'))
+
+        for _ in range(10):
+            self.create_room()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('list'))
+        self.assertEqual(response.data['total_rooms'], 11)
+        self.assertEqual(self.get_usernames.call_count, 2)
+
+    def test_denormalized_owner_username(self):
+        room = self.create_room()
+        Room.objects.filter(pk=room.pk).update(owner_username='alice')
+        response = self.client.get(reverse('list'))
+
+        self.assertEqual(response.data['rooms'][0]['owner_username'], 'alice')
+        self.get_usernames.assert_not_called()
+
+    def test_join_and_leave_maintain_member_count(self):
+        room = self.create_room(other_members=0)
+        joiner_id = str(uuid.uuid4())
+        self.client.force_authenticate(user=SimpleUser(joiner_id))
+
+        response = self.client.post(reverse('join'), {'room_id': str(room.room_id)})
+        self.assertEqual(response.status_code, 201)
+        room.refresh_from_db()
+        self.assertEqual(room.member_count, 3)
+        self.assertEqual(RoomMember.objects.get(room=room, user_id=joiner_id).username, 'owner')
+
+        response = self.client.post(reverse('leave-room', args=[room.room_id]))
+        self.assertEqual(response.status_code, 200)
+        room.refresh_from_db()
+        self.assertEqual(room.member_count, 2)
+
+    def test_join_failure_is_logged_not_returned(self):
+        room = self.create_room(other_members=0)
+        self.client.force_authenticate(user=SimpleUser(str(uuid.uuid4())))
+        self.get_usernames.side_effect = RuntimeError('auth-service:8001 refused')
+
+        with self.assertLogs('room.views', 'ERROR'):
+            response = self.client.post(reverse('join'), {'room_id': str(room.room_id)})
+        self.assertEqual(response.status_code, 500)
+        self.assertNotIn('auth-service', response.data['error'])
+
+    def test_join_is_one_update_and_one_insert(self):
+        room = self.create_room(other_members=0)
+        self.client.force_authenticate(user=SimpleUser(str(uuid.uuid4())))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('join'), {'room_id': str(room.room_id)})
+        self.assertEqual(response.status_code, 201)
+        # Savepoints only appear inside the test's transaction
+        statements = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 2)
+
+        response = self.client.post(reverse('join'), {'room_id': str(room.room_id)})
+        self.assertEqual(response.data, {'room_id': ['User is already a member of this room']})
+        room.refresh_from_db()
+        self.assertEqual(room.member_count, 3)
+
+        response = self.client.post(reverse('join'), {'room_id': str(uuid.uuid4())})
+        self.assertEqual(response.data, {'room_id': ['Room does not exist']})
+
+    def test_join_respects_capacity(self):
+        room = self.create_room(other_members=0)
+        Room.objects.filter(pk=room.pk).update(capacity=2)
+        self.client.force_authenticate(user=SimpleUser(str(uuid.uuid4())))
+
+        response = self.client.post(reverse('join'), {'room_id': str(room.room_id)})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'room_id': ['Room is full']})
+        room.refresh_from_db()
+        self.assertEqual(room.member_count, 2)
+
+    def test_capacity_counts_members_of_unreconciled_rooms(self):
+        room = self.create_room(other_members=0)
+        # Created before member_count was maintained
+        Room.objects.filter(pk=room.pk).update(capacity=3, member_count=0)
+
+        self.client.force_authenticate(user=SimpleUser(str(uuid.uuid4())))
+        self.assertEqual(self.client.post(reverse('join'), {'room_id': str(room.room_id)}).status_code, 201)
+        room.refresh_from_db()
+        self.assertEqual(room.member_count, 3)
+
+        self.client.force_authenticate(user=SimpleUser(str(uuid.uuid4())))
+        response = self.client.post(reverse('join'), {'room_id': str(room.room_id)})
+        self.assertEqual(response.data, {'room_id': ['Room is full']})
+
+    def test_reconcile_repairs_member_count(self):
+        room = self.create_room(other_members=1)
+        Room.objects.filter(pk=room.pk).update(member_count=7)
+
+        call_command('reconcile_room_denormalization', '--skip-usernames', stdout=io.StringIO())
+
+        room.refresh_from_db()
+        self.assertEqual(room.member_count, 3)
+
+    def test_cursor_pagination(self):
+        room_ids = [str(self.create_room(other_members=0).room_id) for _ in range(5)]
+
+        seen = []
+        params = {'limit': 2}
+        while True:
+            response = self.client.get(reverse('list'), params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(room['id'] for room in response.data['rooms'])
+            self.assertEqual(response.data['total_rooms'], 5)
+            if not response.data['next_cursor']:
+                break
+            params['cursor'] = response.data['next_cursor']
+
+        self.assertCountEqual(seen, room_ids)
+
+        cursor = base64.urlsafe_b64encode(b'["2030-01-01T00:00:00", "not-a-uuid"]').decode()
+        self.assertEqual(self.client.get(reverse('list'), {'cursor': cursor}).status_code, 400)
+
+    def test_field_projection(self):
+        self.create_room()
+        response = self.client.get(reverse('list'), {'fields': 'id,name,unknown'})
+
+        self.assertEqual(set(response.data['rooms'][0]), {'id', 'name'})
+        self.get_usernames.assert_not_called()
+
+
+class RoomDetailViewTests(TestCase):
+    def setUp(self):
+        self.user_id = str(uuid.uuid4())
+        self.client = APIClient()
+        self.client.force_authenticate(user=SimpleUser(self.user_id))
+        self.room = Room.objects.create(
+            owner_id=self.user_id,
+            owner_username='owner',
+            cost='10.00',
+            service_type='netflix',
+            name='Family plan',
+            description='Shared plan',
+            due_date=datetime.date(2030, 1, 1),
+            member_count=1
+        )
+        RoomMember.objects.create(room=self.room, user_id=self.user_id, username='owner', role='owner', payment_status='paid')
+
+        # Version counters as Redis would keep them
+        self.versions = {}
+        patcher = mock.patch(
+            'room.cache_utils._get_versions',
+            side_effect=lambda keys: [self.versions.get(key, '1') for key in keys]
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # The detail cache, in a dict
+        self.cached = {}
+        redis_client = mock.Mock()
+        redis_client.get.side_effect = self.cached.get
+        redis_client.setex.side_effect = lambda key, ttl, value: self.cached.__setitem__(key, value)
+        pipe = mock.Mock()
+        pipe.incr.side_effect = self.bump
+        for target, value in (
+            ('room.cache_utils.redis_client', redis_client),
+            ('room.cache_utils.redis_health', mock.Mock(**{'available.return_value': True})),
+            ('room.cache_utils.pipelined', mock.MagicMock(**{'return_value.__enter__.return_value': pipe})),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def bump(self, key):
+        self.versions[key] = str(int(self.versions.get(key, '1')) + 1)
+
+    def test_room_payload_is_cached_until_a_member_leaves(self):
+        member_id = uuid.uuid4()
+        RoomMember.objects.create(room=self.room, user_id=member_id, username='bob')
+        url = reverse('room-detail', args=[self.room.room_id])
+        self.assertEqual(len(self.client.get(url).data['members']), 2)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        # Per-user fields are not taken from the cache
+        self.assertEqual((response.data['user_role'], len(response.data['members'])), ('owner', 2))
+
+        self.client.force_authenticate(user=SimpleUser(str(member_id)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(reverse('leave-room', args=[self.room.room_id])).status_code, 200)
+        self.assertEqual(self.versions[f'room_version:{self.room.room_id}'], '2')
+        self.client.force_authenticate(user=SimpleUser(self.user_id))
+        self.assertEqual(len(self.client.get(url).data['members']), 1)
+
+    def test_payload_built_before_a_write_is_not_served_after_it(self):
+        member = RoomMember.objects.create(room=self.room, user_id=uuid.uuid4(), username='bob')
+        url = reverse('room-detail', args=[self.room.room_id])
+        build_room_data = RoomDetailView.build_room_data
+
+        def build_then_write(view, room, token):
+            result = build_room_data(view, room, token)
+            # A leave commits and invalidates before this reader caches
+            member.delete()
+            self.bump(f'room_version:{self.room.room_id}')
+            return result
+
+        with mock.patch.object(RoomDetailView, 'build_room_data', build_then_write):
+            self.assertEqual(len(self.client.get(url).data['members']), 2)
+        self.assertEqual(len(self.client.get(url).data['members']), 1)
+
+    def test_unresolved_names_are_neither_cached_nor_tagged(self):
+        member_id = str(uuid.uuid4())
+        # Joined while the auth service was down
+        RoomMember.objects.create(room=self.room, user_id=member_id, username='')
+        url = reverse('room-detail', args=[self.room.room_id])
+
+        with mock.patch('room.views.get_usernames', return_value={member_id: None}):
+            response = self.client.get(url)
+        self.assertEqual(response.data['members'][1]['username'], None)
+        self.assertNotIn('ETag', response)
+        self.assertEqual(self.cached, {})
+
+        with mock.patch('room.views.get_usernames', return_value={member_id: 'bob'}):
+            response = self.client.get(url)
+        self.assertEqual(response.data['members'][1]['username'], 'bob')
+        self.assertIn('ETag', response)
+        self.assertEqual(len(self.cached), 1)
+
+    def test_unchanged_room_is_not_modified_until_invalidated(self):
+        response = self.client.get(reverse('room-detail', args=[self.room.room_id]))
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.client.get(reverse('room-detail', args=[self.room.room_id]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.versions[f'room_version:{self.room.room_id}'] = '2'
+        response = self.client.get(reverse('room-detail', args=[self.room.room_id]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user_role'], 'owner')
+
+    def test_non_member_never_gets_not_modified(self):
+        self.client.force_authenticate(user=SimpleUser(str(uuid.uuid4())))
+
+        response = self.client.get(reverse('room-detail', args=[self.room.room_id]), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 403)
+
+    async def test_async_detail_checks_membership_before_the_etag(self):
+        outsider_id = str(uuid.uuid4())
+        token = jwt.encode({'user_id': outsider_id}, 'x' * 32, algorithm='HS256')
+
+        with mock.patch('room.async_views.authenticate_token', mock.AsyncMock(return_value=outsider_id)):
+            response = await self.async_client.get(
+                reverse('async-room-detail', args=[self.room.room_id]),
+                headers={'Authorization': f'Bearer {token}', 'If-None-Match': '*'}
+            )
+        self.assertEqual(response.status_code, 403)
+
+    async def test_async_detail_and_list_match_the_sync_views(self):
+        token = jwt.encode({'user_id': self.user_id}, 'x' * 32, algorithm='HS256')
+        headers = {'Authorization': f'Bearer {token}'}
+
+        with mock.patch('room.async_views.authenticate_token', mock.AsyncMock(return_value=self.user_id)):
+            detail = await self.async_client.get(reverse('async-room-detail', args=[self.room.room_id]), headers=headers)
+            rooms = await self.async_client.get(reverse('async-list'), headers=headers)
+            # A token for someone else is refused, whatever the load found
+            with mock.patch('room.async_views.authenticate_token', mock.AsyncMock(return_value=str(uuid.uuid4()))):
+                refused = await self.async_client.get(reverse('async-list'), headers=headers)
+
+        self.assertEqual(detail.status_code, 200)
+        self.assertEqual((detail.json()['user_role'], detail.json()['members'][0]['username']), ('owner', 'owner'))
+        self.assertEqual([room['id'] for room in rooms.json()['rooms']], [str(self.room.room_id)])
+        self.assertEqual(rooms.json()['total_rooms'], 1)
+        self.assertEqual(refused.status_code, 401)
+
+
+@override_settings(JWT_VERIFICATION_MODE='local', JWT_SIGNING_KEY='k' * 32)
+class LocalJWTVerificationTests(SimpleTestCase):
+    def setUp(self):
+        self.revocations = RevocationList(path='/auth/revoked/', interval=3600, max_age=60, wait=1)
+        self.addCleanup(self.revocations.stop)
+        patcher = mock.patch('room.authentication.revocation_list', self.revocations)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('room.revocation.auth_service')
+        self.auth_service = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.auth_service.get.return_value.status_code = 200
+        self.auth_service.get.return_value.json.return_value = {'revoked': ['revoked-jti']}
+
+    @staticmethod
+    def token(jti):
+        claims = {'user_id': str(uuid.uuid4()), 'jti': jti, 'exp': datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=5)}
+        return jwt.encode(claims, 'k' * 32, algorithm='HS256')
+
+    def test_revoked_tokens_are_rejected(self):
+        authentication = JWTAuthentication()
+
+        user, _ = authentication.authenticate_locally(self.token('fresh-jti'))
+        self.assertTrue(user.is_authenticated)
+        with self.assertRaisesMessage(AuthenticationFailed, 'Token has been revoked'):
+            authentication.authenticate_locally(self.token('revoked-jti'))
+        # Loaded once, by the refresh thread
+        self.auth_service.get.assert_called_once_with('/auth/revoked/')
+
+    def test_fails_closed_without_a_list(self):
+        self.auth_service.get.side_effect = requests.exceptions.ConnectionError
+        self.revocations.wait = 0.2
+
+        with self.assertRaisesMessage(AuthenticationFailed, 'Authentication service unavailable'):
+            JWTAuthentication().authenticate_locally(self.token('fresh-jti'))
+
+    def test_fails_closed_once_the_list_is_stale(self):
+        JWTAuthentication().authenticate_locally(self.token('fresh-jti'))
+        # Every refresh since has failed
+        self.revocations._loaded_at -= 61
+
+        with self.assertRaisesMessage(AuthenticationFailed, 'Authentication service unavailable'):
+            JWTAuthentication().authenticate_locally(self.token('fresh-jti'))
+
+
+class AsyncClientTests(SimpleTestCase):
+    def test_client_is_reused_within_a_loop_and_closed_with_it(self):
+        async def get_clients():
+            return await get_async_client(), await get_async_client()
+
+        first, second = asyncio.run(get_clients())
+
+        self.assertIs(first, second)
+        self.assertTrue(first.is_closed)
+
+
+class GetUsernamesTests(TestCase):
+    def test_only_directory_misses_are_fetched(self):
+        cached_id, missing_id, unknown_id = (str(uuid.uuid4()) for _ in range(3))
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {'users': {missing_id: 'fetched'}}
+
+        with mock.patch('room.utils.lookup_usernames',
+                        return_value=({cached_id: 'cached'}, {missing_id, unknown_id})), \
+                mock.patch('room.utils.store_usernames') as store_usernames, \
+                mock.patch('room.utils.auth_service.post', return_value=response) as post:
+            usernames = get_usernames([cached_id, missing_id, unknown_id], 'token')
+
+        self.assertEqual(usernames, {cached_id: 'cached', missing_id: 'fetched', unknown_id: None})
+        self.assertEqual(post.call_args.kwargs['json'], {'user_ids': sorted([missing_id, unknown_id])})
+        store_usernames.assert_called_once_with({missing_id: 'fetched'})
+
+    def test_no_request_when_all_cached(self):
+        user_id = str(uuid.uuid4())
+        with mock.patch('room.utils.lookup_usernames', return_value=({user_id: 'cached'}, set())), \
+                mock.patch('room.utils.auth_service.post') as post:
+            self.assertEqual(get_usernames([user_id], 'token'), {user_id: 'cached'})
+        post.assert_not_called()
+
+
+class UserDirectoryTests(SimpleTestCase):
+    def test_fetched_names_do_not_overwrite_renames(self):
+        renamed_id, new_id = str(uuid.uuid4()), str(uuid.uuid4())
+        pipe = mock.MagicMock(results=[0, 1])
+        local_directory = LocalTTLCache(10)
+
+        with mock.patch('room.user_directory.pipelined') as pipelined, \
+                mock.patch('room.user_directory.redis_health.available', return_value=True), \
+                mock.patch('room.user_directory.local_directory', local_directory):
+            pipelined.return_value.__enter__.return_value = pipe
+            self.assertTrue(store_usernames({renamed_id: 'old name', new_id: 'new user'}))
+
+        self.assertEqual(
+            pipe.hsetnx.call_args_list,
+            [mock.call('user_directory', renamed_id, 'old name'), mock.call('user_directory', new_id, 'new user')]
+        )
+        self.assertIsNone(local_directory.get(renamed_id))
+        self.assertEqual(local_directory.get(new_id), 'new user')
+
+
+class ConsumeUserEventsTests(SimpleTestCase):
+    def test_survives_redis_timeouts(self):
+        event = {'type': 'username_changed', 'user_id': str(uuid.uuid4()), 'username': 'bob'}
+        client = mock.Mock()
+        client.xreadgroup.side_effect = [
+            redis.exceptions.TimeoutError('Timeout reading from socket'),
+            [['auth:user_events', [('1-0', event)]]],
+            KeyboardInterrupt,
+        ]
+
+        with mock.patch('room.management.commands.consume_user_events.create_blocking_client', return_value=client), \
+                mock.patch('room.management.commands.consume_user_events.Command.apply') as apply, \
+                mock.patch('time.sleep') as sleep:
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('consume_user_events', stdout=io.StringIO(), stderr=io.StringIO())
+
+        sleep.assert_called_once_with(1)
+        apply.assert_called_once_with(event)
+        client.xack.assert_called_once_with(settings.USER_EVENTS_STREAM, settings.USER_EVENTS_GROUP, '1-0')
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.client = ServiceClient(
+            name='auth_services', base_url='http://auth.invalid', connect_timeout=1, read_timeout=1,
+            max_retries=0, backoff=0, pool_size=1, failure_threshold=1, reset_timeout=0
+        )
+        # Open the circuit; with no reset timeout the next call is a trial
+        self.client.breaker.record_failure()
+
+    def test_unexpected_error_ends_the_trial(self):
+        with mock.patch.object(self.client.session, 'request', side_effect=requests.exceptions.InvalidURL):
+            with self.assertRaises(requests.exceptions.InvalidURL):
+                self.client.get('/auth/verify/')
+        self.assertTrue(self.client.breaker.allow())
+
+    def test_cancelled_trial_ends_the_trial(self):
+        http_client = mock.Mock()
+        http_client.request = mock.AsyncMock(side_effect=asyncio.CancelledError)
+        with mock.patch('room.async_client.auth_service', self.client), \
+                mock.patch('room.async_client.get_async_client', mock.AsyncMock(return_value=http_client)):
+            with self.assertRaises(asyncio.CancelledError):
+                asyncio.run(call_auth_service('GET', '/auth/verify/'))
+        self.assertTrue(self.client.breaker.allow())
+
+
+class ReadReplicaRouterTests(SimpleTestCase):
+    def test_reads_use_replica_only_when_requested_and_configured(self):
+        router = ReadReplicaRouter()
+        with use_replica():
+            self.assertIsNone(router.db_for_read(Room))
+
+        with mock.patch.dict(settings.DATABASES, {REPLICA_ALIAS: {}}):
+            self.assertIsNone(router.db_for_read(Room))
+            with use_replica():
+                self.assertEqual(router.db_for_read(Room), REPLICA_ALIAS)
+                self.assertEqual(router.db_for_write(Room), 'default')
+
+    def test_writes_pin_rooms_and_users_to_the_primary(self):
+        pipe = mock.Mock()
+        with mock.patch.dict(settings.DATABASES, {REPLICA_ALIAS: {}}), \
+                mock.patch('room_management.db_routers.redis_client') as redis_client:
+            pin_to_primary(pipe, ['r1'], ['u1'])
+            redis_client.exists.return_value = 1
+            self.assertTrue(is_pinned_to_primary(room_id='r1', user_id='u2'))
+            redis_client.exists.assert_called_with('primary_pin:room:r1', 'primary_pin:user:u2')
+            redis_client.exists.return_value = 0
+            self.assertFalse(is_pinned_to_primary(user_id='u2'))
+            # Unknown is treated as pinned
+            redis_client.exists.side_effect = redis.exceptions.ConnectionError
+            self.assertTrue(is_pinned_to_primary(user_id='u2'))
+        self.assertEqual(pipe.set.call_args_list, [
+            mock.call('primary_pin:room:r1', 1, ex=settings.DB_REPLICA_PIN_SECONDS),
+            mock.call('primary_pin:user:u1', 1, ex=settings.DB_REPLICA_PIN_SECONDS),
+        ])
+
+
+class SQLiteProfileTests(SimpleTestCase):
+    def test_performance_profile_sets_pragmas(self):
+        self.assertNotIn('OPTIONS', sqlite_settings('db.sqlite3', 'default'))
+
+        options = sqlite_settings('db.sqlite3', 'performance')['OPTIONS']
+        self.assertIn('PRAGMA journal_mode=WAL', options['init_command'])
+        self.assertIn('PRAGMA synchronous=NORMAL', options['init_command'])
+        self.assertEqual(options['transaction_mode'], 'IMMEDIATE')
+
+
+class BillingCycleTests(TestCase):
+    def create_room(self, due_date):
+        room = Room.objects.create(
+            owner_id=str(uuid.uuid4()),
+            cost='10.00',
+            service_type='netflix',
+            name='Family plan',
+            description='Shared plan',
+            due_date=due_date
+        )
+        RoomMember.objects.create(room=room, user_id=room.owner_id, role='owner', payment_status='paid')
+        paid = RoomMember.objects.create(room=room, user_id=uuid.uuid4(), payment_status='paid')
+        pending = RoomMember.objects.create(room=room, user_id=uuid.uuid4(), payment_status='pending')
+        return room, paid, pending
+
+    def test_rolls_due_rooms_and_updates_members(self):
+        due_room, paid, pending = self.create_room(datetime.date(2030, 1, 31))
+        future_room, future_paid, _ = self.create_room(datetime.date(2030, 3, 15))
+
+        call_command('run_billing_cycle', '--date', '2030-02-10', '--chunk-size', '1', stdout=io.StringIO())
+
+        due_room.refresh_from_db()
+        future_room.refresh_from_db()
+        self.assertEqual(due_room.due_date, datetime.date(2030, 2, 28))
+        self.assertEqual(future_room.due_date, datetime.date(2030, 3, 15))
+        statuses = dict(RoomMember.objects.filter(room=due_room).values_list('user_id', 'payment_status'))
+        self.assertEqual(statuses[uuid.UUID(due_room.owner_id)], 'paid')
+        self.assertEqual(statuses[paid.user_id], 'pending')
+        self.assertEqual(statuses[pending.user_id], 'overdue')
+        self.assertEqual(RoomMember.objects.get(pk=future_paid.pk).payment_status, 'paid')
+
+    def test_consecutive_rolls_keep_the_billing_day(self):
+        room, _, _ = self.create_room(datetime.date(2030, 1, 31))
+
+        call_command('run_billing_cycle', '--date', '2030-02-10', stdout=io.StringIO())
+        room.refresh_from_db()
+        self.assertEqual(room.due_date, datetime.date(2030, 2, 28))
+
+        call_command('run_billing_cycle', '--date', '2030-03-10', stdout=io.StringIO())
+        room.refresh_from_db()
+        self.assertEqual(room.due_date, datetime.date(2030, 3, 31))
+
+    def test_room_changed_after_the_chunk_was_read_is_skipped(self):
+        room, paid, pending = self.create_room(datetime.date(2030, 1, 10))
+        # Another run rolled the room between the chunk read and close_cycle
+        Room.objects.filter(pk=room.pk).update(due_date=datetime.date(2030, 2, 10))
+        RoomMember.objects.filter(pk=paid.pk).update(payment_status='pending')
+
+        rolled, overdue, reset = RunBillingCycleCommand().close_cycle(
+            [(room.room_id, datetime.date(2030, 1, 10), None)], datetime.date(2030, 1, 20)
+        )
+
+        self.assertEqual((rolled, overdue, reset), (0, 0, 0))
+        room.refresh_from_db()
+        self.assertEqual(room.due_date, datetime.date(2030, 2, 10))
+        self.assertEqual(RoomMember.objects.get(pk=paid.pk).payment_status, 'pending')
+        self.assertEqual(RoomMember.objects.get(pk=pending.pk).payment_status, 'pending')
+
+    def test_room_several_cycles_behind_rolls_once(self):
+        room, _, pending = self.create_room(datetime.date(2030, 1, 10))
+
+        call_command('run_billing_cycle', '--date', '2030-04-20', stdout=io.StringIO())
+        call_command('run_billing_cycle', '--date', '2030-04-20', stdout=io.StringIO())
+
+        room.refresh_from_db()
+        self.assertEqual(room.due_date, datetime.date(2030, 5, 10))
+        self.assertEqual(RoomMember.objects.get(pk=pending.pk).payment_status, 'overdue')
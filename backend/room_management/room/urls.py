@@ -8,6 +8,7 @@ from .views import (
     DeleteRoomView,
     RemoveMemberView
 )
+from .async_views import AsyncListUserRoomsView, AsyncRoomDetailView
 
 urlpatterns = [
     path('create/', CreateRoomView.as_view(), name='create-room'),
@@ -17,4 +18,6 @@ urlpatterns = [
     path('<uuid:room_id>/leave/', LeaveRoomView.as_view(), name='leave-room'),
     path('<uuid:room_id>/delete/', DeleteRoomView.as_view(), name='delete-room'),
     path('<uuid:room_id>/remove-member/', RemoveMemberView.as_view(), name='remove-member'),
+    path('async/list/', AsyncListUserRoomsView.as_view(), name='async-list'),
+    path('async/<uuid:room_id>/', AsyncRoomDetailView.as_view(), name='async-room-detail'),
 ]
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""
+Directory of usernames keyed by user id, so room pages do not call the auth
+service for names it has already told us.
+
+Usernames live in one Redis hash shared by every process, with a bounded
+in-process LRU in front of it. Entries do not expire: the directory is
+filled in bulk (see the warm_user_directory command) and kept current from
+auth_services' username-change events (see consume_user_events), which also
+evict the entry from every process's local tier.
+"""
+
+import logging
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import redis
+from django.conf import settings
+
+from .cache_utils import (
+    INVALIDATION_CHANNEL_PREFIX,
+    LocalTTLCache,
+    publish_invalidation,
+    redis_client,
+    redis_health,
+    register_local_cache,
+    start_invalidation_listener
+)
+from room_management.redis_client import pipelined
+
+logger = logging.getLogger(__name__)
+
+USER_DIRECTORY_KEY = 'user_directory'
+USER_DIRECTORY_INVALIDATION_CHANNEL = f'{INVALIDATION_CHANNEL_PREFIX}user_directory'
+
+local_directory = LocalTTLCache(settings.USER_DIRECTORY_LOCAL_SIZE)
+register_local_cache(USER_DIRECTORY_INVALIDATION_CHANNEL, local_directory)
+
+
+def lookup_usernames(user_ids: Iterable) -> Tuple[Dict[str, str], Set[str]]:
+    """
+    Look users up in the local tier, then in Redis with a single HMGET.
+
+    Returns:
+        Tuple of the usernames found, keyed by user id as a string, and the
+        set of user ids that are not in the directory
+    """
+    start_invalidation_listener()
+    found = {}
+    missing = set()
+    for user_id in {str(user_id) for user_id in user_ids if user_id}:
+        username = local_directory.get(user_id)
+        if username is None:
+            missing.add(user_id)
+        else:
+            found[user_id] = username
+    if not missing or not redis_health.available():
+        return found, missing
+
+    ordered = sorted(missing)
+    try:
+        usernames = redis_client.hmget(USER_DIRECTORY_KEY, ordered)
+        redis_health.record_success()
+    except redis.exceptions.RedisError as e:
+        redis_health.record_failure(e)
+        logger.error(f"Redis error while reading the user directory: {e}")
+        return found, missing
+
+    for user_id, username in zip(ordered, usernames):
+        if username is not None:
+            found[user_id] = username
+            missing.discard(user_id)
+            local_directory.set(user_id, username, settings.USER_DIRECTORY_LOCAL_TTL)
+    return found, missing
+
+def store_usernames(usernames: Dict[str, Optional[str]]) -> bool:
+    """
+    Add usernames fetched from the auth service to both tiers. Unknown users
+    (None) are skipped so a later lookup asks again.
+
+    Entries are only added, never overwritten (HSETNX): a name fetched
+    before a rename can arrive after update_username recorded the new one,
+    and since entries do not expire, overwriting would keep the old name.
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    mapping = {str(user_id): username for user_id, username in usernames.items() if username is not None}
+    if not mapping:
+        return True
+    if not redis_health.available():
+        for user_id, username in mapping.items():
+            local_directory.set(user_id, username, settings.USER_DIRECTORY_LOCAL_TTL)
+        return False
+    try:
+        with pipelined() as pipe:
+            for user_id, username in mapping.items():
+                pipe.hsetnx(USER_DIRECTORY_KEY, user_id, username)
+        redis_health.record_success()
+    except redis.exceptions.RedisError as e:
+        redis_health.record_failure(e)
+        logger.error(f"Redis error while updating the user directory: {e}")
+        return False
+    for (user_id, username), added in zip(mapping.items(), pipe.results):
+        # Otherwise the directory already holds a name, possibly newer
+        if added:
+            local_directory.set(user_id, username, settings.USER_DIRECTORY_LOCAL_TTL)
+    return True
+
+def update_username(user_id, username: str) -> bool:
+    """
+    Record a username change and evict the old name from every process.
+    Unlike store_usernames this overwrites, as events are authoritative.
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    user_id = str(user_id)
+    local_directory.delete(user_id)
+    try:
+        redis_client.hset(USER_DIRECTORY_KEY, user_id, username)
+        publish_invalidation(USER_DIRECTORY_INVALIDATION_CHANNEL, user_id)
+        redis_health.record_success()
+        return True
+    except redis.exceptions.RedisError as e:
+        redis_health.record_failure(e)
+        logger.error(f"Redis error while updating the user directory: {e}")
+        return False
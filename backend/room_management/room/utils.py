@@ -1,17 +1,85 @@
 import requests
+from django.conf import settings
+from room_management.service_client import auth_service
+from django.utils.http import parse_etags
+from .user_directory import lookup_usernames, store_usernames
 
 def get_owner_username(owner_id, token):
-        try:
-            response = requests.get(
-                'http://localhost:8000/auth/info/',
-                headers={
-                    'Authorization': f'Bearer {token}',
-                },
-                params={'user_id': owner_id}
-            )
-            if response.status_code == 200:
-                owner_username = response.json().get('username')
-                return owner_username
-            return None
-        except requests.RequestException:
-            return None
\ No newline at end of file
+    return get_usernames([owner_id], token).get(str(owner_id))
+
+def get_usernames(user_ids, token):
+    """
+    Resolve the usernames of many users, from the user directory where
+    possible and otherwise with a single call to the auth service.
+
+    Returns a dict mapping each requested user id (as a string) to its
+    username, or None when the user is unknown or the auth service failed.
+    """
+    ids = {str(user_id) for user_id in user_ids if user_id}
+    usernames = dict.fromkeys(ids)
+    found, missing = lookup_usernames(ids)
+    usernames.update(found)
+    if not missing:
+        return usernames
+    try:
+        # A bulk lookup is a read, so it is safe to retry despite being a POST
+        response = auth_service.post(
+            '/auth/info/bulk/',
+            headers={
+                'Authorization': f'Bearer {token}',
+            },
+            json={'user_ids': sorted(missing)},
+            retry=True
+        )
+        if response.status_code == 200:
+            fetched = {
+                user_id: username
+                for user_id, username in response.json().get('users', {}).items()
+                if user_id in missing
+            }
+            usernames.update(fetched)
+            store_usernames(fetched)
+    except requests.RequestException:
+        pass
+    return usernames
+
+def fetch_usernames_internal(user_ids):
+    """
+    Resolve usernames through the auth service's internal bulk endpoint,
+    which needs INTERNAL_SERVICE_KEY rather than a user token. Used by jobs
+    that run outside a request.
+
+    Raises:
+        requests.RequestException: If the auth service could not be reached
+    """
+    return _internal_bulk_lookup('/auth/internal/users/bulk/', user_ids)
+
+def fetch_user_contacts(user_ids):
+    """
+    Resolve {user_id: {'username', 'phone_number'}} through the auth service's
+    internal contacts endpoint, for billing jobs.
+
+    Raises:
+        requests.RequestException: If the auth service could not be reached
+    """
+    return _internal_bulk_lookup('/auth/internal/users/contacts/', user_ids)
+
+def _internal_bulk_lookup(path, user_ids):
+    response = auth_service.post(
+        path,
+        headers={'X-Service-Key': settings.INTERNAL_SERVICE_KEY},
+        json={'user_ids': sorted({str(user_id) for user_id in user_ids})},
+        retry=True
+    )
+    response.raise_for_status()
+    return response.json().get('users', {})
+
+def etag_matches(request, etag):
+    """True if the request's If-None-Match header matches `etag` (weak comparison)."""
+    header = request.headers.get('If-None-Match')
+    if not header or not etag:
+        return False
+    if header.strip() == '*':
+        return True
+    strip_weak = lambda tag: tag[2:] if tag.startswith('W/') else tag
+    return strip_weak(etag) in {strip_weak(tag) for tag in parse_etags(header)}
@@ -1,12 +1,31 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework import serializers, status
 from .models import Room, RoomMember
 from .serializers import RoomCreateSerializer, RoomJoinSerializer
 from rest_framework.permissions import IsAuthenticated
 from django.db import transaction
-from .utils import get_owner_username
+from django.db.models import F
+from django.db.models.functions import Greatest
+from .utils import get_usernames, etag_matches
+from .pagination import KeysetPagination, get_requested_fields
+from .cache_utils import (
+    get_room_detail_cache,
+    set_room_detail_cache,
+    invalidate_room_cache_on_commit,
+    get_room_version_and_etag,
+    get_user_rooms_etag
+)
 from django.shortcuts import get_object_or_404
+from room_management.db_routers import ReadReplicaMixin
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def adjust_member_count(room_id, delta):
+    """Atomically add `delta` to a room's denormalized member count."""
+    Room.objects.filter(room_id=room_id).update(member_count=Greatest(F('member_count') + delta, 0))
 
 
 class CreateRoomView(APIView):
@@ -19,13 +38,16 @@ class CreateRoomView(APIView):
         if serializer.is_valid():
             try:
                 owner_id = request.user.id
-                room = serializer.save(owner_id=owner_id)
+                owner_username = get_usernames([owner_id], request.auth).get(str(owner_id)) or ''
+                room = serializer.save(owner_id=owner_id, owner_username=owner_username, member_count=1)
                 RoomMember.objects.create(
                     room=room,
                     user_id=owner_id,
+                    username=owner_username,
                     role='owner',
                     payment_status='paid'  # Owner is automatically marked as paid
                 )
+                invalidate_room_cache_on_commit(room.room_id, [owner_id])
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             except Exception as e:
                 return Response(
@@ -35,7 +57,6 @@ class CreateRoomView(APIView):
 
 class JoinRoomView(APIView):
     permission_classes = [IsAuthenticated]
-    @transaction.atomic
     def post(self, request):
         serializer = RoomJoinSerializer(
             data=request.data,
@@ -44,7 +65,9 @@ class JoinRoomView(APIView):
         if serializer.is_valid():
             try:
                 user_id = request.user.id
-                room_member = serializer.save(user_id=user_id,role='member',payment_status='pending')
+                username = get_usernames([user_id], request.auth).get(str(user_id)) or ''
+                room_member = serializer.save(user_id=user_id,username=username,role='member',payment_status='pending')
+                invalidate_room_cache_on_commit(room_member.room_id, members_after_commit=True)
                 return Response({
                     'message': 'Successfully joined room',
                     'room_id': str(room_member.room_id),
@@ -52,52 +75,117 @@ class JoinRoomView(APIView):
                     'payment_status': room_member.payment_status
                 }, status=status.HTTP_201_CREATED)
             
-            except Exception as e:
-                print(e)
+            except serializers.ValidationError as e:
+                return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+            except Exception:
+                logger.exception(f"Failed to add user {request.user.id} to a room")
                 return Response(
-                    {'error': str(e)},
+                    {'error': 'Could not join the room, try again later'},
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )   
+                )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-class ListUserRoomsView(APIView):
+class ListUserRoomsView(ReadReplicaMixin, APIView):
+    """
+    List the rooms the user belongs to, a page at a time.
+
+    Pages are keyed on (created_at, room_id); pass `cursor` from the previous
+    response to get the next one and `limit` to size the page. `fields` selects
+    a subset of the room fields, e.g. `fields=id,name,due_date`. `total_rooms`
+    counts all of the user's rooms, not just the page.
+    """
     permission_classes = [IsAuthenticated]
-    
+    room_fields = (
+        'id', 'name', 'service', 'description', 'cost', 'due_date', 'created_at',
+        'role', 'payment_status', 'member_count', 'owner_username'
+    )
+
     def get(self, request):
             user_id = request.user.id
             token = request.auth
-            # Get the rooms through RoomMember
-            user_room_members = RoomMember.objects.filter(user_id=user_id).select_related('room')
-            rooms_data = []
-            for member in user_room_members:
-                owner_id = member.room.owner_id
-                owner_username = get_owner_username(owner_id, token) if owner_id else 'unknown'
-                room_data = {
-                    'id': str(member.room.room_id),
-                    'name': member.room.name,
-                    'service': member.room.service_type,
-                    'description': member.room.description,
-                    'cost': str(member.room.cost),
-                    'due_date': member.room.due_date,
-                    'created_at': member.room.created_at,
-                    'role': member.role,
-                    'payment_status': member.payment_status,
-                    'member_count': member.room.members.count(),
-                    'owner_username': owner_username
-                }
-                rooms_data.append(room_data)
-
-            return Response({
+            # Answer conditional requests from the version counters alone
+            etag = get_user_rooms_etag(user_id, request.query_params.urlencode())
+            if etag_matches(request, etag):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+            fields = get_requested_fields(request, self.room_fields) or self.room_fields
+            user_room_members, paginator = self.get_page(request, user_id, fields)
+
+            usernames = {}
+            missing_ids = self.missing_owner_ids(user_room_members)
+            if 'owner_username' in fields and missing_ids:
+                # Rooms not yet reconciled: resolve their owners with a single auth service call
+                usernames = get_usernames(missing_ids, token)
+            rooms_data = self.serialize_rooms(user_room_members, fields, usernames)
+
+            response = Response({
                 'rooms': rooms_data,
-                'total_rooms': len(rooms_data)
+                'total_rooms': self.count_rooms(request, user_id, rooms_data, paginator),
+                'next': paginator.get_next_link(),
+                'next_cursor': paginator.get_next_cursor()
             }, status=status.HTTP_200_OK)
+            if etag:
+                response['ETag'] = etag
+            return response
+
+    @staticmethod
+    def get_page(request, user_id, fields):
+        """Fetch one page of the user's memberships with their rooms."""
+        # Get the rooms through RoomMember
+        # One query for the rooms and the user's membership; member counts and
+        # owner names are denormalized onto the room
+        user_room_members = RoomMember.objects.filter(user_id=user_id).select_related('room')
+        paginator = KeysetPagination(ordering=('room__created_at', 'room_id'))
+        return paginator.paginate_queryset(user_room_members, request), paginator
 
-class RoomDetailView(APIView):
+    @staticmethod
+    def count_rooms(request, user_id, page, paginator):
+        """Rooms the user belongs to across all pages."""
+        if paginator.next_key is None and not request.query_params.get(paginator.cursor_query_param):
+            # The only page holds them all
+            return len(page)
+        return RoomMember.objects.filter(user_id=user_id).count()
+
+    @staticmethod
+    def missing_owner_ids(user_room_members):
+        """Owners whose username has not been denormalized onto their room."""
+        return [
+            member.room.owner_id for member in user_room_members
+            if member.room.owner_id and not member.room.owner_username
+        ]
+
+    @staticmethod
+    def serialize_rooms(user_room_members, fields, usernames):
+        rooms_data = []
+        for member in user_room_members:
+            owner_id = member.room.owner_id
+            room_data = {
+                'id': str(member.room.room_id),
+                'name': member.room.name,
+                'service': member.room.service_type,
+                'description': member.room.description,
+                'cost': str(member.room.cost),
+                'due_date': member.room.due_date,
+                'created_at': member.room.created_at,
+                'role': member.role,
+                'payment_status': member.payment_status,
+                'member_count': member.room.member_count,
+                'owner_username': (member.room.owner_username or usernames.get(str(owner_id))) if owner_id else 'unknown'
+            }
+            rooms_data.append({field: room_data[field] for field in fields})
+        return rooms_data
+
+class RoomDetailView(ReadReplicaMixin, APIView):
+    """
+    Room details for a member. The room-level part of the payload (room fields
+    and member list) is cached per room; membership and the requesting user's
+    role and payment status are read fresh on every request.
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request, room_id):
         try:
-            # Check if user is a member of the room
             user_id = request.user.id
+            # Check if user is a member of the room
             room_member = RoomMember.objects.filter(
                 room_id=room_id,
                 user_id=user_id
@@ -109,49 +197,95 @@ class RoomDetailView(APIView):
                     status=status.HTTP_403_FORBIDDEN
                 )
 
-            # Get room details
-            room = room_member.room
-            owner_id = room.owner_id
-            owner_username = get_owner_username(
-                owner_id, 
-                request.auth
-            ) if owner_id else 'Unknown'
-
-            # Get all members
-            members = []
-            for member in room.members.all():
-                username = get_owner_username(member.user_id, request.auth)
-                members.append({
-                    'user_id': str(member.user_id),
-                    'username': username,
-                    'role': member.role,
-                    'payment_status': member.payment_status,
-                    'joined_at': member.join_date
-                })
+            # Only members get as far as a conditional answer. The version is
+            # read before the payload is built, see get_room_detail_cache
+            room_version, etag = get_room_version_and_etag(room_id, user_id)
+            if etag_matches(request, etag):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
 
-            room_data = {
-                'id': str(room.room_id),
-                'name': room.name,
-                'service': room.service_type,
-                'description': room.description,
-                'cost': str(room.cost),
-                'due_date': room.due_date,
-                'created_at': room.created_at,
-                'owner_username': owner_username,
-                'user_role': room_member.role,
-                'user_payment_status': room_member.payment_status,
-                'members': members,
-                'member_count': len(members)
-            }
+            room_data = get_room_detail_cache(room_id, room_version)
+            if room_data is None:
+                room_data, names_resolved = self.build_room_data(room_member.room, request.auth)
+                if names_resolved:
+                    set_room_detail_cache(room_id, room_version, room_data)
+                else:
+                    # Neither cached nor tagged, so the gaps are retried next time
+                    etag = None
 
-            return Response(room_data, status=status.HTTP_200_OK)
+            room_data.update({
+                'user_role': room_member.role,
+                'user_payment_status': room_member.payment_status
+            })
+            response = Response(room_data, status=status.HTTP_200_OK)
+            if etag:
+                response['ETag'] = etag
+            return response
 
         except Exception as e:
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-       
+
+    def build_room_data(self, room, token):
+        """
+        Build the part of the payload that is the same for every member.
+
+        Returns:
+            tuple: (payload, whether every username was resolved)
+        """
+        room_members = list(room.members.all())
+
+        usernames = {}
+        missing_ids = self.missing_user_ids(room, room_members)
+        if missing_ids:
+            # Resolve names not yet denormalized with a single auth service call
+            usernames = get_usernames(missing_ids, token)
+        return self.serialize_room_data(room, room_members, usernames), self.names_resolved(missing_ids, usernames)
+
+    @staticmethod
+    def names_resolved(missing_ids, usernames):
+        """False if the auth service left any of `missing_ids` without a name."""
+        return all(usernames.get(str(user_id)) for user_id in missing_ids)
+
+    @staticmethod
+    def missing_user_ids(room, room_members):
+        """Owner and members whose username has not been denormalized yet."""
+        missing_ids = [member.user_id for member in room_members if not member.username]
+        if room.owner_id and not room.owner_username:
+            missing_ids.append(room.owner_id)
+        return missing_ids
+
+    @staticmethod
+    def serialize_room_data(room, room_members, usernames):
+        owner_id = room.owner_id
+        owner_username = (room.owner_username or usernames.get(str(owner_id))) if owner_id else 'Unknown'
+
+        # Get all members
+        members = []
+        for member in room_members:
+            username = member.username or usernames.get(str(member.user_id))
+            members.append({
+                'user_id': str(member.user_id),
+                'username': username,
+                'role': member.role,
+                'payment_status': member.payment_status,
+                'joined_at': member.join_date
+            })
+
+        return {
+            'id': str(room.room_id),
+            'name': room.name,
+            'service': room.service_type,
+            'description': room.description,
+            'cost': str(room.cost),
+            'due_date': room.due_date,
+            'created_at': room.created_at,
+            'owner_username': owner_username,
+            'members': members,
+            'member_count': len(members)
+        }
+
 
 class LeaveRoomView(APIView):
     """
@@ -180,7 +314,9 @@ class LeaveRoomView(APIView):
                 )
             
             # Remove the member from the room
+            invalidate_room_cache_on_commit(room_id)
             room_member.delete()
+            adjust_member_count(room_id, -1)
             
             return Response(
                 {'message': 'Successfully left the room'},
@@ -222,6 +358,7 @@ class DeleteRoomView(APIView):
                 )
             
             # Delete the room (CASCADE will remove all members)
+            invalidate_room_cache_on_commit(room_id)
             room.delete()
             
             return Response(
@@ -285,7 +422,9 @@ class RemoveMemberView(APIView):
                 )
             
             # Remove the member
+            invalidate_room_cache_on_commit(room_id)
             member_to_remove.delete()
+            adjust_member_count(room_id, -1)
             
             return Response(
                 {'message': 'Member removed successfully'},
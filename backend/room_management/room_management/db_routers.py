@@ -0,0 +1,105 @@
+"""
+Routing of read-only view queries to the read replica.
+
+Reads go to the 'replica' alias only inside `use_replica()`, which the room
+list and detail views enter through ReadReplicaMixin. Everything else,
+including reads inside a transaction on the primary, stays on 'default'.
+
+The replica can lag a write, so a user who just joined a room could be
+refused as a non-member, or a detail read could cache the room as it was
+before the write. To prevent that, cache invalidation pins the rooms and
+users a write touched to the primary for DB_REPLICA_PIN_SECONDS
+(pin_to_primary), and the views check is_pinned_to_primary before using
+the replica. If Redis cannot say, reads go to the primary.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterable
+
+import redis
+from django.conf import settings
+from django.db import connections
+
+from .redis_client import redis_client
+
+REPLICA_ALIAS = 'replica'
+PRIMARY_PIN_PREFIX = 'primary_pin:'
+
+_use_replica: ContextVar[bool] = ContextVar('use_replica', default=False)
+
+
+@contextmanager
+def use_replica():
+    """Send ORM reads made in this context to the read replica, if one is configured."""
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def replica_configured() -> bool:
+    return REPLICA_ALIAS in settings.DATABASES
+
+def _pin_keys(room_ids: Iterable = (), user_ids: Iterable = ()) -> list:
+    return (
+        [f"{PRIMARY_PIN_PREFIX}room:{room_id}" for room_id in room_ids if room_id]
+        + [f"{PRIMARY_PIN_PREFIX}user:{user_id}" for user_id in user_ids if user_id]
+    )
+
+def pin_to_primary(pipe, room_ids: Iterable = (), user_ids: Iterable = ()) -> None:
+    """Queue on `pipe` the commands keeping these rooms' and users' reads on the primary."""
+    if not replica_configured():
+        return
+    for key in _pin_keys(room_ids, user_ids):
+        pipe.set(key, 1, ex=settings.DB_REPLICA_PIN_SECONDS)
+
+def is_pinned_to_primary(room_id=None, user_id=None) -> bool:
+    """Whether a recent write touched this room or user, so the replica may not have it yet."""
+    keys = _pin_keys([room_id], [user_id])
+    if not keys or not replica_configured():
+        return False
+    try:
+        return bool(redis_client.exists(*keys))
+    except redis.exceptions.RedisError:
+        # The primary is never behind
+        return True
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (
+            _use_replica.get()
+            and REPLICA_ALIAS in settings.DATABASES
+            and not connections['default'].in_atomic_block
+        ):
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
+
+
+class ReadReplicaMixin:
+    """
+    Serve a read-only API view's queries from the read replica, unless the
+    user or the `room_id` in the URL was written to within the pin window.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with use_replica():
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if is_pinned_to_primary(room_id=kwargs.get('room_id'), user_id=getattr(request.user, 'id', None)):
+            # Reset when dispatch leaves use_replica()
+            _use_replica.set(False)
@@ -0,0 +1,132 @@
+"""
+Shared Redis access layer for the room and payments apps.
+
+Every Redis command in room_management goes through the single client
+built here, backed by one bounded connection pool per process, so the
+number of connections each gunicorn worker opens is predictable. The
+client also records per-command latency metrics.
+"""
+
+import time
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Dict, Any
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CommandMetrics:
+    """Thread-safe per-command call counts, error counts and latencies."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, command: str, elapsed: float, failed: bool = False) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(
+                command,
+                {'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            )
+            elapsed_ms = elapsed * 1000
+            stats['calls'] += 1
+            stats['errors'] += int(failed)
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+        if elapsed_ms >= settings.REDIS_SLOW_COMMAND_MS:
+            logger.warning(f"Slow Redis command {command}: {elapsed_ms:.1f}ms")
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return a copy of the metrics with the average latency filled in."""
+        with self._lock:
+            return {
+                command: {**stats, 'avg_ms': stats['total_ms'] / stats['calls']}
+                for command, stats in self._stats.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+command_metrics = CommandMetrics()
+
+
+class InstrumentedRedis(redis.StrictRedis):
+    """Redis client that times every command it executes."""
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            result = super().execute_command(*args, **options)
+        except redis.exceptions.RedisError:
+            command_metrics.record(str(args[0]).upper(), time.perf_counter() - start, failed=True)
+            raise
+        command_metrics.record(str(args[0]).upper(), time.perf_counter() - start)
+        return result
+
+
+connection_pool = redis.BlockingConnectionPool(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    db=settings.REDIS_DB,
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+    timeout=settings.REDIS_POOL_TIMEOUT,
+    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+    health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+    decode_responses=True,
+    encoding='utf-8'
+)
+
+redis_client = InstrumentedRedis(connection_pool=connection_pool)
+
+
+def get_redis_client() -> InstrumentedRedis:
+    """Return the process-wide Redis client."""
+    return redis_client
+
+def create_blocking_client(block_seconds: float) -> redis.StrictRedis:
+    """
+    Return a client with its own connection for a worker's blocking reads
+    (XREADGROUP ... BLOCK). The shared pool's socket timeout is shorter
+    than a block, so an idle read through it would time out instead of
+    waiting. Not instrumented: every blocked read would count as slow.
+    """
+    return redis.StrictRedis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
+        socket_timeout=block_seconds + settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+        decode_responses=True,
+        encoding='utf-8'
+    )
+
+@contextmanager
+def pipelined(transaction: bool = False):
+    """
+    Queue commands on a pipeline and send them in one round trip on exit.
+
+    Usage:
+        with pipelined() as pipe:
+            pipe.get('a')
+            pipe.incr('b')
+        results = pipe.results
+    """
+    pipe = redis_client.pipeline(transaction=transaction)
+    yield pipe
+    start = time.perf_counter()
+    try:
+        pipe.results = pipe.execute()
+    except redis.exceptions.RedisError:
+        command_metrics.record('PIPELINE', time.perf_counter() - start, failed=True)
+        raise
+    finally:
+        pipe.reset()
+    command_metrics.record('PIPELINE', time.perf_counter() - start)
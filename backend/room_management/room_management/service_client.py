@@ -0,0 +1,165 @@
+"""
+Shared HTTP client for calls from room_management to other services.
+
+Each ServiceClient keeps a pooled keep-alive requests.Session for its host.
+It applies connect and read timeouts to every call and retries transient
+failures a bounded number of times with jittered exponential backoff. A
+circuit breaker fails fast while the remote service is down, so a slow
+dependency cannot tie up every worker thread.
+"""
+
+import random
+import threading
+import time
+import logging
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling a service whose circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures. Once `reset_timeout`
+    seconds have passed a single trial call is let through (half-open); its
+    outcome closes the circuit again or restarts the timeout. Every call
+    allow() lets through must end in record_success, record_failure or
+    record_abandoned, or a half-open circuit would wait for its trial forever.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_in_flight or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"Circuit for {self.name} closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_abandoned(self) -> None:
+        """End a call that gave no verdict on the service, e.g. a cancelled one."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Circuit for {self.name} opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+
+
+class ServiceClient:
+    """Pooled, retrying, circuit-broken HTTP client for one service."""
+
+    RETRY_STATUSES = {502, 503, 504}
+
+    def __init__(self, name: str, base_url: str, connect_timeout: float, read_timeout: float,
+                 max_retries: int, backoff: float, pool_size: int,
+                 failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method: str, path: str, retry: Optional[bool] = None, **kwargs) -> requests.Response:
+        """
+        Send a request to the service.
+
+        Args:
+            method: HTTP method
+            path: Path relative to the service's base URL
+            retry: Whether transient failures may be retried; defaults to
+                True for GET and False otherwise, since retrying is only safe
+                for idempotent calls
+            **kwargs: Passed on to requests
+
+        Raises:
+            CircuitOpenError: If the service's circuit is open
+            requests.exceptions.RequestException: If the last attempt failed
+        """
+        if retry is None:
+            retry = method.upper() == 'GET'
+        attempts = 1 + (self.max_retries if retry else 0)
+        kwargs.setdefault('timeout', self.timeout)
+        url = f"{self.base_url}{path}"
+
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"Circuit for {self.name} is open")
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.breaker.record_failure()
+                if attempt == attempts - 1:
+                    raise
+                logger.warning(f"{self.name} {method} {path} failed ({e}), retrying")
+            except Exception:
+                # Not retried, but still an outcome for the breaker
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                self.breaker.record_abandoned()
+                raise
+            else:
+                if response.status_code not in self.RETRY_STATUSES:
+                    self.breaker.record_success()
+                    return response
+                self.breaker.record_failure()
+                if attempt == attempts - 1:
+                    return response
+                logger.warning(f"{self.name} {method} {path} returned {response.status_code}, retrying")
+            # Full jitter keeps retries from many workers from synchronising
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request('POST', path, **kwargs)
+
+
+auth_service = ServiceClient(
+    name='auth_services',
+    base_url=settings.AUTH_SERVICE_URL,
+    connect_timeout=settings.AUTH_SERVICE_CONNECT_TIMEOUT,
+    read_timeout=settings.AUTH_SERVICE_READ_TIMEOUT,
+    max_retries=settings.AUTH_SERVICE_MAX_RETRIES,
+    backoff=settings.AUTH_SERVICE_RETRY_BACKOFF,
+    pool_size=settings.AUTH_SERVICE_POOL_SIZE,
+    failure_threshold=settings.AUTH_SERVICE_FAILURE_THRESHOLD,
+    reset_timeout=settings.AUTH_SERVICE_RESET_TIMEOUT
+)
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 from supertokens_python import init
 from room_management.config import app_info, recipe_list, supertokens_config
+from room_management.database import database_settings
 from corsheaders.defaults import default_headers
 from supertokens_python import get_all_cors_headers
 from typing import List
@@ -90,12 +91,15 @@ WSGI_APPLICATION = 'room_management.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# Configured from DB_* environment variables, see room_management/database.py
+DATABASES = database_settings(BASE_DIR, default_name='room_management')
+
+# Sends the room list and detail views' reads to the 'replica' alias when
+# DB_REPLICA_HOST is set
+DATABASE_ROUTERS = ['room_management.db_routers.ReadReplicaRouter']
+# After a write, reads of the rooms and users it touched stay on the primary
+# for this many seconds; keep it above the replica's usual lag
+DB_REPLICA_PIN_SECONDS = int(os.getenv("DB_REPLICA_PIN_SECONDS", "5"))
 
 
 # Password validation
@@ -172,9 +176,100 @@ MPESA_SHORTCODE = "174379"  # Or your registered shortcode
 MPESA_PASSKEY = os.getenv("MPESA_PASSKEY")
 MPESA_CALLBACK_URL = os.getenv("MPESA_CALLBACK_URL").strip()
 
+# Daraja API host (payments/daraja.py); point it at a stub in tests. The
+# cached OAuth token is renewed MPESA_TOKEN_REFRESH_MARGIN seconds early.
+MPESA_BASE_URL = os.getenv("MPESA_BASE_URL", "https://sandbox.safaricom.co.ke")
+MPESA_TOKEN_REFRESH_MARGIN = int(os.getenv("MPESA_TOKEN_REFRESH_MARGIN", "60"))
+MPESA_CONNECT_TIMEOUT = float(os.getenv("MPESA_CONNECT_TIMEOUT", "3"))
+MPESA_READ_TIMEOUT = float(os.getenv("MPESA_READ_TIMEOUT", "15"))
+MPESA_POOL_SIZE = int(os.getenv("MPESA_POOL_SIZE", "20"))
+
+# Bulk billing (payments/billing.py): concurrent STK pushes and the overall
+# pushes per second allowed across them
+MPESA_BULK_MAX_WORKERS = int(os.getenv("MPESA_BULK_MAX_WORKERS", "10"))
+MPESA_BULK_RATE = float(os.getenv("MPESA_BULK_RATE", "5"))
+# Members pushed to within this many seconds are not pushed to again
+MPESA_CHARGE_COOLDOWN = int(os.getenv("MPESA_CHARGE_COOLDOWN", "300"))
+
+# The callback endpoint only queues callbacks on this Redis stream (or the
+# CallbackOutbox table while Redis is down); process_mpesa_callbacks applies
+# them in batches of MPESA_CALLBACK_BATCH_SIZE
+MPESA_CALLBACK_STREAM = os.getenv("MPESA_CALLBACK_STREAM", "mpesa:callbacks")
+MPESA_CALLBACK_GROUP = os.getenv("MPESA_CALLBACK_GROUP", "payments")
+MPESA_CALLBACK_BATCH_SIZE = int(os.getenv("MPESA_CALLBACK_BATCH_SIZE", "200"))
+# A callback can beat its STK push's payment intent to the database; it is
+# retried after MPESA_CALLBACK_RETRY_DELAY seconds times the attempts so far,
+# up to MPESA_CALLBACK_MAX_ATTEMPTS attempts (about 20 minutes)
+MPESA_CALLBACK_RETRY_DELAY = float(os.getenv("MPESA_CALLBACK_RETRY_DELAY", "30"))
+MPESA_CALLBACK_MAX_ATTEMPTS = int(os.getenv("MPESA_CALLBACK_MAX_ATTEMPTS", "10"))
+
+#AUTH SERVICE
+# Calls to auth_services go through room_management/service_client.py with
+# these timeouts (seconds), retries and circuit breaker thresholds
+AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://localhost:8000")
+AUTH_SERVICE_CONNECT_TIMEOUT = float(os.getenv("AUTH_SERVICE_CONNECT_TIMEOUT", "1"))
+AUTH_SERVICE_READ_TIMEOUT = float(os.getenv("AUTH_SERVICE_READ_TIMEOUT", "3"))
+AUTH_SERVICE_MAX_RETRIES = int(os.getenv("AUTH_SERVICE_MAX_RETRIES", "2"))
+AUTH_SERVICE_RETRY_BACKOFF = float(os.getenv("AUTH_SERVICE_RETRY_BACKOFF", "0.1"))
+AUTH_SERVICE_POOL_SIZE = int(os.getenv("AUTH_SERVICE_POOL_SIZE", "20"))
+AUTH_SERVICE_FAILURE_THRESHOLD = int(os.getenv("AUTH_SERVICE_FAILURE_THRESHOLD", "5"))
+AUTH_SERVICE_RESET_TIMEOUT = float(os.getenv("AUTH_SERVICE_RESET_TIMEOUT", "30"))
+
+#JWT VERIFICATION
+# 'remote' asks the auth service to verify every uncached token, 'local'
+# checks the HS256 signature and expiry in-process with the shared key and
+# only consults the auth service for its revocation list.
+JWT_VERIFICATION_MODE = os.getenv("JWT_VERIFICATION_MODE", "remote")
+JWT_SIGNING_KEY = os.getenv("JWT_SIGNING_KEY", SECRET_KEY)
+JWT_REVOCATION_REFRESH_INTERVAL = int(os.getenv("JWT_REVOCATION_REFRESH_INTERVAL", "30"))
+# Local verification refuses tokens once the list is older than this, and a
+# request waits at most JWT_REVOCATION_WAIT seconds for the first load
+JWT_REVOCATION_MAX_AGE = int(os.getenv("JWT_REVOCATION_MAX_AGE", "120"))
+JWT_REVOCATION_WAIT = float(os.getenv("JWT_REVOCATION_WAIT", "2"))
+
+# Connection limit of the pooled async HTTP client used by the async views
+ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv("ASYNC_HTTP_MAX_CONNECTIONS", "100"))
+
 #REDIS SETTINGS
 REDIS_HOST = 'localhost'
 REDIS_PORT = 6379
 REDIS_DB = 0
 
+# Shared connection pool (see room_management/redis_client.py). Each worker
+# process opens at most REDIS_MAX_CONNECTIONS connections and waits up to
+# REDIS_POOL_TIMEOUT seconds for a free one.
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "20"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "2"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5"))
+REDIS_SOCKET_CONNECT_TIMEOUT = float(os.getenv("REDIS_SOCKET_CONNECT_TIMEOUT", "0.5"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+REDIS_SLOW_COMMAND_MS = float(os.getenv("REDIS_SLOW_COMMAND_MS", "50"))
+
+# Circuit breaker for Redis: consecutive failures before Redis is skipped,
+# and the backoff bounds (seconds) of the background probe
+REDIS_FAILURE_THRESHOLD = int(os.getenv("REDIS_FAILURE_THRESHOLD", "3"))
+REDIS_PROBE_INITIAL_BACKOFF = float(os.getenv("REDIS_PROBE_INITIAL_BACKOFF", "1"))
+REDIS_PROBE_MAX_BACKOFF = float(os.getenv("REDIS_PROBE_MAX_BACKOFF", "30"))
+
+# In-process tier of the authentication cache, in front of Redis
+AUTH_LOCAL_CACHE_SIZE = int(os.getenv("AUTH_LOCAL_CACHE_SIZE", "10000"))
+AUTH_LOCAL_CACHE_TTL = int(os.getenv("AUTH_LOCAL_CACHE_TTL", "60"))
+
+# Room detail payloads are invalidated on change; the TTL only bounds staleness
+ROOM_DETAIL_CACHE_TTL = int(os.getenv("ROOM_DETAIL_CACHE_TTL", "300"))
+
+
+
+# User directory (room/user_directory.py): size and TTL of the in-process
+# tier in front of the shared Redis hash of usernames
+USER_DIRECTORY_LOCAL_SIZE = int(os.getenv("USER_DIRECTORY_LOCAL_SIZE", "50000"))
+USER_DIRECTORY_LOCAL_TTL = int(os.getenv("USER_DIRECTORY_LOCAL_TTL", "600"))
+
+# Stream auth_services publishes user events to, and the consumer group
+# room_management reads it with (see the consume_user_events command)
+USER_EVENTS_STREAM = os.getenv("USER_EVENTS_STREAM", "auth:user_events")
+USER_EVENTS_GROUP = os.getenv("USER_EVENTS_GROUP", "room_management")
 
+# Shared secret for service-to-service endpoints of auth_services that are
+# called without a user token
+INTERNAL_SERVICE_KEY = os.getenv("INTERNAL_SERVICE_KEY", "")
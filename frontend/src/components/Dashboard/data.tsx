@@ -22,12 +22,23 @@ export const useRooms = () => {
     const fetchRooms = async () => {
         try {
             const token = localStorage.getItem('token');
-            const response = await axios.get('http://localhost:8080/room/list/', {
-                headers: {
-                    'Authorization': `Bearer ${token}`
-                }
-            });
-            setRooms(response.data.rooms);
+            // The list is paged; follow next_cursor until every room is loaded
+            const allRooms: Room[] = [];
+            let cursor: string | null = null;
+            do {
+                const response: { data: { rooms: Room[]; next_cursor: string | null } } = await axios.get(
+                    'http://localhost:8080/room/list/',
+                    {
+                        headers: {
+                            'Authorization': `Bearer ${token}`
+                        },
+                        params: cursor ? { cursor } : {}
+                    }
+                );
+                allRooms.push(...response.data.rooms);
+                cursor = response.data.next_cursor;
+            } while (cursor);
+            setRooms(allRooms);
             setLoading(false);
         } catch (error) {
             if (axios.isAxiosError(error)) {
@@ -28,11 +28,22 @@ export interface MpesaPaymentResponse {
 }
 
 class PaymentService {
-  // Get all transactions
+  // Follow the `next` links until every page of transactions is loaded
+  private async fetchAllTransactions(): Promise<Transaction[]> {
+    const transactions: Transaction[] = [];
+    let url: string | null = `${API_BASE_URL}/payments/transactions/`;
+    while (url) {
+      const response: { data: { results: Transaction[]; next: string | null } } = await axios.get(url);
+      transactions.push(...response.data.results);
+      url = response.data.next;
+    }
+    return transactions;
+  }
+
+  // Get all transactions, newest first
   async getTransactions(): Promise<Transaction[]> {
     try {
-      const response = await axios.get(`${API_BASE_URL}/payments/transactions/`);
-      return response.data;
+      return await this.fetchAllTransactions();
     } catch (error) {
       console.error('Error fetching transactions:', error);
       throw error;
@@ -63,8 +74,7 @@ class PaymentService {
   // Get user transactions (could be filtered by user ID if needed)
   async getUserTransactions(): Promise<Transaction[]> {
     try {
-      const response = await axios.get(`${API_BASE_URL}/payments/transactions/`);
-      const transactions = response.data;
+      const transactions = await this.fetchAllTransactions();
       
       // If we need to filter by user, we'd need to add user info to transactions
       // For now, return all transactions